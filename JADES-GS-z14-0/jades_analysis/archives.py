@@ -0,0 +1,118 @@
+"""
+FITS products read straight from tar and zip bundles.
+
+Archive downloads come as .tar / .tar.gz / .tgz / .tar.bz2 / .zip bundles.
+Left in the data folder, a bundle is listed like a subfolder: each FITS
+member appears as 'bundle.tar/member_x1d.fits', so the scripts, the header
+index, the caches and the x1d/s2d dispatch treat it like any other file.
+When a member is analyzed it is read into memory and handed to fits.open as
+a BytesIO (compressed members are decompressed the same way); nothing is
+extracted to disk.
+
+Every process keeps the bundles it reads open together with their member
+index, so zip files and plain tars are read with one seek per member and a
+pool of workers can read different members of one bundle at the same time.
+Stream-compressed tars are decompressed forward: they are read fastest in
+member order, which is the listing order when the bundle was made from a
+sorted listing.
+"""
+import io
+import os
+import tarfile
+import threading
+import zipfile
+
+from prefetch import DECOMPRESSORS, is_fits
+
+# File name endings recognized as bundles
+ARCHIVE_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.zip')
+
+# Open bundles of this process: (pid, absolute path) -> _Bundle
+_bundles = {}
+_bundles_lock = threading.Lock()
+
+
+def is_archive(name):
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def split_member(path):
+    """(bundle path, member name) of a path inside a bundle, or (path, None) for a plain file."""
+    parts = path.replace(os.sep, '/').split('/')
+    for i in range(len(parts) - 1):
+        if is_archive(parts[i]):
+            archive = '/'.join(parts[:i + 1])
+            if os.path.isfile(archive):
+                return archive, '/'.join(parts[i + 1:])
+    return path, None
+
+
+class _Bundle:
+    """An open tar or zip file and its member index (the lock serializes the read-ahead threads)."""
+
+    def __init__(self, path):
+        stat = os.stat(path)
+        self.identity = (stat.st_size, stat.st_mtime_ns)
+        self.lock = threading.Lock()
+        if path.lower().endswith('.zip'):
+            self.archive = zipfile.ZipFile(path)
+            self.members = {info.filename: info for info in self.archive.infolist() if not info.is_dir()}
+        else:
+            self.archive = tarfile.open(path)
+            self.members = {info.name: info for info in self.archive.getmembers() if info.isfile()}
+
+    def read(self, member):
+        with self.lock:
+            if isinstance(self.archive, zipfile.ZipFile):
+                return self.archive.read(self.members[member])
+            with self.archive.extractfile(self.members[member]) as f:
+                return f.read()
+
+    def close(self):
+        self.archive.close()
+
+
+def _bundle(path):
+    """The open _Bundle of `path` in this process, reopened when the file changed."""
+    key = (os.getpid(), os.path.abspath(path))
+    stat = os.stat(path)
+    with _bundles_lock:
+        bundle = _bundles.get(key)
+        if bundle is None or bundle.identity != (stat.st_size, stat.st_mtime_ns):
+            if bundle is not None:
+                bundle.close()
+            # Bundles opened before a fork belong to the parent process
+            bundle = _bundles[key] = _Bundle(path)
+        return bundle
+
+
+def list_members(path):
+    """Names of the FITS members of the bundle `path`, in archive order."""
+    return [name for name in _bundle(path).members if is_fits(name)]
+
+
+def read_member(path):
+    """Contents of the member at `path` ('bundle.zip/member.fits[.gz]'), decompressed, as a BytesIO."""
+    archive, member = split_member(path)
+    data = io.BytesIO(_bundle(archive).read(member))
+    extension = os.path.splitext(member.lower())[1]
+    if extension in DECOMPRESSORS:
+        with DECOMPRESSORS[extension](data, 'rb') as f:
+            return io.BytesIO(f.read())
+    return data
+
+
+def listing_name(path):
+    """Name of `path` in its folder listing: the base name, or 'bundle.tar/member.fits' for a member."""
+    archive, member = split_member(path)
+    return os.path.basename(path) if member is None else f"{os.path.basename(archive)}/{member}"
+
+
+def fits_source(path):
+    """What to pass to fits.open for `path`: the path itself, or the member's contents for a bundle member."""
+    return read_member(path) if split_member(path)[1] is not None else path
+
+
+def file_stat(path):
+    """os.stat of `path`, or of its bundle for a member (a changed bundle changes all its members)."""
+    return os.stat(split_member(path)[0])
@@ -0,0 +1,102 @@
+"""
+Benchmark: throughput and noise of the s2d extractions.
+
+Writes a synthetic s2d file (Gaussian trace, Gaussian noise with a matching
+ERR image, optional cosmic rays), then extracts it with the middle-row
+extraction and with the optimal extraction of extraction.py and reports
+columns per second, MB of image data per second and the rms error of each
+extracted spectrum against the input spectrum.
+
+Run from the jades_analysis folder:
+    python benchmarks/bench_optimal_extraction.py --rows 64 --columns 200000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_s2d(path, rows, columns, noise=0.05, cosmic_rays=0.001, seed=0):
+    """Write a synthetic s2d file and return the true 1D spectrum."""
+    from astropy.io import fits
+
+    rng = np.random.default_rng(seed)
+    wavelength = np.linspace(0.6, 5.3, columns)
+    spectrum = 1 + 0.5 * np.sin(3 * wavelength)
+    profile = np.exp(-0.5 * ((np.arange(rows) - rows / 2 + 0.3) / 2.0) ** 2)
+    profile /= profile.sum()
+
+    sci = (profile[:, None] * spectrum[None, :] + rng.normal(0, noise, (rows, columns))).astype('f4')
+    hits = rng.random((rows, columns)) < cosmic_rays
+    sci[hits] += 50
+    hdul = fits.HDUList([
+        fits.PrimaryHDU(),
+        fits.ImageHDU(sci, name='SCI'),
+        fits.ImageHDU(np.full((rows, columns), noise, dtype='f4'), name='ERR'),
+        fits.ImageHDU(np.broadcast_to(wavelength.astype('f4'), (rows, columns)).copy(), name='WAVELENGTH'),
+    ])
+    hdul.writeto(path, overwrite=True)
+    return spectrum, profile
+
+
+def run(path, spectrum, profile, block_columns):
+    from astropy.io import fits
+    from extraction import extract_s2d_optimal
+    from ingest import read_s2d_rows
+
+    results = []
+    with fits.open(path, memmap=True) as hdul:
+        rows, columns = hdul[1].header['NAXIS2'], hdul[1].header['NAXIS1']
+        image_mb = 3 * rows * columns * 4 / 2**20
+
+        start = time.perf_counter()
+        middle = rows // 2
+        sci_rows, _ = read_s2d_rows(hdul, middle, middle + 1)
+        # Scale the row by its profile weight so both are in total-flux units
+        flux = np.asarray(sci_rows[0], dtype=float) / profile[middle]
+        elapsed = time.perf_counter() - start
+        results.append({'method': 'row', 'seconds': elapsed, 'columns_per_s': columns / elapsed,
+                        'image_mb_per_s': image_mb / elapsed, 'rms_error': float(np.std(flux - spectrum))})
+
+        start = time.perf_counter()
+        _, flux, _ = extract_s2d_optimal(hdul, block_columns=block_columns)
+        elapsed = time.perf_counter() - start
+        results.append({'method': 'optimal', 'seconds': elapsed, 'columns_per_s': columns / elapsed,
+                        'image_mb_per_s': image_mb / elapsed,
+                        'rms_error': float(np.nanstd(flux - spectrum))})
+    return image_mb, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=64, help='Spatial size of the synthetic s2d images')
+    parser.add_argument('--columns', type=int, default=200000, help='Spectral size of the synthetic s2d images')
+    parser.add_argument('--block-columns', type=int, default=4096, help='Columns per optimal extraction block')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench_optimal_s2d.fits')
+        spectrum, profile = make_s2d(path, args.rows, args.columns)
+        image_mb, results = run(path, spectrum, profile, args.block_columns)
+
+    if args.json:
+        print(json.dumps({'rows': args.rows, 'columns': args.columns, 'image_mb': image_mb,
+                          'results': results}, indent=2))
+        return
+
+    print(f"Image: {args.rows} x {args.columns} ({image_mb:.0f} MB of SCI/ERR/WAVELENGTH)")
+    print(f"{'method':<8} {'seconds':>8} {'columns/s':>12} {'MB/s':>8} {'rms error':>10}")
+    for r in results:
+        print(f"{r['method']:<8} {r['seconds']:>8.3f} {r['columns_per_s']:>12,.0f} "
+              f"{r['image_mb_per_s']:>8.1f} {r['rms_error']:>10.4f}")
+
+
+if __name__ == '__main__':
+    main()
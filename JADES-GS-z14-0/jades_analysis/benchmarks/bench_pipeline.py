@@ -0,0 +1,198 @@
+"""
+Benchmark: every stage of the analysis on synthetic datasets.
+
+Generates (or reuses) synthetic x1d/s2d datasets of each requested size with
+benchmarks/synthetic.py and times the stages separately:
+
+    discovery    find_fits_files
+    open         fits.open + header access + close of every file
+    extraction   ingest with the peak z (open, extract, clean; no cache)
+    z_estimate   batched template fit of redshift.py
+    cosmology    time_delay_model on all redshifts
+    csv          writing jades_results_table.csv
+    chart:<name> each summary chart of charts.py, and the spectra overlay
+
+Results are printed as a table or written as JSON (--output) with the
+environment, so runs can be compared; --compare flags stages that got
+slower than a previous JSON result by more than --tolerance.
+
+Run from the jades_analysis folder:
+    python benchmarks/bench_pipeline.py --files 10,1000 --output bench.json
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _timed(results, stage, n_items, function, *args, **kwargs):
+    start = time.perf_counter()
+    value = function(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    results.append({'stage': stage, 'seconds': elapsed, 'items': n_items,
+                    'items_per_s': n_items / elapsed if elapsed > 0 else float('inf')})
+    return value
+
+
+def _open_all(folder, files):
+    from astropy.io import fits
+
+    for file in files:
+        with fits.open(os.path.join(folder, file), memmap=True) as hdul:
+            hdul[0].header.get('DETECTOR')
+            hdul[1].header.get('NAXIS')
+
+
+def _write_csv(rows, path):
+    rows.to_frame().to_csv(path, index=False)
+
+
+def _overlay(spectra, path):
+    import matplotlib.pyplot as plt
+    from plotting import spectra_overlay_figure
+
+    fig = spectra_overlay_figure(spectra, 'JADES-GS-z14-0 Spectra Analysis')
+    fig.savefig(path, dpi=300, bbox_inches='tight')
+    plt.close(fig)
+
+
+def run(folder, workers=1, charts=True):
+    """Time every stage on the dataset in `folder`; returns (stage results, accuracy summary)."""
+    from charts import render_chart, summary_chart_jobs, use_headless_backend
+    from cosmology_tables import get_tables, time_delay_model
+    from ingest import find_fits_files, ingest
+    from redshift import estimate_redshifts
+    from results import Results
+    from synthetic import MANIFEST
+
+    # Import the plotting and table libraries up front so their import time is not charted
+    use_headless_backend()
+    for module in ('matplotlib.pyplot', 'pandas'):
+        importlib.import_module(module)
+
+    results = []
+    files = _timed(results, 'discovery', 0, find_fits_files, folder)
+    results[-1]['items'] = len(files)
+    _timed(results, 'open', len(files), _open_all, folder, files)
+    records = _timed(results, 'extraction', len(files), ingest, folder, files, workers=workers,
+                     z_method='peak')
+    analyzed = [r for r in records if not r['message']]
+    _timed(results, 'z_estimate', len(analyzed), estimate_redshifts, analyzed)
+
+    tables = get_tables()
+    z = [r['z_observed'] for r in analyzed]
+    model = _timed(results, 'cosmology', len(z), time_delay_model, z, tables=tables)
+    rows = Results.from_columns([r['File'] for r in analyzed], model)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _timed(results, 'csv', len(rows), _write_csv, rows, os.path.join(tmp, 'jades_results_table.csv'))
+        if charts and rows:
+            for path, draw, kwargs in summary_chart_jobs(rows, analyzed[0], folder=tmp):
+                name = os.path.splitext(os.path.basename(path))[0]
+                _timed(results, f"chart:{name}", len(rows), render_chart, path, draw, kwargs)
+            spectra = [(r['File'], r['z_observed'], r['wavelength'], r['flux']) for r in analyzed]
+            _timed(results, 'chart:jades_spectra_plot', len(spectra), _overlay, spectra,
+                   os.path.join(tmp, 'jades_spectra_plot.png'))
+
+    # Accuracy of the z estimate against the injected redshifts, in units of 1 + z
+    with open(os.path.join(folder, MANIFEST), encoding='utf-8') as f:
+        truth = json.load(f)['truth']
+    z_true = np.array([truth[r['File']] for r in analyzed])
+    error = (np.array(z) - z_true) / (1 + z_true)
+    accuracy = {'analyzed': len(analyzed), 'skipped': len(records) - len(analyzed),
+                'z_within_1pct': float(np.mean(np.abs(error) < 0.01)) if len(error) else float('nan'),
+                'z_median_bias': float(np.median(error)) if len(error) else float('nan')}
+    return results, accuracy
+
+
+def environment():
+    import astropy
+    import matplotlib
+
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'astropy': astropy.__version__,
+            'matplotlib': matplotlib.__version__, 'platform': platform.platform(),
+            'cpu_count': os.cpu_count()}
+
+
+def compare(current, baseline, tolerance):
+    """(size, stage, old seconds, new seconds) of stages slower than the baseline by more than `tolerance`."""
+    previous = {(run['files'], s['stage']): s['seconds'] for run in baseline['runs'] for s in run['stages']}
+    slower = []
+    for run in current['runs']:
+        for s in run['stages']:
+            old = previous.get((run['files'], s['stage']))
+            if old is not None and s['seconds'] > old * (1 + tolerance):
+                slower.append((run['files'], s['stage'], old, s['seconds']))
+    return slower
+
+
+def main():
+    from ingest import resolve_workers
+    from synthetic import make_dataset
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', default='10,100,1000',
+                        help='Comma-separated dataset sizes (number of FITS files), e.g. 10,1000,100000')
+    parser.add_argument('--pixels', type=int, default=3000, help='Spectral pixels per product')
+    parser.add_argument('--rows', type=int, default=32, help='Spatial rows of the s2d images')
+    parser.add_argument('--s2d-fraction', type=float, default=0.1, help='Fraction of s2d products')
+    parser.add_argument('--data-dir', default=os.path.join('cache', 'bench'),
+                        help='Where the synthetic datasets are generated (and reused)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes for extraction (0 = all cores)')
+    parser.add_argument('--no-charts', action='store_true', help='Skip the chart stages')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    parser.add_argument('--compare', help='Previous JSON result to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative slowdown reported as a regression by --compare')
+    args = parser.parse_args()
+
+    report = {'environment': environment(),
+              'params': {'pixels': args.pixels, 'rows': args.rows, 's2d_fraction': args.s2d_fraction,
+                         'workers': args.workers},
+              'runs': []}
+    for n_files in [int(n) for n in args.files.split(',')]:
+        folder = os.path.join(args.data_dir, f"{n_files}_{args.pixels}_{args.rows}_{args.s2d_fraction}")
+        start = time.perf_counter()
+        make_dataset(folder, n_files, args.pixels, args.rows, args.s2d_fraction,
+                     workers=resolve_workers(0))
+        generation = time.perf_counter() - start
+        stages, accuracy = run(folder, resolve_workers(args.workers), charts=not args.no_charts)
+        report['runs'].append({'files': n_files, 'generation_seconds': generation, 'stages': stages,
+                               **accuracy})
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for r in report['runs']:
+            print(f"\n{r['files']} files ({r['analyzed']} analyzed, {r['skipped']} skipped; "
+                  f"|dz|/(1+z) < 1%: {r['z_within_1pct']:.1%}, median bias {r['z_median_bias']:+.4f})")
+            print(f"{'stage':<28} {'seconds':>9} {'items/s':>12}")
+            for s in r['stages']:
+                print(f"{s['stage']:<28} {s['seconds']:>9.3f} {s['items_per_s']:>12,.0f}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        slower = compare(report, baseline, args.tolerance)
+        for n_files, stage, old, new in slower:
+            print(f"Regression: {stage} with {n_files} files took {new:.3f} s (was {old:.3f} s)")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark: bytes read and peak RSS when extracting one row from a large s2d file.
+
+Compares the original access pattern (load all of hdul[1].data and
+hdul[3].data, then slice the middle row) with the section reads used by
+ingest.process_file. Each mode runs in a fresh interpreter so the peak RSS
+of one mode does not leak into the next.
+
+Run from the jades_analysis folder:
+    python benchmarks/bench_s2d_io.py --rows 2048 --columns 8192
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ['full-read', 'full-memmap', 'section']
+
+
+def _io_counters():
+    """rchar/read_bytes from /proc/self/io (zeros where unavailable)."""
+    counters = {'rchar': 0, 'read_bytes': 0}
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                name, value = line.split(':')
+                if name in counters:
+                    counters[name] = int(value)
+    except OSError:
+        pass
+    return counters
+
+
+def _proc_status_mb(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _current_rss_mb():
+    rss = _proc_status_mb('VmRSS')
+    return rss if rss is not None else _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    # VmHWM is reset by exec; ru_maxrss can carry over the parent's peak on Linux
+    peak = _proc_status_mb('VmHWM')
+    if peak is not None:
+        return peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def make_s2d(path, rows, columns):
+    """Write a synthetic s2d file with SCI, ERR and WAVELENGTH images."""
+    import numpy as np
+    from astropy.io import fits
+
+    wavelength = np.linspace(0.6, 5.3, columns, dtype='f4')
+    hdul = fits.HDUList([fits.PrimaryHDU()])
+    for name in ('SCI', 'ERR', 'WAVELENGTH'):
+        if name == 'WAVELENGTH':
+            data = np.broadcast_to(wavelength, (rows, columns)).copy()
+        else:
+            data = np.random.default_rng(0).normal(1.0, 0.1, (rows, columns)).astype('f4')
+        hdul.append(fits.ImageHDU(data, name=name))
+    hdul.writeto(path, overwrite=True)
+
+
+def run_mode(mode, path):
+    """Extract the middle row of `path` using `mode` and return the measurements."""
+    import numpy as np
+    from astropy.io import fits
+    from ingest import process_file
+
+    baseline_rss = _current_rss_mb()
+    before = _io_counters()
+    start = time.perf_counter()
+
+    if mode == 'section':
+        record = process_file(path)
+        n_points = len(record['flux'])
+    else:
+        # Original code path: whole SCI and WAVELENGTH arrays, then one row
+        with fits.open(path, memmap=(mode == 'full-memmap')) as hdul:
+            sci_data = hdul[1].data
+            wavelength_data = hdul[3].data
+            middle_row = sci_data.shape[0] // 2
+            flux_1d = sci_data[middle_row, :]
+            wavelength_1d = wavelength_data[middle_row, :]
+            valid_mask = np.isfinite(wavelength_1d) & np.isfinite(flux_1d) & (flux_1d != 0)
+            n_points = int(valid_mask.sum())
+
+    elapsed = time.perf_counter() - start
+    after = _io_counters()
+    return {
+        'mode': mode,
+        'seconds': elapsed,
+        'bytes_read': after['rchar'] - before['rchar'],
+        'disk_bytes_read': after['read_bytes'] - before['read_bytes'],
+        'peak_rss_mb': _peak_rss_mb(),
+        'rss_growth_mb': _peak_rss_mb() - baseline_rss,
+        'n_points': n_points,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2048, help='Spatial size of the synthetic s2d images')
+    parser.add_argument('--columns', type=int, default=8192, help='Spectral size of the synthetic s2d images')
+    parser.add_argument('--file', help='Benchmark an existing s2d file instead of a synthetic one')
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    if args.mode:
+        # Child process: run one mode and report back
+        print(json.dumps(run_mode(args.mode, args.file)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.file
+        if path is None:
+            path = os.path.join(tmp, 'bench_s2d.fits')
+            make_s2d(path, args.rows, args.columns)
+
+        file_bytes = os.path.getsize(path)
+        results = []
+        for mode in MODES:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--mode', mode, '--file', path],
+                                    check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps({'file_bytes': file_bytes, 'results': results}, indent=2))
+        return
+
+    print(f"File size: {file_bytes:,} bytes")
+    print(f"{'mode':<12} {'seconds':>8} {'bytes read':>14} {'peak RSS MB':>12} {'RSS growth MB':>14}")
+    for r in results:
+        print(f"{r['mode']:<12} {r['seconds']:>8.3f} {r['bytes_read']:>14,} "
+              f"{r['peak_rss_mb']:>12.1f} {r['rss_growth_mb']:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
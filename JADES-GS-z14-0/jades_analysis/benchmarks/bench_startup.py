@@ -0,0 +1,96 @@
+"""
+Benchmark: cold-start time of the command line entry points.
+
+Each command runs in a fresh interpreter (python -X importtime) --repeat
+times; the median wall time is reported together with the time spent
+importing modules and which of the heavy libraries (matplotlib, pandas,
+astropy.cosmology, astropy.io.fits, scipy) were imported at all. Commands
+run in --data's parent folder so they see the usual data/ and cache/
+layout; run one analysis first so the cosmology tables are cached.
+
+Run from the jades_analysis folder:
+    python benchmarks/bench_startup.py --data data --output startup.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('matplotlib', 'pandas', 'astropy.cosmology', 'astropy.io.fits', 'scipy')
+
+# Name -> command line (script relative to the source folder, or -c code); {data} is --data
+COMMANDS = {
+    'import jades_z14_analysis': ['-c', 'import jades_z14_analysis'],
+    'cli list': ['jades_cli.py', 'list', '--data', '{data}'],
+    'cli table': ['jades_cli.py', 'table', '--no-cache', '--data', '{data}'],
+    'analyze --no-plot': ['jades_z14_analysis.py', '--no-plot', '--no-cache', '--data', '{data}'],
+    'analyze --headless': ['jades_z14_analysis.py', '--headless', '--no-cache', '--data', '{data}'],
+}
+
+_IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def run_once(argv, cwd):
+    """(wall seconds, import seconds, imported heavy modules) of one cold run of `argv`."""
+    script = argv[:2] if argv[0] == '-c' else [os.path.join(SOURCE_DIR, argv[0])] + argv[1:]
+    env = dict(os.environ, PYTHONPATH=SOURCE_DIR, MPLBACKEND='Agg')
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime'] + script, cwd=cwd, env=env,
+                               capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(argv)} failed: {completed.stderr.strip().splitlines()[-1:]}")
+
+    imports, heavy = 0, set()
+    for line in completed.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), match.group(3), match.group(4)
+        # Top-level entries only, so nested imports are not counted twice
+        if indent == '':
+            imports += cumulative
+        if name in HEAVY_MODULES:
+            heavy.add(name)
+    return wall, imports / 1e6, sorted(heavy)
+
+
+def measure(name, argv, data, repeat):
+    """Median wall and import seconds of `repeat` cold runs, and the heavy modules imported."""
+    data = os.path.abspath(data)
+    argv = [a.format(data=data) for a in argv]
+    # Code run with -c imports from the source folder, scripts run next to the data folder
+    cwd = SOURCE_DIR if argv[0] == '-c' else os.path.dirname(data)
+    runs = [run_once(argv, cwd) for _ in range(repeat)]
+    return {'command': name, 'argv': argv, 'wall_s': statistics.median(r[0] for r in runs),
+            'import_s': statistics.median(r[1] for r in runs), 'heavy_imports': runs[-1][2]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--data', default='data', help='Folder with FITS files the commands analyze')
+    parser.add_argument('--repeat', type=int, default=5, help='Cold runs per command (median reported)')
+    parser.add_argument('--commands', default=','.join(COMMANDS),
+                        help=f"Comma-separated subset of: {', '.join(COMMANDS)}")
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    results = [measure(name, COMMANDS[name], args.data, args.repeat) for name in args.commands.split(',')]
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'repeat': args.repeat, 'results': results}, f,
+                      indent=2)
+    print(f"{'command':<28} {'wall s':>8} {'import s':>9}  heavy modules imported")
+    for r in results:
+        print(f"{r['command']:<28} {r['wall_s']:>8.2f} {r['import_s']:>9.2f}  {', '.join(r['heavy_imports']) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Synthetic NIRSpec x1d / s2d products for the benchmarks.
+
+Files follow the layout the scripts read from the real JADES products:
+
+    x1d: PRIMARY, EXTRACT1D (WAVELENGTH, FLUX, FLUX_ERROR, SURF_BRIGHT, DQ, NPIXELS)
+    s2d: PRIMARY, SCI, ERR, WAVELENGTH (2D images, same shape)
+
+with JWST-style file names and primary/extension headers (TELESCOP,
+INSTRUME, DETECTOR, FILTER, GRATING, EXP_TYPE, units, ...). The spectra
+are noise plus a continuum break and a Lyman-alpha line at a random z, and
+carry the NaN patterns of the real products: unilluminated ends of the
+spectrum, a detector gap, scattered NaN and zero pixels, NaN rows outside
+the slit of the s2d images and a few files with no valid data at all.
+
+Run from the jades_analysis folder to write a dataset:
+    python benchmarks/synthetic.py bench_data --files 1000 --pixels 3000
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LYMAN_REST = 0.1216
+
+# Name of the file describing a generated dataset (used to reuse it)
+MANIFEST = 'synthetic.json'
+
+# Fraction of files without any valid pixel (exercises the "No valid data points" path)
+EMPTY_FRACTION = 0.01
+
+
+def file_name(i, kind):
+    """JWST-style product name (unique per index): jw<program><observation><visit>_<group>_<exposure>_<detector>_<kind>.fits"""
+    detector = 'nrs1' if i % 2 == 0 else 'nrs2'
+    return f"jw01287{1 + i % 3:03d}001_{11101 + i // 10000:05d}_{1 + i % 10000:05d}_{detector}_{kind}.fits"
+
+
+def _primary_header(i, kind, z):
+    from astropy.io import fits
+
+    header = fits.Header()
+    header['TELESCOP'] = 'JWST'
+    header['INSTRUME'] = 'NIRSPEC'
+    header['DETECTOR'] = 'NRS1' if i % 2 == 0 else 'NRS2'
+    header['FILTER'] = 'CLEAR'
+    header['GRATING'] = 'PRISM'
+    header['EXP_TYPE'] = 'NRS_MSASPEC'
+    header['PROGRAM'] = '01287'
+    header['OBSERVTN'] = f"{1 + i % 3:03d}"
+    header['TARGNAME'] = 'JADES-GS-z14-0'
+    header['EFFEXPTM'] = (28000.0 + 100 * (i % 7), 'Effective exposure time (s)')
+    header['FILETYPE'] = kind
+    header['SYN_Z'] = (z, 'Injected redshift (synthetic data)')
+    return header
+
+
+def synthetic_spectrum(rng, n_pixels, z=None):
+    """(wavelength, flux, error, z): continuum break plus Lyman-alpha line with NIRSpec-like NaN gaps."""
+    wavelength = np.linspace(0.6, 5.3, n_pixels)
+    if z is None:
+        z = rng.uniform(5, 35)
+    lyman = LYMAN_REST * (1 + z)
+    noise = 1e-3
+    flux = 2e-3 / (1 + np.exp(-(wavelength - lyman) / 0.01))
+    flux += 8e-3 * np.exp(-0.5 * ((wavelength - lyman) / 0.004) ** 2)
+    flux += rng.normal(0, noise, n_pixels)
+    error = np.full(n_pixels, noise)
+
+    # Unilluminated ends, a detector gap and scattered bad / zero pixels
+    edge = rng.integers(0, n_pixels // 50 + 1, 2)
+    flux[:edge[0]] = np.nan
+    flux[n_pixels - edge[1]:] = np.nan
+    gap = int(rng.uniform(0.45, 0.55) * n_pixels)
+    flux[gap:gap + n_pixels // 100] = np.nan
+    flux[rng.random(n_pixels) < 0.005] = np.nan
+    flux[rng.random(n_pixels) < 0.002] = 0.0
+    error[~np.isfinite(flux)] = np.nan
+    return wavelength, flux, error, z
+
+
+def write_x1d(path, i, rng, n_pixels):
+    from astropy.io import fits
+
+    wavelength, flux, error, z = synthetic_spectrum(rng, n_pixels)
+    if rng.random() < EMPTY_FRACTION:
+        flux[:] = np.nan
+    columns = [
+        fits.Column('WAVELENGTH', 'D', unit='um', array=wavelength),
+        fits.Column('FLUX', 'D', unit='Jy', array=flux),
+        fits.Column('FLUX_ERROR', 'D', unit='Jy', array=error),
+        fits.Column('SURF_BRIGHT', 'D', unit='MJy/sr', array=flux * 1e3),
+        fits.Column('DQ', 'J', array=np.where(np.isfinite(flux), 0, 1)),
+        fits.Column('NPIXELS', 'D', array=np.full(n_pixels, 5.0)),
+    ]
+    table = fits.BinTableHDU.from_columns(columns, name='EXTRACT1D')
+    table.header['SRCTYPE'] = 'POINT'
+    table.header['SLITNAME'] = f"S{i % 200:03d}"
+    fits.HDUList([fits.PrimaryHDU(header=_primary_header(i, 'x1d', z)), table]).writeto(path, overwrite=True)
+    return z
+
+
+def write_s2d(path, i, rng, n_pixels, n_rows):
+    from astropy.io import fits
+
+    wavelength, flux, error, z = synthetic_spectrum(rng, n_pixels)
+    rows = np.arange(n_rows)
+    profile = np.exp(-0.5 * ((rows - n_rows / 2 + rng.uniform(-1, 1)) / 1.5) ** 2)
+    profile /= profile.sum()
+    noise = 1e-3 / np.sqrt(profile.max())
+    sci = profile[:, None] * np.nan_to_num(flux)[None, :] + rng.normal(0, noise, (n_rows, n_pixels))
+    sci[:, ~np.isfinite(flux)] = np.nan
+    # Rows outside the slit are NaN
+    sci[:2] = np.nan
+    sci[-2:] = np.nan
+    err = np.where(np.isfinite(sci), noise, np.nan)
+    image = lambda data, name, unit: fits.ImageHDU(np.asarray(data, dtype='f4'), name=name,
+                                                   header=fits.Header([('BUNIT', unit)]))
+    fits.HDUList([
+        fits.PrimaryHDU(header=_primary_header(i, 's2d', z)),
+        image(sci, 'SCI', 'MJy'),
+        image(err, 'ERR', 'MJy'),
+        image(np.broadcast_to(wavelength, (n_rows, n_pixels)), 'WAVELENGTH', 'um'),
+    ]).writeto(path, overwrite=True)
+    return z
+
+
+def _write_range(folder, start, stop, n_pixels, n_rows, s2d_fraction, seed):
+    truth = {}
+    for i in range(start, stop):
+        rng = np.random.default_rng([seed, i])
+        kind = 's2d' if rng.random() < s2d_fraction else 'x1d'
+        name = file_name(i, kind)
+        path = os.path.join(folder, name)
+        if kind == 's2d':
+            truth[name] = write_s2d(path, i, rng, n_pixels, n_rows)
+        else:
+            truth[name] = write_x1d(path, i, rng, n_pixels)
+    return truth
+
+
+def make_dataset(folder, n_files, n_pixels=3000, n_rows=32, s2d_fraction=0.1, seed=0, workers=1):
+    """
+    Write `n_files` synthetic products to `folder` (reused if an identical dataset is already there).
+
+    Returns {file name: injected z}.
+    """
+    params = {'n_files': n_files, 'n_pixels': n_pixels, 'n_rows': n_rows,
+              's2d_fraction': s2d_fraction, 'seed': seed}
+    manifest_path = os.path.join(folder, MANIFEST)
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest['params'] == params:
+            return manifest['truth']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    os.makedirs(folder, exist_ok=True)
+    for name in os.listdir(folder):
+        if name.endswith('.fits'):
+            os.remove(os.path.join(folder, name))
+
+    # Each file has its own random stream, so the dataset does not depend on `workers`
+    block = max(1, min(1000, n_files // max(workers, 1) // 4 or 1))
+    ranges = [(start, min(start + block, n_files)) for start in range(0, n_files, block)]
+    truth = {}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(_write_range, *zip(*[(folder, a, b, n_pixels, n_rows, s2d_fraction, seed)
+                                                      for a, b in ranges])):
+                truth.update(part)
+    else:
+        for a, b in ranges:
+            truth.update(_write_range(folder, a, b, n_pixels, n_rows, s2d_fraction, seed))
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'params': params, 'truth': truth}, f)
+    return truth
+
+
+def main():
+    from ingest import resolve_workers
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('folder', help='Output folder')
+    parser.add_argument('--files', type=int, default=100, help='Number of products')
+    parser.add_argument('--pixels', type=int, default=3000, help='Spectral pixels per product')
+    parser.add_argument('--rows', type=int, default=32, help='Spatial rows of the s2d images')
+    parser.add_argument('--s2d-fraction', type=float, default=0.1, help='Fraction of s2d products')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--workers', type=int, default=0, help='Writer processes (0 = all cores)')
+    args = parser.parse_args()
+
+    truth = make_dataset(args.folder, args.files, args.pixels, args.rows, args.s2d_fraction, args.seed,
+                         resolve_workers(args.workers))
+    print(f"{len(truth)} synthetic products in {args.folder}/")
+
+
+if __name__ == '__main__':
+    main()
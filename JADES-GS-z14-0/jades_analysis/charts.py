@@ -0,0 +1,277 @@
+"""
+Headless, parallel rendering of the summary charts.
+
+Each chart is a job: a module-level draw function plus the plain arrays it
+needs, so it can be pickled to a worker process. Jobs are rendered with the
+non-interactive Agg backend, concurrently when more than one worker is
+allowed, and a chart is skipped when its output file exists and a hash of
+its inputs (data, draw function, dpi and this module's source) matches the
+one recorded in the manifest by the previous run.
+"""
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ingest import resolve_workers
+
+MANIFEST = os.path.join('cache', 'charts', 'manifest.json')
+DPI = 300
+
+# Set up matplotlib for better scientific plots (applied in every worker)
+CHART_STYLE = {
+    'font.size': 12,
+    'axes.linewidth': 1.5,
+    'lines.linewidth': 2,
+}
+
+
+def is_headless():
+    """True when there is no display to show figures on."""
+    if sys.platform in ('win32', 'darwin'):
+        return False
+    return not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+
+
+def use_headless_backend():
+    """Switch matplotlib to the non-interactive Agg backend (before any figure is created)."""
+    import matplotlib
+
+    if matplotlib.get_backend().lower() != 'agg':
+        matplotlib.use('Agg', force=True)
+
+
+def add_display_arguments(parser):
+    """--headless / --no-plot options for the scripts that end with plt.show()."""
+    parser.add_argument('--headless', action='store_true',
+                        help='Use the Agg backend and do not open plot windows (default without a display)')
+    parser.add_argument('--no-plot', action='store_true',
+                        help='Do not draw any figure (text and tables only; matplotlib is not imported)')
+
+
+def setup_display(args):
+    """Force the Agg backend for --headless runs; return True when plt.show() should be called."""
+    if args.no_plot:
+        return False
+    if args.headless or is_headless():
+        use_headless_backend()
+        return False
+    return True
+
+
+# Chart drawing functions: each takes plain arrays and returns the figure
+
+def age_vs_z(z_observed, age_lcdm, age_model):
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(10, 8))
+    plt.scatter(z_observed, age_lcdm, color='blue', label='ΛCDM Age', alpha=0.7, s=50)
+    plt.scatter(z_observed, age_model, color='red', label='Time Delay Model Age', alpha=0.7, s=50)
+    plt.xlabel('Observed Redshift (z)', fontsize=14)
+    plt.ylabel('Age (Gyr)', fontsize=14)
+    plt.title('Age vs Redshift for JADES-GS-z14-0 High-z Galaxies', fontsize=16, fontweight='bold')
+    plt.legend(fontsize=12)
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    return fig
+
+
+def avg_age_bar(age_lcdm, age_model, errors=None):
+    """Average ages; error bars are the file scatter unless `errors` ((2, 2) lower/upper) is given."""
+    import matplotlib.pyplot as plt
+
+    averages = [np.mean(age_lcdm), np.mean(age_model)]
+    spreads = [np.std(age_lcdm), np.std(age_model)] if errors is None else errors
+    fig = plt.figure(figsize=(8, 8))
+    bars = plt.bar(['ΛCDM Model', 'Time Delay Model'], averages,
+                   color=['blue', 'red'], alpha=0.7, width=0.6)
+    plt.errorbar(['ΛCDM Model', 'Time Delay Model'], averages,
+                 yerr=spreads, fmt='none', color='black', capsize=5, capthick=2)
+    plt.xlabel('Cosmological Model', fontsize=14)
+    plt.ylabel('Average Age (Gyr)', fontsize=14)
+    plt.title('Average Age Comparison: ΛCDM vs Time Delay Model', fontsize=16, fontweight='bold')
+    plt.grid(True, alpha=0.3, axis='y')
+
+    # Add value labels on bars
+    for bar, value in zip(bars, averages):
+        height = bar.get_height()
+        plt.text(bar.get_x() + bar.get_width()/2., height + 0.001,
+                 f'{value:.3f}', ha='center', va='bottom', fontweight='bold')
+
+    plt.tight_layout()
+    return fig
+
+
+def delta_z_vs_distance(distances, delta_zs):
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(10, 8))
+    plt.scatter(distances, delta_zs, color='green', alpha=0.7, s=50)
+
+    # Add trend line
+    z = np.polyfit(distances, delta_zs, 1)
+    p = np.poly1d(z)
+    plt.plot(distances, p(distances), "r--", alpha=0.8, linewidth=2,
+             label=f'Trend line (slope: {z[0]:.2e})')
+
+    plt.xlabel('Distance (Mpc)', fontsize=14)
+    plt.ylabel('Δz (Redshift Shift)', fontsize=14)
+    plt.title('Redshift Shift vs Distance for JADES-GS-z14-0 Galaxies', fontsize=16, fontweight='bold')
+    plt.legend(fontsize=12)
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    return fig
+
+
+def sample_spectrum(wavelength, flux, file, z_observed):
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(12, 8))
+    plt.plot(wavelength, flux, 'b-', linewidth=1.5, label=f'Spectrum: {file}')
+    plt.xlabel('Wavelength (μm)', fontsize=14)
+    plt.ylabel('Flux', fontsize=14)
+    plt.title(f'Sample Spectrum from JADES-GS-z14-0 (z ≈ {z_observed:.2f})',
+              fontsize=16, fontweight='bold')
+    plt.legend(fontsize=12)
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    return fig
+
+
+def summary_chart_jobs(results, sample, folder='images', age_errors=None):
+    """
+    (output path, draw function, kwargs) for the four charts of generate_charts_from_fits.py.
+
+    `results` is a results.Results table (its columns are passed as views).
+    Without a `sample` spectrum the sample_spectrum chart is left out.
+    `age_errors` are the (2, 2) lower/upper error bars of the average ages
+    (e.g. Monte Carlo percentiles); by default the bars show the file scatter.
+    """
+    column = lambda name: results[name]
+    age_bar = {'age_lcdm': column('Age_ΛCDM_Gyr'), 'age_model': column('Age_Model_Gyr')}
+    if age_errors is not None:
+        age_bar['errors'] = np.asarray(age_errors)
+    jobs = [
+        (os.path.join(folder, 'age_vs_z.png'), age_vs_z,
+         {'z_observed': column('z_observed'), 'age_lcdm': column('Age_ΛCDM_Gyr'),
+          'age_model': column('Age_Model_Gyr')}),
+        (os.path.join(folder, 'avg_age_bar.png'), avg_age_bar, age_bar),
+        (os.path.join(folder, 'delta_z_vs_distance.png'), delta_z_vs_distance,
+         {'distances': column('Distance_Mpc'), 'delta_zs': column('delta_z')}),
+    ]
+    if sample is not None:
+        jobs.append((os.path.join(folder, 'sample_spectrum.png'), sample_spectrum,
+                     {'wavelength': sample['wavelength'], 'flux': sample['flux'], 'file': sample['File'],
+                      'z_observed': sample['z_observed']}))
+    return jobs
+
+
+def _source_digest():
+    with open(os.path.abspath(__file__), 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def input_digest(draw, kwargs, dpi=DPI):
+    """Hash of everything that determines the rendered chart."""
+    digest = hashlib.sha1(f"{draw.__module__}.{draw.__name__}|dpi={dpi}|{_source_digest()}".encode('utf-8'))
+    for name in sorted(kwargs):
+        value = kwargs[name]
+        digest.update(name.encode('utf-8'))
+        if isinstance(value, np.ndarray):
+            digest.update(f"{value.dtype}{value.shape}".encode('utf-8'))
+            digest.update(np.ascontiguousarray(value).tobytes())
+        else:
+            digest.update(repr(value).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _load_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(path, manifest):
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not write chart manifest {path}: {str(e)}")
+
+
+def render_chart(path, draw, kwargs, dpi=DPI):
+    """Draw one chart with the Agg backend and save it to `path`."""
+    use_headless_backend()
+    import matplotlib.pyplot as plt
+
+    fig = None
+    try:
+        with plt.style.context('default'), plt.rc_context(CHART_STYLE):
+            fig = draw(**kwargs)
+            fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    finally:
+        # A failed draw leaves its figure open in pyplot; the worker goes on with the next chart
+        plt.close('all' if fig is None else fig)
+    return path
+
+
+def render_charts(jobs, workers=1, force=False, manifest_path=MANIFEST, dpi=DPI):
+    """
+    Render (path, draw, kwargs) jobs, skipping charts whose inputs are unchanged.
+
+    Returns (rendered paths, skipped paths). Failed charts are reported and
+    left out of the manifest so they are retried on the next run.
+    """
+    manifest = _load_manifest(manifest_path)
+    pending = []
+    skipped = []
+    for path, draw, kwargs in jobs:
+        digest = input_digest(draw, kwargs, dpi)
+        if not force and manifest.get(os.path.abspath(path)) == digest and os.path.exists(path):
+            skipped.append(path)
+        else:
+            pending.append((path, draw, kwargs, digest))
+
+    for path, _, _, _ in pending:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    rendered = []
+    workers = min(resolve_workers(workers), len(pending))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(path, digest, pool.submit(render_chart, path, draw, kwargs, dpi))
+                       for path, draw, kwargs, digest in pending]
+            outcomes = []
+            for path, digest, future in futures:
+                try:
+                    future.result()
+                    outcomes.append((path, digest, None))
+                except Exception as e:
+                    outcomes.append((path, digest, e))
+    else:
+        outcomes = []
+        for path, draw, kwargs, digest in pending:
+            try:
+                render_chart(path, draw, kwargs, dpi)
+                outcomes.append((path, digest, None))
+            except Exception as e:
+                outcomes.append((path, digest, e))
+
+    for path, digest, error in outcomes:
+        if error is None:
+            manifest[os.path.abspath(path)] = digest
+            rendered.append(path)
+        else:
+            manifest.pop(os.path.abspath(path), None)
+            print(f"Error rendering {path}: {str(error)}")
+    if pending:
+        _save_manifest(manifest_path, manifest)
+    return rendered, skipped
@@ -0,0 +1,224 @@
+"""
+Columnar binary output of the results table and the cleaned spectra.
+
+A store is a folder with two tables, written one chunk (record batch) at a
+time as the analysis runs:
+
+    results.arrow   one row per analyzed file (the jades_results_table.csv columns)
+    spectra.arrow   File, z_observed and the ragged wavelength / flux /
+                    flux_error arrays as large_list<double> columns (64-bit
+                    offsets, so a store may hold more than 2**31 values)
+
+The default format is the Arrow IPC file format (Feather v2), which is read
+back through a memory map: loading the spectra maps the file and exposes
+each column as NumPy views of its flat values and offsets, with no parsing
+or copying. `fmt='parquet'` writes compressed Parquet files instead (one
+row group per chunk), which are smaller but decoded on read. Either way
+only the requested columns are read.
+
+pyarrow is only needed when a store is written or read, so it is imported
+inside the functions.
+"""
+import os
+
+import numpy as np
+
+FORMATS = {'arrow': '.arrow', 'parquet': '.parquet'}
+
+# Columns of the spectra table holding one array per file
+SPECTRUM_COLUMNS = ['wavelength', 'flux', 'flux_error']
+
+
+def add_store_arguments(parser):
+    """--store / --store-format options of the scripts that can write a columnar store."""
+    parser.add_argument('--store', default=None,
+                        help='Also write the results and cleaned spectra to this columnar store folder')
+    parser.add_argument('--store-format', choices=sorted(FORMATS), default='arrow',
+                        help='Store file format (arrow: memory-mapped reads; parquet: compressed)')
+
+
+def _table_path(directory, name, fmt=None):
+    """Path of table `name` in a store; without `fmt`, whichever format exists."""
+    if fmt is not None:
+        return os.path.join(directory, name + FORMATS[fmt])
+    for fmt, extension in FORMATS.items():
+        path = os.path.join(directory, name + extension)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"No {name} table in {directory}")
+
+
+def _ragged(arrays):
+    """large_list<double> array from a list of 1D arrays (None entries become nulls)."""
+    import pyarrow as pa
+
+    lengths = np.array([0 if a is None else len(a) for a in arrays], dtype=np.int64)
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    present = [np.asarray(a, dtype=np.float64) for a in arrays if a is not None]
+    values = np.concatenate(present) if present else np.zeros(0)
+    missing = np.array([a is None for a in arrays])
+    return pa.LargeListArray.from_arrays(pa.array(offsets), pa.array(values),
+                                    mask=pa.array(missing) if missing.any() else None)
+
+
+def spectra_table(records):
+    """Arrow table of the spectra of analyzed ingest records."""
+    import pyarrow as pa
+
+    columns = {
+        'File': pa.array([r['File'] for r in records], type=pa.string()),
+        'z_observed': pa.array([r['z_observed'] for r in records], type=pa.float64()),
+    }
+    for name in SPECTRUM_COLUMNS:
+        columns[name] = _ragged([r.get(name) for r in records])
+    return pa.table(columns)
+
+
+class TableWriter:
+    """Append Arrow tables to one file; the schema is fixed by the first chunk."""
+
+    def __init__(self, path, fmt='arrow'):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown store format {fmt!r} (choose from {', '.join(FORMATS)})")
+        self.path = path
+        self.fmt = fmt
+        self.rows_written = 0
+        self.schema = None
+        self._writer = None
+
+    def write(self, table):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            self.schema = table.schema
+            if self.fmt == 'arrow':
+                self._writer = pa.ipc.new_file(self.path, self.schema)
+            else:
+                self._writer = pq.ParquetWriter(self.path, self.schema, compression='zstd')
+        else:
+            table = table.select(self.schema.names).cast(self.schema)
+        self._writer.write_table(table)
+        self.rows_written += table.num_rows
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class ColumnarStore:
+    """
+    Chunked writer of a store folder.
+
+    write(rows, records) appends result rows (dicts keyed by the results
+    table columns, or a results.Results table) and the spectra of the
+    matching analyzed records.
+    """
+
+    def __init__(self, directory, fmt='arrow'):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.results = TableWriter(_table_path(directory, 'results', fmt), fmt)
+        self.spectra = TableWriter(_table_path(directory, 'spectra', fmt), fmt)
+
+    def write(self, rows, records=None):
+        import pyarrow as pa
+
+        if rows:
+            columns = getattr(rows, 'as_columns', None)
+            self.results.write(pa.Table.from_pydict(columns()) if columns else pa.Table.from_pylist(rows))
+        if records:
+            self.spectra.write(spectra_table(records))
+
+    def close(self):
+        self.results.close()
+        self.spectra.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_table(path, columns=None):
+    """Read `columns` of a store table (memory-mapped for the Arrow format)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if path.endswith(FORMATS['parquet']):
+        return pq.read_table(path, columns=columns, memory_map=True)
+    # The mapping stays open as long as the table's buffers are referenced
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.select(columns) if columns is not None else table
+
+
+def read_results(directory, columns=None):
+    """Results table of a store as a DataFrame (only `columns`, if given)."""
+    return _read_table(_table_path(directory, 'results'), columns).to_pandas()
+
+
+class SpectraTable:
+    """
+    Memory-mapped view of the spectra table of a store.
+
+    Each ragged column is kept as the flat values and offsets of every
+    record batch, so spectrum(i) and arrays(name) return NumPy views into
+    the mapped file instead of copies.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.files = table.column('File').to_pylist() if 'File' in table.column_names else None
+        self._index = None
+        self._chunks = {}
+        for name in SPECTRUM_COLUMNS:
+            if name in table.column_names:
+                chunks = table.column(name).chunks
+                starts = np.concatenate([[0], np.cumsum([len(c) for c in chunks])]).astype(np.int64)
+                self._chunks[name] = (starts, [(np.asarray(c.offsets), c.values.to_numpy(zero_copy_only=False),
+                                                c.is_null().to_numpy(zero_copy_only=False)) for c in chunks])
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def index(self, file):
+        """Row of `file` (requires the File column)."""
+        if self._index is None:
+            self._index = {name: i for i, name in enumerate(self.files)}
+        return self._index[file]
+
+    def spectrum(self, i):
+        """{'File', 'z_observed', 'wavelength', 'flux', 'flux_error'} of row `i` (arrays are views)."""
+        if isinstance(i, str):
+            i = self.index(i)
+        spectrum = {}
+        if self.files is not None:
+            spectrum['File'] = self.files[i]
+        if 'z_observed' in self.table.column_names:
+            spectrum['z_observed'] = self.table.column('z_observed')[i].as_py()
+        for name, (starts, chunks) in self._chunks.items():
+            chunk = int(np.searchsorted(starts, i, side='right') - 1)
+            row = i - starts[chunk]
+            offsets, values, nulls = chunks[chunk]
+            spectrum[name] = None if nulls[row] else values[offsets[row]:offsets[row + 1]]
+        return spectrum
+
+    def arrays(self, name):
+        """(values, offsets) of ragged column `name` across all rows (copies only if there are several batches)."""
+        _, chunks = self._chunks[name]
+        if len(chunks) == 1:
+            offsets, values, _ = chunks[0]
+            return values, offsets
+        values = np.concatenate([v[o[0]:o[-1]] for o, v, _ in chunks])
+        lengths = np.concatenate([np.diff(o) for o, _, _ in chunks])
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return values, offsets
+
+
+def read_spectra(directory, columns=None):
+    """SpectraTable of a store; `columns` limits what is read (e.g. ['File', 'flux'])."""
+    return SpectraTable(_read_table(_table_path(directory, 'spectra'), columns))
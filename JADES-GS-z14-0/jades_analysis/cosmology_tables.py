@@ -0,0 +1,322 @@
+"""
+Precomputed cosmology lookup tables.
+
+Calling Planck18.luminosity_distance(z) and Planck18.age(z) one redshift at
+a time runs a numerical integral (and builds a Quantity) for every file.
+This module integrates the distance and age once on a dense grid in
+u = ln(1 + z), stores the tables on disk and answers whole arrays of
+redshifts with cubic Hermite interpolation.
+
+The Hermite slopes are the exact derivatives of the integrals, so the
+interpolation error is far below the precision quoted in the results table.
+The achieved accuracy is measured against the integrals at the midpoints of
+the grid when the tables are built and is reported as `max_rel_error`.
+
+The slopes are stored with the tables, so loading them from disk needs only
+NumPy: astropy.cosmology (the slowest import of the analysis) is imported
+only to build tables or to answer redshifts outside them.
+
+Every cosmology has its own tables (a few ms to build, cached on disk), so
+`compare_cosmologies` evaluates one set of redshifts under several
+cosmologies for the cost of a table lookup each.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+# Default table settings (z range covers everything NIRSpec can see)
+Z_MAX = 100.0
+N_GRID = 2001
+CACHE_DIR = os.path.join('cache', 'cosmology')
+
+# Speed of light used by the time delay model (m/s)
+C_LIGHT = 3e8
+
+# Default time delay constant (estimate; adjust to fit data)
+K_DEFAULT = 0.05
+
+# (1 * u.Mpc).to_value(u.m)
+MPC_TO_M = 3.0856775814913673e22
+
+# Name used for the cache files of the default cosmology
+DEFAULT_COSMOLOGY = 'Planck18'
+
+# Cosmologies accepted by name (astropy.cosmology realizations)
+NAMED_COSMOLOGIES = ('Planck18', 'Planck15', 'Planck13', 'WMAP9', 'WMAP7', 'WMAP5')
+
+# Parameters of a custom flat ΛCDM cosmology given as 'H0=70,Om0=0.3'
+FLAT_LCDM_PARAMETERS = ('H0', 'Om0', 'Ob0', 'Tcmb0', 'Neff')
+
+# Gauss-Legendre nodes/weights used for the per-interval integrals
+_GL_X, _GL_W = np.polynomial.legendre.leggauss(6)
+
+# Upper limit of the age integral (the tail beyond it is negligible)
+_Z_INF = 1e8
+
+
+def _segment_integrals(cosmo, u_start, width):
+    """Integrate 1/E and (1+z)/E over [u_start, u_start + width] in u."""
+    nodes = (u_start + width / 2)[:, None] + (width / 2)[:, None] * _GL_X[None, :]
+    inv_e = cosmo.inv_efunc(np.expm1(nodes))
+    half = width / 2
+    seg_age = half * (inv_e @ _GL_W)
+    seg_dc = half * ((inv_e * np.exp(nodes)) @ _GL_W)
+    return seg_dc, seg_age
+
+
+def default_cosmology():
+    from astropy.cosmology import Planck18
+
+    return Planck18
+
+
+def parse_cosmology(spec):
+    """
+    Cosmology named by `spec`: a realization name (Planck18, WMAP9, ...) or a
+    flat ΛCDM parameter set such as 'H0=70,Om0=0.3'. The default cosmology is
+    returned as None so it shares the default tables. Raises ValueError.
+    """
+    spec = spec.strip()
+    if spec == DEFAULT_COSMOLOGY:
+        return None
+    if '=' not in spec:
+        if spec not in NAMED_COSMOLOGIES:
+            raise ValueError(f"Unknown cosmology {spec!r} (choose from {', '.join(NAMED_COSMOLOGIES)} "
+                             f"or give flat ΛCDM parameters such as H0=70,Om0=0.3)")
+        import astropy.cosmology
+
+        return getattr(astropy.cosmology, spec)
+
+    params = {}
+    for item in spec.split(','):
+        name, _, value = item.partition('=')
+        name = name.strip()
+        if name not in FLAT_LCDM_PARAMETERS:
+            raise ValueError(f"Unknown flat ΛCDM parameter {name!r} (choose from {', '.join(FLAT_LCDM_PARAMETERS)})")
+        params[name] = float(value)
+    if 'H0' not in params or 'Om0' not in params:
+        raise ValueError(f"Flat ΛCDM cosmology {spec!r} needs at least H0 and Om0")
+    from astropy.cosmology import FlatLambdaCDM
+
+    name = 'FlatLambdaCDM_' + '_'.join(f"{k}={v:g}" for k, v in params.items())
+    return FlatLambdaCDM(name=name, **params)
+
+
+def cosmology_name(cosmo):
+    """Name of `cosmo` in file names and tables (None = the default cosmology)."""
+    return DEFAULT_COSMOLOGY if cosmo is None else getattr(cosmo, 'name', None) or 'cosmology'
+
+
+def _cache_key(cosmo, z_max, n_grid):
+    """Hash of everything the tables depend on (`cosmo` None = the default cosmology)."""
+    from importlib.metadata import version
+
+    identity = DEFAULT_COSMOLOGY if cosmo is None else repr(cosmo)
+    text = f"{identity}|{z_max}|{n_grid}|{version('astropy')}"
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+class CosmologyTables:
+    """Luminosity distance and age tables for one cosmology."""
+
+    def __init__(self, cosmo, u_grid, comoving_mpc, age_gyr, max_rel_error, slopes=None):
+        self._cosmo = cosmo
+        self.u_grid = u_grid
+        self.z_max = float(np.expm1(u_grid[-1]))
+        self.comoving_mpc = comoving_mpc
+        self.log_age = np.log(age_gyr)
+        self.max_rel_error = max_rel_error
+
+        # Exact slopes with respect to u = ln(1+z)
+        if slopes is None:
+            import astropy.units as u
+
+            z_grid = np.expm1(u_grid)
+            inv_e = self.cosmo.inv_efunc(z_grid)
+            slopes = (self.cosmo.hubble_distance.to_value(u.Mpc) * inv_e * (1 + z_grid),
+                      -self.cosmo.hubble_time.to_value(u.Gyr) * inv_e / age_gyr)
+        self._d_comoving, self._d_log_age = slopes
+
+    @property
+    def cosmo(self):
+        """The astropy cosmology of the tables (imported on first use for the default one)."""
+        if self._cosmo is None:
+            self._cosmo = default_cosmology()
+        return self._cosmo
+
+    @classmethod
+    def build(cls, cosmo=None, z_max=Z_MAX, n_grid=N_GRID):
+        """Integrate the tables for `cosmo` (default Planck18) on a grid up to `z_max`."""
+        import astropy.units as u
+
+        if cosmo is None:
+            cosmo = default_cosmology()
+        u_grid = np.linspace(0.0, np.log1p(z_max), n_grid)
+        h = u_grid[1] - u_grid[0]
+
+        # Extend the grid with the same step so the age integral reaches z ~ infinity
+        n_tail = int(np.ceil((np.log1p(_Z_INF) - u_grid[-1]) / h))
+        u_full = np.concatenate([u_grid, u_grid[-1] + h * np.arange(1, n_tail + 1)])
+        seg_dc, seg_age = _segment_integrals(cosmo, u_full[:-1], np.full(len(u_full) - 1, h))
+
+        d_h = cosmo.hubble_distance.to_value(u.Mpc)
+        t_h = cosmo.hubble_time.to_value(u.Gyr)
+        comoving = d_h * np.concatenate([[0.0], np.cumsum(seg_dc)])
+        age = t_h * np.concatenate([np.cumsum(seg_age[::-1])[::-1], [0.0]])
+        comoving = comoving[:n_grid]
+        age = age[:n_grid]
+
+        # Measure the interpolation error at the midpoints of the grid
+        half = np.full(n_grid - 1, h / 2)
+        mid_dc, mid_age = _segment_integrals(cosmo, u_grid[:-1], half)
+        comoving_mid = comoving[:-1] + d_h * mid_dc
+        age_mid = age[:-1] - t_h * mid_age
+
+        tables = cls(cosmo, u_grid, comoving, age, 0.0)
+        z_mid = np.expm1(u_grid[:-1] + h / 2)
+        err_dc = np.abs(tables.comoving_distance_mpc(z_mid) / comoving_mid - 1)
+        err_age = np.abs(tables.age_gyr(z_mid) / age_mid - 1)
+        tables.max_rel_error = float(max(err_dc.max(), err_age.max()))
+        return tables
+
+    def save(self, path):
+        # Written under a temporary name and renamed, so concurrent runs never load a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, u_grid=self.u_grid, comoving_mpc=self.comoving_mpc,
+                     age_gyr=np.exp(self.log_age), max_rel_error=self.max_rel_error,
+                     d_comoving=self._d_comoving, d_log_age=self._d_log_age)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, cosmo=None):
+        with np.load(path) as table:
+            # Tables saved without their slopes get them recomputed from the cosmology
+            slopes = (table['d_comoving'], table['d_log_age']) if 'd_comoving' in table.files else None
+            return cls(cosmo, table['u_grid'], table['comoving_mpc'], table['age_gyr'],
+                       float(table['max_rel_error']), slopes)
+
+    def _hermite(self, z, values, slopes):
+        """Cubic Hermite interpolation of a tabulated function of u = ln(1+z)."""
+        x = np.log1p(z)
+        i = np.clip(np.searchsorted(self.u_grid, x) - 1, 0, len(self.u_grid) - 2)
+        h = self.u_grid[i + 1] - self.u_grid[i]
+        t = (x - self.u_grid[i]) / h
+        t2 = t * t
+        t3 = t2 * t
+        return ((2 * t3 - 3 * t2 + 1) * values[i] + (t3 - 2 * t2 + t) * h * slopes[i]
+                + (-2 * t3 + 3 * t2) * values[i + 1] + (t3 - t2) * h * slopes[i + 1])
+
+    def _in_range(self, z):
+        return (z >= 0) & (z <= self.z_max)
+
+    def comoving_distance_mpc(self, z):
+        z = np.asarray(z, dtype=float)
+        out = self._hermite(z, self.comoving_mpc, self._d_comoving)
+        outside = ~self._in_range(z)
+        if np.any(outside):
+            # Fall back to astropy for redshifts the table does not cover
+            import astropy.units as u
+
+            out = np.where(outside, self.cosmo.comoving_distance(np.where(outside, z, 0.0)).to_value(u.Mpc), out)
+        return out
+
+    def luminosity_distance_mpc(self, z):
+        """Luminosity distance in Mpc for an array of redshifts."""
+        z = np.asarray(z, dtype=float)
+        return (1 + z) * self.comoving_distance_mpc(z)
+
+    def age_gyr(self, z):
+        """Age of the universe in Gyr for an array of redshifts."""
+        z = np.asarray(z, dtype=float)
+        out = np.exp(self._hermite(z, self.log_age, self._d_log_age))
+        outside = ~self._in_range(z)
+        if np.any(outside):
+            import astropy.units as u
+
+            out = np.where(outside, self.cosmo.age(np.where(outside, z, 0.0)).to_value(u.Gyr), out)
+        return out
+
+
+_loaded = {}
+
+
+def get_tables(cosmo=None, z_max=Z_MAX, n_grid=N_GRID, cache_dir=CACHE_DIR):
+    """Return the tables for `cosmo` (default Planck18), building and saving them on first use."""
+    key = _cache_key(cosmo, z_max, n_grid)
+    if key in _loaded:
+        return _loaded[key]
+
+    path = os.path.join(cache_dir, f"{cosmology_name(cosmo)}_{key}.npz")
+    tables = None
+    if os.path.exists(path):
+        try:
+            tables = CosmologyTables.load(path, cosmo)
+        except Exception as e:
+            print(f"Ignoring unreadable cosmology table {path}: {str(e)}")
+    if tables is None:
+        tables = CosmologyTables.build(cosmo, z_max, n_grid)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tables.save(path)
+        except OSError as e:
+            print(f"Could not save cosmology table {path}: {str(e)}")
+
+    _loaded[key] = tables
+    return tables
+
+
+def time_delay_model(z_obs, k=K_DEFAULT, tables=None):
+    """
+    Evaluate the time delay model for an array of observed redshifts.
+
+    Returns a dict of arrays keyed by the results table column names. `k`
+    may be an array that broadcasts against z_obs (e.g. k_grid[:, None] for
+    a grid of k values); distance and the ΛCDM age are computed once per
+    redshift, and the k-dependent columns take the broadcast shape.
+    """
+    if tables is None:
+        tables = get_tables()
+    z_obs = np.asarray(z_obs, dtype=float)
+    k = np.asarray(k, dtype=float)
+
+    # Calculate luminosity distance (x)
+    x_mpc = tables.luminosity_distance_mpc(z_obs)
+    x_m = x_mpc * MPC_TO_M
+
+    # Calculate tau (from model: tau ≈ k * x / c)
+    tau = k * x_m / C_LIGHT  # in seconds
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta_z = tau * C_LIGHT / x_m  # Approximate delta_z
+
+    # Model redshift (adjusted for delay)
+    z_model = z_obs - delta_z
+
+    return {
+        'z_observed': z_obs,
+        'z_model': z_model,
+        'delta_z': delta_z,
+        'Distance_Mpc': x_mpc,
+        'Tau_s': tau,
+        'Age_ΛCDM_Gyr': tables.age_gyr(z_obs),
+        'Age_Model_Gyr': tables.age_gyr(z_model),
+    }
+
+
+def compare_cosmologies(files, z_obs, cosmologies, k=K_DEFAULT):
+    """
+    The time delay model of the same redshifts under several cosmologies.
+
+    `cosmologies` are astropy cosmologies (None = the default), at least
+    one. Returns the columns of a long-format table with one row per
+    (cosmology, file): 'Cosmology', 'File' and the time_delay_model columns.
+    """
+    z_obs = np.asarray(z_obs, dtype=float)
+    models = [time_delay_model(z_obs, k=k, tables=get_tables(cosmo)) for cosmo in cosmologies]
+    names = [cosmology_name(cosmo) for cosmo in cosmologies]
+    columns = {'Cosmology': np.repeat(np.array(names, dtype=object), len(z_obs)),
+               'File': np.tile(np.array(files, dtype=object), len(names))}
+    for name in models[0]:
+        columns[name] = np.concatenate([model[name] for model in models])
+    return columns
@@ -0,0 +1,59 @@
+import argparse
+import numpy as np
+from model_fit import K_MAX, K_MIN, K_STEPS, OBJECTIVES, fit_k, grid_table, k_grid, load_redshifts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Sweep the time delay constant k over the z values of a results table (no FITS reads)')
+    parser.add_argument('--table', default='jades_results_table.csv',
+                        help='Results table with the per-file z_observed values')
+    parser.add_argument('--k-min', type=float, default=K_MIN, help='Smallest k of the grid')
+    parser.add_argument('--k-max', type=float, default=K_MAX, help='Largest k of the grid')
+    parser.add_argument('--k-steps', type=int, default=K_STEPS, help='Number of k values in the grid')
+    parser.add_argument('--objective', choices=sorted(OBJECTIVES), default='age',
+                        help='Quantity the best-fit k should match')
+    parser.add_argument('--target-age', type=float, default=0.3,
+                        help="Age (Gyr) the model ages should reach ('age' objective)")
+    parser.add_argument('--reference-column', default='z_reference',
+                        help="Table column with reference redshifts ('redshift' objective)")
+    parser.add_argument('--output', default='k_grid.csv', help='CSV with the cost and mean model values per k')
+    args = parser.parse_args(argv)
+
+    # Step 1: Per-file redshifts from the results table
+    try:
+        data = load_redshifts(args.table)
+    except (OSError, ValueError) as e:
+        print(f"Error reading {args.table}: {str(e)}")
+        return
+    if len(data) == 0:
+        print(f"No valid redshifts in {args.table}.")
+        return
+
+    if args.objective == 'age':
+        options = {'target_age': args.target_age}
+    else:
+        if args.reference_column not in data.columns:
+            print(f"{args.table} has no {args.reference_column} column for the redshift objective.")
+            return
+        options = {'reference_column': args.reference_column}
+
+    # Step 2: Evaluate the model over the whole k grid at once and pick the best k
+    ks = k_grid(args.k_min, args.k_max, args.k_steps)
+    grid, best = fit_k(data, ks, objective=args.objective, **options)
+
+    # Step 3: Save the grid
+    grid_table(grid).to_csv(args.output, index=False)
+    print(f"Evaluated {len(ks)} k values x {len(data)} files; grid saved to {args.output}")
+
+    print(f"\nBest fit ({args.objective} objective): k = {best['k']:.4f}, cost = {best['cost']:.4g}")
+    if best['on_edge']:
+        print("Warning: the best k is at the edge of the grid; widen --k-min/--k-max.")
+    print(f"Average model z = {np.mean(best['z_model']):.2f}, "
+          f"Average model age = {np.mean(best['Age_Model_Gyr']):.3f} Gyr")
+    for file, z_model, age in zip(data['File'], best['z_model'], best['Age_Model_Gyr']):
+        print(f"File {file}: z_model={z_model:.2f}, Age_Model={age:.3f} Gyr")
+
+
+if __name__ == '__main__':
+    main()
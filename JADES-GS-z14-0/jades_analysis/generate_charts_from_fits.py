@@ -1,291 +1,198 @@
-
+import argparse
 import os
-import matplotlib.pyplot as plt
 import numpy as np
-from astropy.io import fits
-from astropy.cosmology import Planck18
-import astropy.units as u
-
-# Specify the folder path with FITS files
-folder_path = 'data'
-
-# Find only FITS files in the folder
-fits_files = [f for f in os.listdir(folder_path) if f.endswith('.fits')]
-
-print(f"Found {len(fits_files)} FITS files in {folder_path}/")
-
-# Prepare a list to store results
-results = []
-
-# Step 1: Analyze each FITS file
-for file in fits_files:
-    try:
-        full_path = os.path.join(folder_path, file)
-        hdul = fits.open(full_path)
-
-        # Check if it's an x1d file (1D extracted spectrum)
-        if 'x1d' in file.lower():
-            if len(hdul) > 1 and 'EXTRACT1D' in hdul[1].name:
-                data = hdul[1].data
-                if hasattr(data, 'dtype') and hasattr(data.dtype, 'names'):
-                    if 'WAVELENGTH' in data.dtype.names and 'FLUX' in data.dtype.names:
-                        wavelength = data['WAVELENGTH']
-                        flux = data['FLUX']
-                        
-                        # Remove NaN or invalid values
-                        valid_mask = np.isfinite(wavelength) & np.isfinite(flux) & (flux != 0)
-                        wavelength = wavelength[valid_mask]
-                        flux = flux[valid_mask]
-                        
-                        if len(wavelength) > 0:
-                            # Estimate z from Lyman-alpha peak (rest wavelength = 0.1216 microns)
-                            lyman_rest = 0.1216
-                            peak_idx = np.argmax(flux)
-                            lyman_obs = wavelength[peak_idx]
-                            z_obs = (lyman_obs / lyman_rest) - 1
-                            
-                            # Calculate luminosity distance (x)
-                            distance = Planck18.luminosity_distance(z_obs)
-                            x_mpc = distance.to(u.Mpc).value
-                            x_m = distance.to(u.m).value
-                            
-                            # Calculate tau (delay) with k=0.05
-                            c = 3e8  # m/s
-                            k = 0.05
-                            tau = k * x_m / c
-                            delta_z = tau * c / x_m  # Should be ~k due to simplification
-                            
-                            # Model redshift (adjusted for delay)
-                            z_model = z_obs - delta_z
-                            
-                            # Age in ΛCDM for observed z and model z
-                            age_lcdm_obs = Planck18.age(z_obs).value
-                            age_model = Planck18.age(z_model).value
-                            
-                            # Store results
-                            results.append({
-                                'File': file,
-                                'z_observed': z_obs,
-                                'z_model': z_model,
-                                'delta_z': delta_z,
-                                'Distance_Mpc': x_mpc,
-                                'Tau_s': tau,
-                                'Age_ΛCDM_Gyr': age_lcdm_obs,
-                                'Age_Model_Gyr': age_model
-                            })
-                            
-                            print(f"Processed {file}: z_obs={z_obs:.2f}, z_model={z_model:.2f}, delta_z={delta_z:.2f}")
-                    else:
-                        print(f"File {file}: Missing WAVELENGTH or FLUX columns")
-                else:
-                    print(f"File {file}: Data is not in expected table format")
-            else:
-                print(f"File {file}: No EXTRACT1D extension found")
-
-        # Check if it's an s2d file (2D spectral data)
-        elif 's2d' in file.lower():
-            if len(hdul) > 1 and 'SCI' in hdul[1].name:
-                sci_data = hdul[1].data
-                wavelength_data = hdul[3].data if len(hdul) > 3 and 'WAVELENGTH' in hdul[3].name else None
-                
-                if sci_data is not None and wavelength_data is not None:
-                    # Extract 1D spectrum by averaging middle row
-                    middle_row = sci_data.shape[0] // 2
-                    flux_1d = sci_data[middle_row, :]
-                    wavelength_1d = wavelength_data[middle_row, :]
-                    
-                    # Remove NaN or invalid values
-                    valid_mask = np.isfinite(wavelength_1d) & np.isfinite(flux_1d) & (flux_1d != 0)
-                    wavelength_1d = wavelength_1d[valid_mask]
-                    flux_1d = flux_1d[valid_mask]
-                    
-                    if len(wavelength_1d) > 0:
-                        # Estimate z from Lyman-alpha peak
-                        lyman_rest = 0.1216
-                        peak_idx = np.argmax(flux_1d)
-                        lyman_obs = wavelength_1d[peak_idx]
-                        z_obs = (lyman_obs / lyman_rest) - 1
-                        
-                        # Calculate luminosity distance (x)
-                        distance = Planck18.luminosity_distance(z_obs)
-                        x_mpc = distance.to(u.Mpc).value
-                        x_m = distance.to(u.m).value
-                        
-                        # Calculate tau (delay) with k=0.05
-                        c = 3e8
-                        k = 0.05
-                        tau = k * x_m / c
-                        delta_z = tau * c / x_m
-                        
-                        # Model redshift (adjusted for delay)
-                        z_model = z_obs - delta_z
-                        
-                        # Age in ΛCDM for observed z and model z
-                        age_lcdm_obs = Planck18.age(z_obs).value
-                        age_model = Planck18.age(z_model).value
-                        
-                        # Store results
-                        results.append({
-                            'File': file,
-                            'z_observed': z_obs,
-                            'z_model': z_model,
-                            'delta_z': delta_z,
-                            'Distance_Mpc': x_mpc,
-                            'Tau_s': tau,
-                            'Age_ΛCDM_Gyr': age_lcdm_obs,
-                            'Age_Model_Gyr': age_model
-                        })
-                        
-                        print(f"Processed {file}: z_obs={z_obs:.2f}, z_model={z_model:.2f}, delta_z={delta_z:.2f}")
-                else:
-                    print(f"File {file}: No valid SCI or WAVELENGTH data")
-            else:
-                print(f"File {file}: No SCI extension found")
-        else:
-            print(f"File {file}: Unknown file type (not x1d or s2d)")
-
-        hdul.close()
+from archives import split_member
+from charts import render_charts, summary_chart_jobs
+from cosmology_tables import get_tables, time_delay_model
+from ingest import add_ingest_arguments, find_fits_files, ingest, ingest_options, load_record, select_files
+from metrics import add_metrics_arguments, metrics_from_args, write_metrics
+from model_fit import add_model_arguments
+from results import Results
+from uncertainty import add_uncertainty_arguments, mean_percentiles, monte_carlo
+
+# Charts of summary_chart_jobs, as listed by the summary
+CHART_DESCRIPTIONS = (
+    (os.path.join('images', 'age_vs_z.png'), 'Age vs redshift comparison'),
+    (os.path.join('images', 'avg_age_bar.png'), 'Average age comparison'),
+    (os.path.join('images', 'delta_z_vs_distance.png'), 'Redshift shift vs distance'),
+    (os.path.join('images', 'sample_spectrum.png'), 'Sample spectrum visualization'),
+)
+
+
+def load_results(source):
+    """
+    Result rows saved by a previous run: a results CSV (jades_results_table.csv)
+    or a columnar store folder (--store of jades_z14_analysis.py).
+    """
+    if os.path.isdir(source):
+        from columnar import read_results
+
+        df = read_results(source)
+    else:
+        import pandas as pd
+
+        # Round-trip parsing keeps the exact floats, so unchanged charts are skipped
+        df = pd.read_csv(source, float_precision='round_trip')
+    df = df[np.isfinite(df['z_observed'].to_numpy(dtype=float))]
+    return Results.from_frame(df)
+
+
+def load_sample(source, row, args):
+    """
+    Spectrum of result `row` for the sample chart: from the spectra table when
+    `source` is a columnar store that has it, otherwise from its FITS file in
+    --data (through the spectra cache). The z is the one of the table.
+    """
+    sample = None
+    if os.path.isdir(source):
+        from columnar import read_spectra
 
-    except Exception as e:
-        print(f"Error processing {file}: {str(e)}")
         try:
-            hdul.close()
-        except:
-            pass
-
-print(f"\nSuccessfully processed {len(results)} files out of {len(fits_files)} total files.")
-
-# Step 2: Create charts if results exist
-if results:
-    # Set up matplotlib for better scientific plots
-    plt.style.use('default')
-    plt.rcParams['font.size'] = 12
-    plt.rcParams['axes.linewidth'] = 1.5
-    plt.rcParams['lines.linewidth'] = 2
-    
-    # Chart 1: Age vs z_observed (Scatter)
-    plt.figure(figsize=(10, 8))
-    plt.scatter([r['z_observed'] for r in results], [r['Age_ΛCDM_Gyr'] for r in results], 
-                color='blue', label='ΛCDM Age', alpha=0.7, s=50)
-    plt.scatter([r['z_observed'] for r in results], [r['Age_Model_Gyr'] for r in results], 
-                color='red', label='Time Delay Model Age', alpha=0.7, s=50)
-    plt.xlabel('Observed Redshift (z)', fontsize=14)
-    plt.ylabel('Age (Gyr)', fontsize=14)
-    plt.title('Age vs Redshift for JADES-GS-z14-0 High-z Galaxies', fontsize=16, fontweight='bold')
-    plt.legend(fontsize=12)
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.savefig('images/age_vs_z.png', dpi=300, bbox_inches='tight')
-    plt.close()
-
-    # Chart 2: Average Age Bar Chart
-    avg_age_lcdm = np.mean([r['Age_ΛCDM_Gyr'] for r in results])
-    avg_age_model = np.mean([r['Age_Model_Gyr'] for r in results])
-    std_age_lcdm = np.std([r['Age_ΛCDM_Gyr'] for r in results])
-    std_age_model = np.std([r['Age_Model_Gyr'] for r in results])
-    
-    plt.figure(figsize=(8, 8))
-    bars = plt.bar(['ΛCDM Model', 'Time Delay Model'], [avg_age_lcdm, avg_age_model], 
-                   color=['blue', 'red'], alpha=0.7, width=0.6)
-    plt.errorbar(['ΛCDM Model', 'Time Delay Model'], [avg_age_lcdm, avg_age_model], 
-                 yerr=[std_age_lcdm, std_age_model], fmt='none', color='black', capsize=5, capthick=2)
-    plt.xlabel('Cosmological Model', fontsize=14)
-    plt.ylabel('Average Age (Gyr)', fontsize=14)
-    plt.title('Average Age Comparison: ΛCDM vs Time Delay Model', fontsize=16, fontweight='bold')
-    plt.grid(True, alpha=0.3, axis='y')
-    
-    # Add value labels on bars
-    for bar, value in zip(bars, [avg_age_lcdm, avg_age_model]):
-        height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2., height + 0.001,
-                f'{value:.3f}', ha='center', va='bottom', fontweight='bold')
-    
-    plt.tight_layout()
-    plt.savefig('images/avg_age_bar.png', dpi=300, bbox_inches='tight')
-    plt.close()
-
-    # Chart 3: delta_z vs Distance
-    plt.figure(figsize=(10, 8))
-    distances = [r['Distance_Mpc'] for r in results]
-    delta_zs = [r['delta_z'] for r in results]
-    plt.scatter(distances, delta_zs, color='green', alpha=0.7, s=50)
-    
-    # Add trend line
-    z = np.polyfit(distances, delta_zs, 1)
-    p = np.poly1d(z)
-    plt.plot(distances, p(distances), "r--", alpha=0.8, linewidth=2, 
-             label=f'Trend line (slope: {z[0]:.2e})')
-    
-    plt.xlabel('Distance (Mpc)', fontsize=14)
-    plt.ylabel('Δz (Redshift Shift)', fontsize=14)
-    plt.title('Redshift Shift vs Distance for JADES-GS-z14-0 Galaxies', fontsize=16, fontweight='bold')
-    plt.legend(fontsize=12)
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.savefig('images/delta_z_vs_distance.png', dpi=300, bbox_inches='tight')
-    plt.close()
-
-    # Chart 4: Sample Spectrum (for the first file as an example)
+            sample = read_spectra(source, ['File', 'wavelength', 'flux']).spectrum(row['File'])
+        except (OSError, KeyError):
+            sample = None
+    if sample is None:
+        options = ingest_options(args)
+        # The File column holds the listed name ('bundle.tar/member.fits' for bundle members);
+        # a bare member name, as in older tables, is looked up in the listing
+        path = os.path.join(args.data, row['File'])
+        if not os.path.exists(path) and split_member(path)[1] is None:
+            if not os.path.isdir(args.data):
+                print(f"No {args.data}/ folder: the sample spectrum of {row['File']} is not available")
+                return None
+            path = next((os.path.join(args.data, f) for f in find_fits_files(args.data)
+                         if os.path.basename(f) == row['File']), path)
+        sample = load_record(path, cache=options['cache'],
+                             s2d_window=options['s2d_window'], s2d_extract=options['s2d_extract'])
+        if sample['message']:
+            print(sample['message'])
+            return None
+    return {**sample, 'File': row['File'], 'z_observed': row['z_observed']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate the JADES-GS-z14-0 charts from the FITS files')
+    add_ingest_arguments(parser)
+    add_model_arguments(parser)
+    add_uncertainty_arguments(parser)
+    add_metrics_arguments(parser)
+    parser.add_argument('--chart-workers', type=int, default=0,
+                        help='Worker processes used to render the charts (0 = all cores, 1 = serial)')
+    parser.add_argument('--force-charts', action='store_true',
+                        help='Render every chart even if its inputs are unchanged')
+    parser.add_argument('--from-table', metavar='PATH',
+                        help='Draw the charts from saved results (CSV or columnar store folder) '
+                             'instead of re-reading the FITS files')
+    args = parser.parse_args(argv)
+    metrics = metrics_from_args(args).start()
+
+    if args.from_table:
+        # Every chart but the sample spectrum comes straight from the table
+        try:
+            results = load_results(args.from_table)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Error reading {args.from_table}: {str(e)}")
+            return
+        print(f"Loaded {len(results)} results from {args.from_table}")
+        if args.mc_draws > 0:
+            print("--mc-draws needs the spectra of every file; ignored with --from-table.")
+        sample = load_sample(args.from_table, results[0], args) if results else None
+        draw_charts(args, metrics, results, sample)
+        write_metrics(metrics, args.metrics)
+        return
+
+    # Specify the folder path with FITS files
+    folder_path = args.data
+
+    # Find only FITS files in the folder
+    fits_files = select_files(args)
+
+    print(f"Found {len(fits_files)} FITS files in {folder_path}/")
+
+    # Step 1: Analyze each FITS file (records come back in fits_files order)
+    records = ingest(folder_path, fits_files, metrics=metrics, **ingest_options(args))
+
+    # Prepare a list of (file, z_obs) pairs; cosmology is evaluated in bulk below
+    observed = []
+    spectra = {}
+    analyzed = []
+    for record in records:
+        if record['message']:
+            print(record['message'])
+        else:
+            observed.append((record['File'], record['z_observed']))
+            spectra[record['File']] = record
+            analyzed.append(record)
+
+    # Apply cosmology and the time delay model to all redshifts at once (one column per field)
+    results = Results()
+    if observed:
+        with metrics.stage('cosmology'):
+            model = time_delay_model([z for _, z in observed], k=args.k, tables=get_tables())
+        results = Results.from_columns([file for file, _ in observed], model)
+        for r in results:
+            print(f"Processed {r['File']}: z_obs={r['z_observed']:.2f}, z_model={r['z_model']:.2f}, delta_z={r['delta_z']:.2f}")
+
+    print(f"\nSuccessfully processed {len(results)} files out of {len(fits_files)} total files.")
+
+    # With --mc-draws, the average age bars show the 16-84 percentile range
+    # of the mean over the flux realizations instead of the file scatter
+    age_errors = None
+    if results and args.mc_draws > 0:
+        with metrics.stage('uncertainty'):
+            mc = monte_carlo(analyzed, n_draws=args.mc_draws, seed=args.mc_seed,
+                             z_method=args.z_method, k=args.k)
+        age_errors = []
+        for name, average in (('Age_ΛCDM_Gyr', np.mean(results['Age_ΛCDM_Gyr'])),
+                              ('Age_Model_Gyr', np.mean(results['Age_Model_Gyr']))):
+            low, _, high = mean_percentiles(mc, name)
+            age_errors.append((max(average - low, 0.0), max(high - average, 0.0)))
+        age_errors = np.transpose(age_errors)
+
+    # Step 2: Create charts if results exist (sample spectrum: the first file, kept in memory by ingest)
+    draw_charts(args, metrics, results, spectra[results[0]['File']] if results else None, age_errors)
+    write_metrics(metrics, args.metrics)
+
+
+def draw_charts(args, metrics, results, sample, age_errors=None):
+    """Render the charts and print the summary of `results` (no sample spectrum chart without `sample`)."""
     if results:
-        first_file = results[0]['File']
-        hdul = fits.open(os.path.join(folder_path, first_file))
-        if 'x1d' in first_file.lower() and len(hdul) > 1 and 'EXTRACT1D' in hdul[1].name:
-            data = hdul[1].data
-            wavelength = data['WAVELENGTH']
-            flux = data['FLUX']
-            valid_mask = np.isfinite(wavelength) & np.isfinite(flux) & (flux != 0)
-            wavelength = wavelength[valid_mask]
-            flux = flux[valid_mask]
-            plt.figure(figsize=(12, 8))
-            plt.plot(wavelength, flux, 'b-', linewidth=1.5, label=f'Spectrum: {first_file}')
-            plt.xlabel('Wavelength (μm)', fontsize=14)
-            plt.ylabel('Flux', fontsize=14)
-            plt.title(f'Sample Spectrum from JADES-GS-z14-0 (z ≈ {results[0]["z_observed"]:.2f})', 
-                     fontsize=16, fontweight='bold')
-            plt.legend(fontsize=12)
-            plt.grid(True, alpha=0.3)
-            plt.tight_layout()
-            plt.savefig('images/sample_spectrum.png', dpi=300, bbox_inches='tight')
-            plt.close()
-        elif 's2d' in first_file.lower() and len(hdul) > 1 and 'SCI' in hdul[1].name:
-            sci_data = hdul[1].data
-            wavelength_data = hdul[3].data if len(hdul) > 3 and 'WAVELENGTH' in hdul[3].name else None
-            if sci_data is not None and wavelength_data is not None:
-                middle_row = sci_data.shape[0] // 2
-                flux_1d = sci_data[middle_row, :]
-                wavelength_1d = wavelength_data[middle_row, :]
-                valid_mask = np.isfinite(wavelength_1d) & np.isfinite(flux_1d) & (flux_1d != 0)
-                wavelength_1d = wavelength_1d[valid_mask]
-                flux_1d = flux_1d[valid_mask]
-                plt.figure(figsize=(12, 8))
-                plt.plot(wavelength_1d, flux_1d, 'b-', linewidth=1.5, label=f'Spectrum: {first_file}')
-                plt.xlabel('Wavelength (μm)', fontsize=14)
-                plt.ylabel('Flux', fontsize=14)
-                plt.title(f'Sample Spectrum from JADES-GS-z14-0 (z ≈ {results[0]["z_observed"]:.2f})', 
-                         fontsize=16, fontweight='bold')
-                plt.legend(fontsize=12)
-                plt.grid(True, alpha=0.3)
-                plt.tight_layout()
-                plt.savefig('images/sample_spectrum.png', dpi=300, bbox_inches='tight')
-                plt.close()
-        hdul.close()
-
-    # Summary statistics
-    print(f"\n📊 Analysis Summary:")
-    print(f"   • Total galaxies analyzed: {len(results)}")
-    print(f"   • Redshift range: {min([r['z_observed'] for r in results]):.2f} - {max([r['z_observed'] for r in results]):.2f}")
-    print(f"   • Average observed redshift: {np.mean([r['z_observed'] for r in results]):.2f}")
-    print(f"   • Average model redshift: {np.mean([r['z_model'] for r in results]):.2f}")
-    print(f"   • Average Δz: {np.mean([r['delta_z'] for r in results]):.3f}")
-    print(f"   • Average ΛCDM age: {avg_age_lcdm:.3f} ± {std_age_lcdm:.3f} Gyr")
-    print(f"   • Average model age: {avg_age_model:.3f} ± {std_age_model:.3f} Gyr")
-    
-    print(f"\n📈 Charts generated in images/ folder:")
-    print(f"   • images/age_vs_z.png - Age vs redshift comparison")
-    print(f"   • images/avg_age_bar.png - Average age comparison")
-    print(f"   • images/delta_z_vs_distance.png - Redshift shift vs distance")
-    print(f"   • images/sample_spectrum.png - Sample spectrum visualization")
-    
-else:
-    print("❌ No valid results to create charts.")
-
+        # Charts 1-4: age vs z, average age bar, delta_z vs distance and a
+        # sample spectrum. They are independent, so they are rendered headless
+        # in worker processes and skipped when their inputs have not changed
+        # since the last run
+        if sample is None:
+            print("No sample spectrum: images/sample_spectrum.png is not drawn")
+        jobs = summary_chart_jobs(results, sample, age_errors=age_errors)
+        with metrics.stage('plot'):
+            rendered, skipped = render_charts(jobs, workers=args.chart_workers, force=args.force_charts)
+        for path in skipped:
+            print(f"Skipped {path} (inputs unchanged)")
+
+        avg_age_lcdm = np.mean(results['Age_ΛCDM_Gyr'])
+        avg_age_model = np.mean(results['Age_Model_Gyr'])
+        std_age_lcdm = np.std(results['Age_ΛCDM_Gyr'])
+        std_age_model = np.std(results['Age_Model_Gyr'])
+
+        # Summary statistics
+        print(f"\n📊 Analysis Summary:")
+        print(f"   • Total galaxies analyzed: {len(results)}")
+        print(f"   • Redshift range: {results['z_observed'].min():.2f} - {results['z_observed'].max():.2f}")
+        print(f"   • Average observed redshift: {np.mean(results['z_observed']):.2f}")
+        print(f"   • Average model redshift: {np.mean(results['z_model']):.2f}")
+        print(f"   • Average Δz: {np.mean(results['delta_z']):.3f}")
+        print(f"   • Average ΛCDM age: {avg_age_lcdm:.3f} ± {std_age_lcdm:.3f} Gyr")
+        print(f"   • Average model age: {avg_age_model:.3f} ± {std_age_model:.3f} Gyr")
+
+        written = set(rendered) | set(skipped)
+        charts = [(path, description) for path, description in CHART_DESCRIPTIONS if path in written]
+        if charts:
+            print(f"\n📈 Charts generated in images/ folder:")
+            for path, description in charts:
+                print(f"   • {path} - {description}")
+
+    else:
+        print("❌ No valid results to create charts.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+SQLite index of the FITS headers of a data folder.
+
+Every file gets one row with what the scripts used to learn by opening it:
+the product type (x1d / s2d), the extension names and shapes, detector,
+program / observation / visit IDs, exposure type, grating, filter and
+target, plus the size and mtime used to notice changes. Only headers are
+read (HDU data is never loaded), and `update` re-reads only files that are
+new or changed since the last run, so inventories and selections such as
+"nrs2 x1d of observation 001" are a query instead of thousands of opens.
+
+The index lives in cache/headers.sqlite and can hold several data folders.
+"""
+import json
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from archives import file_stat, fits_source
+from ingest import INDEX_FILE, find_fits_files, product_kind, resolve_workers
+
+# Bump when the columns or the way they are filled change (the index is rebuilt)
+SCHEMA_VERSION = 1
+
+COLUMNS = ['folder', 'file', 'size', 'mtime_ns', 'kind', 'detector', 'program', 'observation', 'visit',
+           'exp_type', 'grating', 'filter', 'target', 'n_extensions', 'extensions', 'error']
+
+# Columns that can be used to select files, and how a value given on the command line is normalized
+FILTERS = {
+    'kind': str.lower,
+    'detector': str.lower,
+    'program': lambda value: value.zfill(5),
+    'observation': lambda value: value.zfill(3),
+    'visit': lambda value: value.zfill(3),
+    'exp_type': str.upper,
+    'grating': str.upper,
+}
+
+# jw<program><observation><visit>_<visit group>_<exposure>_<detector>_<product>
+_NAME = re.compile(r'^jw(\d{5})(\d{3})(\d{3})_\d{5}_\d{5}_([a-z0-9]+)_', re.IGNORECASE)
+
+
+def _shape(header):
+    """Data shape of an HDU from its header (numpy order), or None when it has no data."""
+    naxis = header.get('NAXIS', 0)
+    if not naxis:
+        return None
+    if header.get('XTENSION') == 'BINTABLE':
+        return [header.get('NAXIS2', 0), header.get('TFIELDS', 0)]
+    return [header.get(f"NAXIS{i}", 0) for i in range(naxis, 0, -1)]
+
+
+def read_headers(full_path):
+    """Index row of one FITS file, from its headers only (None if the file is gone)."""
+    from astropy.io import fits
+
+    file = os.path.basename(full_path)
+    try:
+        stat = file_stat(full_path)
+    except OSError:
+        return None
+    row = dict.fromkeys(COLUMNS)
+    row.update({'folder': os.path.abspath(os.path.dirname(full_path)), 'file': file,
+                'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+    try:
+        with fits.open(fits_source(full_path), memmap=True, lazy_load_hdus=True) as hdul:
+            extensions = [{'name': hdu.name, 'type': hdu.header.get('XTENSION', 'PRIMARY'),
+                           'shape': _shape(hdu.header)} for hdu in hdul]
+            primary = hdul[0].header
+            row['detector'] = primary.get('DETECTOR')
+            row['program'] = primary.get('PROGRAM')
+            row['observation'] = primary.get('OBSERVTN')
+            row['visit'] = primary.get('VISIT')
+            row['exp_type'] = primary.get('EXP_TYPE')
+            row['grating'] = primary.get('GRATING')
+            row['filter'] = primary.get('FILTER')
+            row['target'] = primary.get('TARGNAME')
+    except Exception as e:
+        row['error'] = f"Error processing {file}: {str(e)}"
+        extensions = []
+
+    # Fill the IDs missing from the headers from the JWST file name
+    match = _NAME.match(file)
+    if match:
+        for name, value in zip(('program', 'observation', 'visit', 'detector'), match.groups()):
+            if row[name] is None:
+                row[name] = value
+    for name in ('detector', 'program', 'observation', 'visit'):
+        if row[name] is not None:
+            row[name] = FILTERS[name](str(row[name]))
+    row['kind'] = product_kind(file, [e['name'] for e in extensions])
+    row['n_extensions'] = len(extensions)
+    row['extensions'] = json.dumps(extensions)
+    return row
+
+
+class HeaderIndex:
+    """Header index stored in an SQLite file (use as a context manager)."""
+
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.db.execute('DROP TABLE IF EXISTS files')
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        types = {'size': 'INTEGER', 'mtime_ns': 'INTEGER', 'n_extensions': 'INTEGER'}
+        columns = ', '.join(f"{c} {types.get(c, 'TEXT')}" for c in COLUMNS)
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS files ({columns}, PRIMARY KEY (folder, file))")
+        for name in FILTERS:
+            self.db.execute(f"CREATE INDEX IF NOT EXISTS files_{name} ON files (folder, {name})")
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def update(self, folder_path, workers=1):
+        """
+        Bring the rows of `folder_path` up to date: read the headers of new or
+        changed files and drop removed ones. Returns (read, removed, unchanged).
+        """
+        folder = os.path.abspath(folder_path)
+        known = {r['file']: (r['size'], r['mtime_ns'])
+                 for r in self.db.execute('SELECT file, size, mtime_ns FROM files WHERE folder = ?', (folder,))}
+        stale = []
+        current = set()
+        for file in find_fits_files(folder_path):
+            try:
+                stat = file_stat(os.path.join(folder_path, file))
+            except OSError:
+                # Deleted or renamed since the listing (e.g. in a watched folder): treated as removed
+                continue
+            current.add(file)
+            if known.get(file) != (stat.st_size, stat.st_mtime_ns):
+                stale.append(file)
+        paths = [os.path.join(folder_path, file) for file in stale]
+
+        workers = resolve_workers(workers)
+        if workers == 1 or len(stale) < 2:
+            rows = [read_headers(p) for p in paths]
+        else:
+            chunksize = max(1, len(stale) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=min(workers, len(stale))) as pool:
+                rows = list(pool.map(read_headers, paths, chunksize=chunksize))
+        # Rows are keyed by the listing name ('bundle.tar/member.fits' for bundle members)
+        for file, row in zip(stale, rows):
+            if row is None:
+                current.discard(file)
+            else:
+                row['folder'], row['file'] = folder, file
+        rows = [row for row in rows if row is not None]
+
+        removed = [(folder, file) for file in known if file not in current]
+        with self.db:
+            self.db.executemany('DELETE FROM files WHERE folder = ? AND file = ?', removed)
+            self.db.executemany(f"INSERT OR REPLACE INTO files ({', '.join(COLUMNS)}) "
+                                f"VALUES ({', '.join('?' * len(COLUMNS))})",
+                                [[row[c] for c in COLUMNS] for row in rows])
+        return len(rows), len(removed), len(current) - len(rows)
+
+    def rows(self, folder_path, **filters):
+        """Index rows (dicts, by file name) of `folder_path` matching every given filter."""
+        conditions = ['folder = ?']
+        values = [os.path.abspath(folder_path)]
+        for name, value in filters.items():
+            if name not in FILTERS:
+                raise ValueError(f"Unknown filter {name!r} (choose from {', '.join(FILTERS)})")
+            if value is not None:
+                conditions.append(f"{name} = ?")
+                values.append(FILTERS[name](str(value)))
+        query = f"SELECT * FROM files WHERE {' AND '.join(conditions)} ORDER BY file"
+        return [dict(r) for r in self.db.execute(query, values)]
+
+    def select(self, folder_path, **filters):
+        """Sorted file names of `folder_path` matching every given filter."""
+        return [row['file'] for row in self.rows(folder_path, **filters)]
+
+    def counts(self, folder_path, column):
+        """{value: number of files} of `column` over `folder_path`."""
+        query = f"SELECT {column}, COUNT(*) FROM files WHERE folder = ? GROUP BY {column} ORDER BY {column}"
+        return dict(self.db.execute(query, (os.path.abspath(folder_path),)).fetchall())
+
+
+def describe_extensions(row):
+    """'SCI[32x3000] ERR[32x3000] ...' from the extensions column of an index row."""
+    parts = []
+    for extension in json.loads(row['extensions']):
+        shape = 'x'.join(str(n) for n in extension['shape']) if extension['shape'] else ''
+        parts.append(f"{extension['name']}[{shape}]" if shape else extension['name'])
+    return ' '.join(parts)
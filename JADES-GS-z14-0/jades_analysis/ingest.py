@@ -0,0 +1,420 @@
+"""
+FITS ingestion shared by jades.py, jades_z14_analysis.py and
+generate_charts_from_fits.py.
+
+`process_file` opens one x1d or s2d product exactly once, extracts the
+cleaned 1D spectrum and makes the rough Lyman-alpha peak estimate of z;
+`ingest` then replaces it with the batched template fit of redshift.py
+(`z_method='template'`). The record it
+returns keeps the spectrum in memory (and optionally the `hdul.info()`
+listing), so the file listing, the results table and every chart are built
+from it without reopening the file. `ingest` runs it over a list of files,
+optionally on a pool of worker processes and through the on-disk spectra
+cache, and always returns the records in the order of the input list.
+Serial runs read (and decompress) the next files ahead on background
+threads (prefetch.py). FITS members of tar/zip bundles in the folder are
+listed and read like files (archives.py).
+"""
+import io
+import os
+import tarfile
+import time
+import warnings
+import zipfile
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from archives import fits_source, is_archive, list_members, listing_name
+from prefetch import READ_AHEAD, is_fits, read_ahead
+from spectra_cache import CACHE_DIR, MAX_BYTES, SpectraCache
+
+# Rest wavelength of Lyman-alpha (microns)
+LYMAN_REST = 0.1216
+
+# 'row': middle row (or --s2d-window rows), 'optimal': profile-weighted extraction of extraction.py
+S2D_METHODS = ('row', 'optimal')
+
+# SQLite header index answering the selection options (header_index.py)
+INDEX_FILE = os.path.join('cache', 'headers.sqlite')
+
+# 'template': cross-correlation fit of redshift.py, 'peak': wavelength of the flux maximum
+Z_METHODS = ('template', 'peak')
+
+
+def find_fits_files(folder_path):
+    """
+    Return the FITS files (plain or compressed) in `folder_path`, sorted so
+    runs are reproducible. Members of tar/zip bundles are listed as
+    'bundle.tar/member.fits'.
+    """
+    files = []
+    for name in os.listdir(folder_path):
+        if is_fits(name):
+            files.append(name)
+        elif is_archive(name) and os.path.isfile(os.path.join(folder_path, name)):
+            try:
+                files.extend(f"{name}/{member}" for member in list_members(os.path.join(folder_path, name)))
+            except (OSError, tarfile.TarError, zipfile.BadZipFile) as e:
+                print(f"Error processing {name}: {str(e)}")
+    return sorted(files)
+
+
+def product_kind(file, extension_names=()):
+    """'x1d', 's2d' or None: from the file name, else from the extension names."""
+    name = file.lower()
+    if 'x1d' in name:
+        return 'x1d'
+    if 's2d' in name:
+        return 's2d'
+    if 'EXTRACT1D' in extension_names:
+        return 'x1d'
+    if 'SCI' in extension_names and 'WAVELENGTH' in extension_names:
+        return 's2d'
+    return None
+
+
+def resolve_workers(workers):
+    """Translate a --workers option into a process count (0 or less = all cores)."""
+    if workers is None or workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def add_ingest_arguments(parser):
+    """Command line options shared by every script that ingests the data folder."""
+    parser.add_argument('--data', default='data', help='Folder with FITS files')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes used to read the FITS files (0 = all cores)')
+    parser.add_argument('--s2d-window', type=int, default=0,
+                        help='Rows on each side of the middle s2d row to average (0 = middle row only)')
+    parser.add_argument('--s2d-extract', choices=S2D_METHODS, default='row',
+                        help='s2d extraction: middle row(s) or profile-weighted optimal extraction')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Re-read every FITS file instead of using the spectra cache')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='Folder of the spectra cache')
+    parser.add_argument('--cache-size-mb', type=float, default=MAX_BYTES / 2**20,
+                        help='Size limit of the spectra cache in MB')
+    parser.add_argument('--cache-hash', action='store_true',
+                        help='Key the cache by file contents instead of size and mtime')
+    parser.add_argument('--z-method', choices=Z_METHODS, default='template',
+                        help='Redshift estimate: template cross-correlation or the flux peak')
+    parser.add_argument('--prefetch', type=int, default=READ_AHEAD,
+                        help='Files read (and decompressed) ahead on background threads in serial runs (0 = off)')
+    add_selection_arguments(parser)
+
+
+def add_selection_arguments(parser):
+    """--kind / --detector / --program / --observation options, answered by the header index."""
+    selection = parser.add_argument_group('file selection (answered by the header index, header_index.py)')
+    selection.add_argument('--kind', choices=('x1d', 's2d'), help='Only this product type')
+    selection.add_argument('--detector', help='Only this detector (e.g. nrs2)')
+    selection.add_argument('--program', help='Only this program ID (e.g. 1287)')
+    selection.add_argument('--observation', help='Only this observation ID (e.g. 001)')
+    selection.add_argument('--index', default=INDEX_FILE,
+                           help='SQLite header index used by the selection options')
+
+
+def ingest_options(args):
+    """Keyword arguments of `ingest` / `pipeline.stream_analysis` from the add_ingest_arguments options."""
+    return {'workers': args.workers, 's2d_window': args.s2d_window, 's2d_extract': args.s2d_extract,
+            'cache': cache_from_args(args), 'z_method': args.z_method, 'prefetch': args.prefetch}
+
+
+def selection_filters(args):
+    """Selection options given on the command line, as header index filters."""
+    return {name: getattr(args, name) for name in ('kind', 'detector', 'program', 'observation')
+            if getattr(args, name, None) is not None}
+
+
+def select_files(args):
+    """
+    FITS files of --data to analyze: all of them, or with selection options
+    the ones the header index matches (the index is brought up to date first).
+    """
+    filters = selection_filters(args)
+    if not filters:
+        return find_fits_files(args.data)
+    from header_index import HeaderIndex
+
+    with HeaderIndex(args.index) as index:
+        index.update(args.data, workers=getattr(args, 'workers', 1))
+        return index.select(args.data, **filters)
+
+
+def cache_from_args(args):
+    """SpectraCache configured by the add_ingest_arguments options (None if disabled)."""
+    if args.no_cache:
+        return None
+    return SpectraCache(args.cache_dir, max_bytes=int(args.cache_size_mb * 2**20),
+                        hash_content=args.cache_hash)
+
+
+def _extract_x1d(file, hdul):
+    # For x1d files, data is in EXTRACT1D extensions as tables
+    if not (len(hdul) > 1 and 'EXTRACT1D' in hdul[1].name):
+        return None, None, None, f"File {file}: No EXTRACT1D extension found"
+    data = hdul[1].data
+    if not (hasattr(data, 'dtype') and hasattr(data.dtype, 'names')):
+        return None, None, None, f"File {file}: Data is not in expected table format"
+    # Check if WAVELENGTH and FLUX columns exist
+    if 'WAVELENGTH' not in data.dtype.names or 'FLUX' not in data.dtype.names:
+        return None, None, None, f"File {file}: Missing WAVELENGTH or FLUX columns"
+    # FLUX_ERROR is optional; without it the uncertainty mode estimates the noise
+    error = data['FLUX_ERROR'] if 'FLUX_ERROR' in data.dtype.names else None
+    return data['WAVELENGTH'], data['FLUX'], error, None
+
+
+def _image_shape(hdu):
+    """(rows, columns) of a 2D image HDU, taken from its header without reading data."""
+    if hdu.header.get('NAXIS', 0) != 2:
+        return None
+    return hdu.header['NAXIS2'], hdu.header['NAXIS1']
+
+
+def read_s2d_rows(hdul, start, stop):
+    """
+    Read rows [start, stop) of the SCI and WAVELENGTH images of an s2d file.
+
+    Uses header-driven section reads on the memory-mapped file, so only the
+    requested rows are read from disk instead of both full 2D arrays.
+    """
+    return hdul[1].section[start:stop, :], hdul[3].section[start:stop, :]
+
+
+def _extract_s2d(file, hdul, window=0, method='row'):
+    # For s2d files, data is in SCI extensions as 2D arrays
+    if not (len(hdul) > 1 and 'SCI' in hdul[1].name):
+        return None, None, None, f"File {file}: No SCI extension found"
+    sci_shape = _image_shape(hdul[1])
+    has_wavelength = len(hdul) > 3 and 'WAVELENGTH' in hdul[3].name
+    if sci_shape is None or not has_wavelength or _image_shape(hdul[3]) != sci_shape:
+        return None, None, None, f"File {file}: No valid SCI or WAVELENGTH data"
+
+    if method == 'optimal':
+        # Profile-weighted extraction over all rows, using the ERR extension
+        from extraction import extract_s2d_optimal
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            wavelength_1d, flux_1d, variance_1d = extract_s2d_optimal(hdul)
+        return wavelength_1d, flux_1d, np.sqrt(variance_1d), None
+
+    # Take the middle row (or a window of rows around it) as a simple extraction
+    middle_row = sci_shape[0] // 2
+    start = max(0, middle_row - window)
+    stop = min(sci_shape[0], middle_row + window + 1)
+    sci_rows, wavelength_rows = read_s2d_rows(hdul, start, stop)
+    has_err = len(hdul) > 2 and 'ERR' in hdul[2].name and _image_shape(hdul[2]) == sci_shape
+    err_rows = hdul[2].section[start:stop, :] if has_err else None
+    if stop - start == 1:
+        return wavelength_rows[0], sci_rows[0], err_rows[0] if has_err else None, None
+
+    # Average the flux along the spatial axis of the window (all-NaN columns stay NaN)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        used = np.isfinite(sci_rows) & (sci_rows != 0)
+        flux_1d = np.nanmean(np.where(used, sci_rows, np.nan), axis=0)
+        error_1d = None
+        if has_err:
+            # Error of the mean of the rows that entered it
+            error_1d = np.sqrt(np.nansum(np.where(used, err_rows, 0.0) ** 2, axis=0)) / used.sum(axis=0)
+    return wavelength_rows[middle_row - start], flux_1d, error_1d, None
+
+
+def _data_bytes(hdul, kind, s2d_window=0, s2d_extract='row'):
+    """FITS data bytes an extraction reads: the EXTRACT1D table, or the rows used of SCI/ERR/WAVELENGTH."""
+    if kind == 'x1d':
+        return hdul[1].header.get('NAXIS1', 0) * hdul[1].header.get('NAXIS2', 0)
+    shape = _image_shape(hdul[1])
+    rows = shape[0] if s2d_extract == 'optimal' else min(shape[0], 2 * s2d_window + 1)
+    return sum(rows * shape[1] * abs(hdu.header.get('BITPIX', 0)) // 8
+               for hdu in hdul[1:4] if _image_shape(hdu) == shape)
+
+
+def process_file(full_path, lyman_rest=LYMAN_REST, s2d_window=0, info=False, s2d_extract='row', source=None):
+    """
+    Extract the spectrum of one FITS file and estimate its redshift.
+
+    `s2d_window` is the number of rows on each side of the middle row of an
+    s2d image that are averaged into the 1D spectrum (0 = middle row only);
+    with s2d_extract='optimal' s2d files use the optimal extraction instead.
+    With `info=True` the `hdul.info()` listing is captured from the same open.
+    `source` is the file already read by prefetch.read_ahead (None: open
+    `full_path`; .fits.gz and .fits.bz2 paths are decompressed by astropy,
+    bundle members are read from their bundle).
+
+    Returns a dict with 'File' (the name find_fits_files lists, so members
+    of different bundles stay apart), 'z_observed', 'wavelength', 'flux',
+    'flux_error' (None when the file has no error column/extension), 'info',
+    'message' and 'timings' (wall/CPU seconds of the open and extract steps
+    and the data bytes read, for metrics.py). When the file cannot be
+    analyzed 'z_observed' is None and 'message' holds the same text the
+    scripts used to print.
+    """
+    # Imported here so listing files and cache hits do not pay for astropy.io.fits
+    from astropy.io import fits
+
+    file = listing_name(full_path)
+    record = {'File': file, 'z_observed': None, 'wavelength': None, 'flux': None,
+              'flux_error': None, 'info': None, 'message': None}
+    timings = {}
+    hdul = None
+    try:
+        wall, cpu = time.perf_counter(), time.process_time()
+        hdul = fits.open(fits_source(full_path) if source is None else source, memmap=True)
+        timings['open'] = (time.perf_counter() - wall, time.process_time() - cpu)
+        wall, cpu = time.perf_counter(), time.process_time()
+
+        if info:
+            # Basic file info, from the same open as the analysis
+            listing = io.StringIO()
+            hdul.info(output=listing)
+            record['info'] = listing.getvalue()
+
+        # Check if it's an x1d (1D extracted spectrum) or s2d (2D spectral data) file
+        # Only the file's own name tells its kind (not the name of its bundle)
+        name = os.path.basename(full_path)
+        kind = product_kind(name) or product_kind(name, [hdu.name for hdu in hdul])
+        if kind == 'x1d':
+            wavelength, flux, error, message = _extract_x1d(file, hdul)
+        elif kind == 's2d':
+            wavelength, flux, error, message = _extract_s2d(file, hdul, s2d_window, s2d_extract)
+        else:
+            wavelength, flux, error, message = None, None, None, f"File {file}: Unknown file type (not x1d or s2d)"
+
+        if message is None:
+            timings['bytes_read'] = _data_bytes(hdul, kind, s2d_window, s2d_extract)
+
+            # Remove any NaN or invalid values
+            valid_mask = np.isfinite(wavelength) & np.isfinite(flux) & (flux != 0)
+            wavelength = np.array(wavelength[valid_mask])
+            flux = np.array(flux[valid_mask])
+
+            if len(wavelength) > 0:
+                # Calculate z from Lyman-alpha line (peak of the spectrum as a rough estimate)
+                lyman_obs = wavelength[np.argmax(flux)]
+                record['z_observed'] = float(lyman_obs / lyman_rest - 1)
+                record['wavelength'] = wavelength
+                record['flux'] = flux
+                if error is not None:
+                    record['flux_error'] = np.array(error[valid_mask], dtype=float)
+            else:
+                message = f"File {file}: No valid data points found"
+
+        record['message'] = message
+
+    except Exception as e:
+        record['message'] = f"Error processing {file}: {str(e)}"
+
+    finally:
+        if hdul is not None:
+            hdul.close()
+            timings['extract'] = (time.perf_counter() - wall, time.process_time() - cpu)
+
+    record['timings'] = timings
+    return record
+
+
+def _cache_params(lyman_rest=LYMAN_REST, s2d_window=0, s2d_extract='row'):
+    return {'lyman_rest': lyman_rest, 's2d_window': s2d_window, 's2d_extract': s2d_extract}
+
+
+def _cache_hit(cache, **params):
+    """Predicate telling read_ahead which paths the cache will serve (None without a cache)."""
+    if cache is None:
+        return None
+    params = _cache_params(**params)
+    return lambda path: cache.contains(cache.key(path, params))
+
+
+def load_record(full_path, cache=None, info=False, lyman_rest=LYMAN_REST, s2d_window=0,
+                s2d_extract='row', source=None):
+    """
+    `process_file` through the spectra cache: a hit returns the stored record
+    without opening the FITS file, a miss analyzes the file and stores it.
+    """
+    if cache is None:
+        return process_file(full_path, lyman_rest=lyman_rest, s2d_window=s2d_window, info=info,
+                            s2d_extract=s2d_extract, source=source)
+
+    key = cache.key(full_path, _cache_params(lyman_rest, s2d_window, s2d_extract))
+    record = cache.get(key)
+    if record is None or (info and record['info'] is None):
+        # Always keep the listing in the cache so jades.py can reuse the entry
+        record = process_file(full_path, lyman_rest=lyman_rest, s2d_window=s2d_window, info=True,
+                              s2d_extract=s2d_extract, source=source)
+        cache.put(key, record)
+    if not info:
+        record['info'] = None
+    return record
+
+
+def ingest(folder_path, fits_files, workers=1, s2d_window=0, info=False, cache=None,
+           z_method='template', s2d_extract='row', metrics=None, prefetch=READ_AHEAD):
+    """
+    Run `process_file` over `fits_files` and return the records in input order.
+
+    With workers > 1 the files are spread over a process pool; results are
+    still collected in the order of `fits_files`, never completion order.
+    A serial run reads the next `prefetch` files ahead on threads instead.
+    With a SpectraCache, unchanged files are served from the cache and the
+    cache is trimmed to its size limit at the end. With z_method='template'
+    the z of all spectra is then fitted in one batch (redshift.py). With a
+    metrics.RunMetrics, the records are counted and the z fit is timed.
+    """
+    paths = [os.path.join(folder_path, f) for f in fits_files]
+    worker = partial(load_record, cache=cache, info=info, s2d_window=s2d_window, s2d_extract=s2d_extract)
+    workers = resolve_workers(workers)
+    if workers == 1 or len(paths) < 2:
+        skip = _cache_hit(cache, s2d_window=s2d_window, s2d_extract=s2d_extract)
+        records = [worker(p, source=source) for p, source in read_ahead(paths, prefetch, skip)]
+    else:
+        chunksize = max(1, len(paths) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            records = list(pool.map(worker, paths, chunksize=chunksize))
+
+    if cache is not None:
+        cache.evict()
+    if metrics is not None:
+        metrics.add_records(records)
+    if z_method == 'template':
+        from redshift import estimate_redshifts
+
+        with metrics.stage('z') if metrics is not None else nullcontext():
+            estimate_redshifts(records)
+    return records
+
+
+def iter_ingest(folder_path, fits_files, workers=1, s2d_window=0, info=False, cache=None,
+                max_pending=None, s2d_extract='row', prefetch=READ_AHEAD):
+    """
+    Generator version of `ingest`: yields one record at a time, in input order.
+
+    At most `max_pending` files (default 4 per worker) are in flight, so
+    memory stays bounded however many files `fits_files` yields; a serial
+    run holds at most `prefetch` files read ahead.
+    """
+    worker = partial(load_record, cache=cache, info=info, s2d_window=s2d_window, s2d_extract=s2d_extract)
+    paths = (os.path.join(folder_path, f) for f in fits_files)
+    workers = resolve_workers(workers)
+    if workers == 1:
+        skip = _cache_hit(cache, s2d_window=s2d_window, s2d_extract=s2d_extract)
+        for path, source in read_ahead(paths, prefetch, skip):
+            yield worker(path, source=source)
+    else:
+        max_pending = max_pending or workers * 4
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for path in paths:
+                pending.append(pool.submit(worker, path))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    if cache is not None:
+        cache.evict()
@@ -0,0 +1,319 @@
+"""
+One command line for the analysis scripts.
+
+    python jades_cli.py list               FITS files of the data folder
+    python jades_cli.py index              update the header index and summarize it
+    python jades_cli.py info FILE...       hdul.info() of the given files
+    python jades_cli.py table              results table only (no figures)
+    python jades_cli.py stack              coadd all spectra on a common grid
+    python jades_cli.py compare            the model under several cosmologies (long table)
+    python jades_cli.py merge              combine the partial results of a --shard I/N run
+    python jades_cli.py watch              keep the results table up to date as files arrive
+    python jades_cli.py analyze ...        jades_z14_analysis.py
+    python jades_cli.py basic ...          jades.py
+    python jades_cli.py charts ...         generate_charts_from_fits.py
+    python jades_cli.py fit-k ...          fit_k.py
+
+Each subcommand imports only what it needs: `list` touches no FITS library
+(with selection options or --long it queries the header index, reading the
+headers of new or changed files only), `info` only astropy.io.fits, and
+`table` neither matplotlib nor astropy.cosmology (the distance/age tables
+come from the on-disk cache).
+The other subcommands hand their arguments to the script's main().
+"""
+import argparse
+import importlib
+import os
+import sys
+
+# Subcommands implemented by the scripts: name -> (module, description)
+SCRIPTS = {
+    'analyze': ('jades_z14_analysis', 'Spectra analysis with model comparison (jades_z14_analysis.py)'),
+    'basic': ('jades', 'Basic FITS file analysis (jades.py)'),
+    'charts': ('generate_charts_from_fits', 'Summary charts (generate_charts_from_fits.py)'),
+    'fit-k': ('fit_k', 'Grid sweep of the time delay constant k (fit_k.py)'),
+}
+
+# Cosmologies of `compare` when no --cosmology is given
+COSMOLOGIES = ('Planck18', 'Planck15', 'WMAP9')
+
+
+def list_files(args):
+    from ingest import find_fits_files, selection_filters
+
+    if not (args.long or selection_filters(args)):
+        fits_files = find_fits_files(args.data)
+        for file in fits_files:
+            print(file)
+        print(f"{len(fits_files)} FITS files in {args.data}/")
+        return
+
+    from header_index import HeaderIndex, describe_extensions
+
+    with HeaderIndex(args.index) as index:
+        index.update(args.data, workers=args.workers)
+        rows = index.rows(args.data, **selection_filters(args))
+    for row in rows:
+        if args.long:
+            print(f"{row['file']:<48} {row['kind'] or '-':<4} {row['detector'] or '-':<5} "
+                  f"{row['program'] or '-'}/{row['observation'] or '-'}/{row['visit'] or '-'}  "
+                  f"{describe_extensions(row)}")
+        else:
+            print(row['file'])
+        if row['error']:
+            print(row['error'])
+    print(f"{len(rows)} FITS files in {args.data}/")
+
+
+def update_index(args):
+    from header_index import HeaderIndex
+
+    with HeaderIndex(args.index) as index:
+        read, removed, unchanged = index.update(args.data, workers=args.workers)
+        print(f"Index {args.index}: {read} files read, {removed} removed, {unchanged} unchanged")
+        for column in ('kind', 'detector', 'program', 'observation'):
+            counts = ', '.join(f"{value}: {n}" for value, n in index.counts(args.data, column).items())
+            print(f"  {column}: {counts}")
+
+
+def file_info(args):
+    from astropy.io import fits
+    from archives import fits_source
+
+    for path in args.files:
+        try:
+            with fits.open(fits_source(path), memmap=True) as hdul:
+                print(f"\nFile {os.path.basename(path)}:")
+                hdul.info()
+        except Exception as e:
+            print(f"Error processing {path}: {str(e)}")
+
+
+def results_table(args):
+    from ingest import ingest_options, select_files
+    from metrics import metrics_from_args, write_metrics
+    from pipeline import stream_analysis
+
+    # Same table as jades_z14_analysis.py --stream, without the overlay plot
+    metrics = metrics_from_args(args).start()
+    summary = stream_analysis(args.data, output_csv=args.output, overlay_png=None, chunk_size=args.chunk_size,
+                              k=args.k, store=args.store, store_format=args.store_format, metrics=metrics,
+                              files=select_files(args), **ingest_options(args))
+    if summary.count:
+        print(f"\n{summary.count} rows saved to {args.output}")
+        print(f"Average z_observed = {summary.mean('z_observed'):.2f}, "
+              f"Average model z = {summary.mean('z_model'):.2f}")
+    else:
+        print("No valid results to save.")
+    write_metrics(metrics, args.metrics)
+
+
+def stack_spectra(args):
+    from ingest import ingest, ingest_options, select_files
+    from metrics import metrics_from_args, write_metrics
+    from resample import coadd, pixel_statistics, resample_records
+    import pandas as pd
+
+    metrics = metrics_from_args(args).start()
+    records = ingest(args.data, select_files(args), metrics=metrics, **ingest_options(args))
+    analyzed = [r for r in records if not r['message']]
+    for record in records:
+        if record['message']:
+            print(record['message'])
+    if not analyzed:
+        print("No valid spectra to stack.")
+        write_metrics(metrics, args.metrics)
+        return
+
+    # One dense (files, pixels) array, then every statistic is a single reduction over it
+    with metrics.stage('resample'):
+        spectra = resample_records(analyzed, n_pixels=args.pixels, frame=args.frame, log=not args.linear)
+    with metrics.stage('stack'):
+        stacked = coadd(spectra, weights=args.weights, method=args.method, normalize=args.normalize)
+        stats = pixel_statistics(spectra.normalized() if args.normalize else spectra)
+    with metrics.stage('write'):
+        table = pd.DataFrame({'wavelength_um': stacked['wavelength'], 'flux': stacked['flux'],
+                              'error': stacked['error'], 'n_spectra': stacked['n_spectra'],
+                              **{f"{name}_flux": stats[name] for name in ('mean', 'std', 'p16', 'p50', 'p84')}})
+        table.to_csv(args.output, index=False)
+    covered = stacked['n_spectra'] > 0
+    print(f"Stacked {len(spectra)} spectra ({args.frame} frame, {args.method}, {args.weights} weights) on "
+          f"{args.pixels} pixels, {stacked['wavelength'][covered].min():.4f}-"
+          f"{stacked['wavelength'][covered].max():.4f} um; saved to {args.output}")
+    write_metrics(metrics, args.metrics)
+
+
+def compare_cosmologies(args):
+    from cosmology_tables import compare_cosmologies, parse_cosmology
+    from metrics import metrics_from_args, write_metrics
+    import pandas as pd
+
+    try:
+        cosmologies = [parse_cosmology(spec) for spec in args.cosmology or COSMOLOGIES]
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        return 1
+    metrics = metrics_from_args(args).start()
+
+    # One z per file, from a saved results table or from the spectra (through the spectra cache)
+    if args.from_table:
+        from generate_charts_from_fits import load_results
+
+        try:
+            results = load_results(args.from_table)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Error reading {args.from_table}: {str(e)}")
+            return 1
+        files = results['File']
+        z_obs = results['z_observed']
+    else:
+        from ingest import ingest, ingest_options, select_files
+
+        records = ingest(args.data, select_files(args), metrics=metrics, **ingest_options(args))
+        for record in records:
+            if record['message']:
+                print(record['message'])
+        analyzed = [r for r in records if not r['message']]
+        files = [r['File'] for r in analyzed]
+        z_obs = [r['z_observed'] for r in analyzed]
+    if len(files) == 0:
+        print("No valid results to compare.")
+        write_metrics(metrics, args.metrics)
+        return
+
+    with metrics.stage('cosmology'):
+        table = pd.DataFrame(compare_cosmologies(files, z_obs, cosmologies, k=args.k))
+    with metrics.stage('write'):
+        table.to_csv(args.output, index=False)
+    print(f"{len(table)} rows ({len(files)} files x {len(cosmologies)} cosmologies) saved to {args.output}")
+    for name, group in table.groupby('Cosmology', sort=False):
+        print(f"{name}: Average ΛCDM age = {group['Age_ΛCDM_Gyr'].mean():.3f} Gyr, "
+              f"Average model age = {group['Age_Model_Gyr'].mean():.3f} Gyr, "
+              f"Average distance = {group['Distance_Mpc'].mean():.0f} Mpc")
+    write_metrics(metrics, args.metrics)
+
+
+def merge_results(args):
+    from sharding import SUMMARY_COLUMNS, merge_shards, std
+
+    try:
+        merged, stats, totals = merge_shards(args.output)
+    except ValueError as e:
+        print(f"Cannot merge {args.output}: {str(e)}")
+        return 1
+    counters = totals['counters']
+    print(f"Merged {totals['shards']} shards: {len(merged)} rows saved to {args.output} "
+          f"({counters.get('files', 0)} files, {counters.get('skipped', 0)} skipped)")
+    for category, n in sorted(totals['errors'].items()):
+        print(f"  {n} x {category}")
+    for name in SUMMARY_COLUMNS:
+        if name in stats and stats[name]['count']:
+            print(f"Average {name} = {stats[name]['mean']:.2f} (std {std(stats[name]):.2f}, "
+                  f"{stats[name]['min']:.2f}-{stats[name]['max']:.2f})")
+
+
+def watch_folder(args):
+    from watch import watch
+
+    watch(args)
+
+
+def build_parser():
+    from columnar import add_store_arguments
+    from cosmology_tables import FLAT_LCDM_PARAMETERS, NAMED_COSMOLOGIES
+    from ingest import INDEX_FILE, add_ingest_arguments, add_selection_arguments
+    from metrics import add_metrics_arguments
+    from model_fit import add_model_arguments
+    from pipeline import CHUNK_SIZE
+    from resample import add_resample_arguments
+    from watch import add_watch_arguments
+
+    parser = argparse.ArgumentParser(description='JADES-GS-z14-0 analysis commands')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    listing = commands.add_parser('list', help='List the FITS files of the data folder')
+    listing.add_argument('--data', default='data', help='Folder with FITS files')
+    listing.add_argument('--long', action='store_true',
+                         help='Also show product type, detector, program/observation/visit and extensions')
+    listing.add_argument('--workers', type=int, default=1, help='Processes reading headers for the index')
+    add_selection_arguments(listing)
+    listing.set_defaults(run=list_files)
+
+    indexing = commands.add_parser('index', help='Update the header index of the data folder')
+    indexing.add_argument('--data', default='data', help='Folder with FITS files')
+    indexing.add_argument('--workers', type=int, default=1, help='Processes reading headers (0 = all cores)')
+    indexing.add_argument('--index', default=INDEX_FILE, help='SQLite header index')
+    indexing.set_defaults(run=update_index)
+
+    info = commands.add_parser('info', help='Print the HDU listing of FITS files')
+    info.add_argument('files', nargs='+', help='FITS files')
+    info.set_defaults(run=file_info)
+
+    table = commands.add_parser('table', help='Write the results table without drawing any figure')
+    add_ingest_arguments(table)
+    add_model_arguments(table)
+    add_store_arguments(table)
+    add_metrics_arguments(table)
+    table.add_argument('--output', default='jades_results_table.csv', help='Results table CSV')
+    table.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows written to the CSV per chunk')
+    table.set_defaults(run=results_table)
+
+    stack = commands.add_parser('stack', help='Resample every spectrum onto a common grid and coadd them')
+    add_ingest_arguments(stack)
+    add_resample_arguments(stack)
+    add_metrics_arguments(stack)
+    stack.add_argument('--output', default='stacked_spectrum.csv',
+                       help='CSV with the stacked spectrum and per-pixel statistics')
+    stack.set_defaults(run=stack_spectra)
+
+    compare = commands.add_parser('compare', help='Evaluate the model for every file under several cosmologies')
+    add_ingest_arguments(compare)
+    add_model_arguments(compare)
+    add_metrics_arguments(compare)
+    compare.add_argument('--cosmology', action='append', metavar='NAME|H0=..,Om0=..',
+                         help=f"Cosmology to compare (repeatable): a name ({', '.join(NAMED_COSMOLOGIES)}) or "
+                              f"flat ΛCDM parameters ({', '.join(FLAT_LCDM_PARAMETERS)}); "
+                              f"default {', '.join(COSMOLOGIES)}")
+    compare.add_argument('--from-table', metavar='PATH',
+                         help='Take the z of every file from saved results (CSV or columnar store folder) '
+                              'instead of the spectra')
+    compare.add_argument('--output', default='jades_cosmology_comparison.csv',
+                         help='Long-format CSV, one row per file and cosmology')
+    compare.set_defaults(run=compare_cosmologies)
+
+    merge = commands.add_parser('merge', help='Combine the partial tables and statistics of a sharded run')
+    merge.add_argument('--output', default='jades_results_table.csv',
+                       help='Results table of the whole run (the shard files are found next to it)')
+    merge.set_defaults(run=merge_results)
+
+    watching = commands.add_parser('watch', help='Analyze new or modified FITS files as they arrive')
+    add_ingest_arguments(watching)
+    add_model_arguments(watching)
+    add_watch_arguments(watching)
+    watching.set_defaults(run=watch_folder)
+
+    for name, (_, description) in SCRIPTS.items():
+        # Options are parsed by the script itself
+        commands.add_parser(name, help=description, add_help=False)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    # Script subcommands: import the script only now and pass the remaining arguments on
+    if argv and argv[0] in SCRIPTS:
+        module = importlib.import_module(SCRIPTS[argv[0]][0])
+        sys.argv[0] = f"{os.path.basename(sys.argv[0])} {argv[0]}"
+        return module.main(argv[1:])
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,207 +1,178 @@
+import argparse
 import os
-from astropy.io import fits
-import matplotlib.pyplot as plt
 import numpy as np
-from astropy.cosmology import Planck18
-import astropy.units as u
-import pandas as pd
-
-# Step 1: Specify the folder path (use data directory)
-folder_path = 'data'  # Data directory with FITS files
-
-# Step 2: Find only FITS files in the folder
-fits_files = [f for f in os.listdir(folder_path) if f.endswith('.fits')]
-
-# Prepare a list to store results for table
-results = []
-
-# Step 3: Analyze each FITS file
-plt.figure(figsize=(12, 8))
-
-for file in fits_files:
-    try:
-        full_path = os.path.join(folder_path, file)
-        hdul = fits.open(full_path)
-        
-        # Check if it's an x1d file (1D extracted spectrum)
-        if 'x1d' in file:
-            # For x1d files, data is in EXTRACT1D extensions as tables
-            if len(hdul) > 1 and 'EXTRACT1D' in hdul[1].name:
-                data = hdul[1].data
-                if hasattr(data, 'dtype') and hasattr(data.dtype, 'names'):
-                    # Check if WAVELENGTH and FLUX columns exist
-                    if 'WAVELENGTH' in data.dtype.names and 'FLUX' in data.dtype.names:
-                        wavelength = data['WAVELENGTH']
-                        flux = data['FLUX']
-                        
-                        # Remove any NaN or invalid values
-                        valid_mask = np.isfinite(wavelength) & np.isfinite(flux) & (flux != 0)
-                        wavelength = wavelength[valid_mask]
-                        flux = flux[valid_mask]
-                        
-                        if len(wavelength) > 0:
-                            # Calculate z from Lyman-alpha line (approximate)
-                            lyman_rest = 0.1216  # microns (rest wavelength of Lyman-alpha)
-                            # Find the peak in the spectrum as a rough estimate
-                            peak_idx = np.argmax(flux)
-                            lyman_obs = wavelength[peak_idx]  # microns (observed wavelength)
-                            z_obs = (lyman_obs / lyman_rest) - 1
-                            
-                            # Calculate luminosity distance (x)
-                            distance = Planck18.luminosity_distance(z_obs)
-                            x_mpc = distance.to(u.Mpc).value
-                            x_m = distance.to(u.m).value
-                            
-                            # Calculate tau (from model: tau ≈ k * x / c)
-                            c = 3e8  # m/s (speed of light)
-                            k = 0.05  # Small constant (estimate; adjust to fit data)
-                            tau = k * x_m / c  # in seconds
-                            delta_z = tau * c / x_m  # Approximate delta_z
-                            
-                            # Model redshift (adjusted for delay)
-                            z_model = z_obs - delta_z
-                            
-                            # Age in ΛCDM for observed z
-                            age_lcdm_obs = Planck18.age(z_obs).value  # in Gyr
-                            
-                            # Age in model for adjusted z
-                            age_model = Planck18.age(z_model).value  # in Gyr (assuming same cosmology base)
-                            
-                            # Store results
-                            results.append({
-                                'File': file,
-                                'z_observed': z_obs,
-                                'z_model': z_model,
-                                'delta_z': delta_z,
-                                'Distance_Mpc': x_mpc,
-                                'Tau_s': tau,
-                                'Age_ΛCDM_Gyr': age_lcdm_obs,
-                                'Age_Model_Gyr': age_model
-                            })
-                            
-                            # Plot the spectrum
-                            plt.plot(wavelength, flux, label=f"{file} (z={z_obs:.2f})", alpha=0.7)
-                            
-                            print(f"File {file}: z_obs={z_obs:.2f}, z_model={z_model:.2f}, delta_z={delta_z:.2f}")
-                        else:
-                            print(f"File {file}: No valid data points found")
-                    else:
-                        print(f"File {file}: Missing WAVELENGTH or FLUX columns")
-                else:
-                    print(f"File {file}: Data is not in expected table format")
-            else:
-                print(f"File {file}: No EXTRACT1D extension found")
-        
-        # Check if it's an s2d file (2D spectral data)
-        elif 's2d' in file:
-            # For s2d files, data is in SCI extensions as 2D arrays
-            if len(hdul) > 1 and 'SCI' in hdul[1].name:
-                # Get the first SCI extension
-                sci_data = hdul[1].data
-                wavelength_data = hdul[3].data  # WAVELENGTH extension
-                
-                if sci_data is not None and wavelength_data is not None:
-                    # Extract a 1D spectrum by averaging along the spatial axis
-                    # Take the middle row as a simple extraction
-                    middle_row = sci_data.shape[0] // 2
-                    flux_1d = sci_data[middle_row, :]
-                    wavelength_1d = wavelength_data[middle_row, :]
-                    
-                    # Remove any NaN or invalid values
-                    valid_mask = np.isfinite(wavelength_1d) & np.isfinite(flux_1d) & (flux_1d != 0)
-                    wavelength_1d = wavelength_1d[valid_mask]
-                    flux_1d = flux_1d[valid_mask]
-                    
-                    if len(wavelength_1d) > 0:
-                        # Calculate z from Lyman-alpha line (approximate)
-                        lyman_rest = 0.1216  # microns
-                        peak_idx = np.argmax(flux_1d)
-                        lyman_obs = wavelength_1d[peak_idx]
-                        z_obs = (lyman_obs / lyman_rest) - 1
-                        
-                        # Calculate luminosity distance (x)
-                        distance = Planck18.luminosity_distance(z_obs)
-                        x_mpc = distance.to(u.Mpc).value
-                        x_m = distance.to(u.m).value
-                        
-                        # Calculate tau
-                        c = 3e8  # m/s
-                        k = 0.05
-                        tau = k * x_m / c
-                        delta_z = tau * c / x_m
-                        
-                        # Model redshift (adjusted for delay)
-                        z_model = z_obs - delta_z
-                        
-                        # Age in ΛCDM for observed z
-                        age_lcdm_obs = Planck18.age(z_obs).value  # in Gyr
-                        
-                        # Age in model for adjusted z
-                        age_model = Planck18.age(z_model).value  # in Gyr
-                        
-                        # Store results
-                        results.append({
-                            'File': file,
-                            'z_observed': z_obs,
-                            'z_model': z_model,
-                            'delta_z': delta_z,
-                            'Distance_Mpc': x_mpc,
-                            'Tau_s': tau,
-                            'Age_ΛCDM_Gyr': age_lcdm_obs,
-                            'Age_Model_Gyr': age_model
-                        })
-                        
-                        # Plot the spectrum
-                        plt.plot(wavelength_1d, flux_1d, label=f"{file} (z={z_obs:.2f})", alpha=0.7)
-                        
-                        print(f"File {file}: z_obs={z_obs:.2f}, z_model={z_model:.2f}, delta_z={delta_z:.2f}")
-                    else:
-                        print(f"File {file}: No valid data points found")
-                else:
-                    print(f"File {file}: No valid SCI or WAVELENGTH data")
-            else:
-                print(f"File {file}: No SCI extension found")
-        
-        else:
-            print(f"File {file}: Unknown file type (not x1d or s2d)")
-        
-        hdul.close()
-        
-    except Exception as e:
-        print(f"Error processing {file}: {str(e)}")
-        try:
-            hdul.close()
-        except:
-            pass
-
-# Step 4: Create table for article (save to CSV)
-if results:
-    df = pd.DataFrame(results)
-    df.to_csv('jades_results_table.csv', index=False)  # Save to CSV for article
-    print("\nTable saved to jades_results_table.csv")
-    print("\nResults Summary:")
-    print(df[['File', 'z_observed', 'z_model', 'delta_z', 'Age_ΛCDM_Gyr', 'Age_Model_Gyr']].head(10))
-    
-    # Comparison summary
-    if len(results) > 0:
-        avg_z_obs = np.mean([r['z_observed'] for r in results])
-        avg_z_model = np.mean([r['z_model'] for r in results])
-        avg_age_lcdm = np.mean([r['Age_ΛCDM_Gyr'] for r in results])
-        avg_age_model = np.mean([r['Age_Model_Gyr'] for r in results])
-        
+from charts import add_display_arguments, setup_display
+from columnar import ColumnarStore, add_store_arguments
+from cosmology_tables import get_tables, time_delay_model
+from plotting import spectra_overlay_figure
+from ingest import add_ingest_arguments, ingest, ingest_options, select_files
+from metrics import add_metrics_arguments, metrics_from_args, write_metrics
+from model_fit import add_model_arguments
+from pipeline import CHUNK_SIZE, stream_analysis
+from results import Results
+from sharding import RESULTS_FILE, add_shard_arguments, run_parameters, shard_files, shard_path, write_shard_summary
+from uncertainty import add_uncertainty_arguments, monte_carlo, percentile_columns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='JADES-GS-z14-0 spectra analysis with model comparison')
+    add_ingest_arguments(parser)
+    add_model_arguments(parser)
+    add_display_arguments(parser)
+    add_uncertainty_arguments(parser)
+    add_store_arguments(parser)
+    add_metrics_arguments(parser)
+    add_shard_arguments(parser)
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream files through the pipeline with bounded memory (density overlay plot)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='Rows written to the CSV per chunk in --stream mode')
+    args = parser.parse_args(argv)
+    if args.stream and args.mc_draws > 0:
+        # The percentiles need the spectra of every file at once, which --stream does not keep
+        parser.error('--mc-draws is not supported with --stream')
+    show = setup_display(args)
+    metrics = metrics_from_args(args).start()
+
+    # With --shard every output gets the shard in its name, so shards can share a folder
+    output_csv = shard_path(RESULTS_FILE, args.shard)
+    args.metrics = shard_path(args.metrics, args.shard)
+    if args.store:
+        args.store = shard_path(args.store, args.shard)
+
+    if args.stream:
+        stream_main(args, metrics, output_csv)
+        return
+
+    # Step 1: Specify the folder path (use data directory)
+    folder_path = args.data  # Data directory with FITS files
+
+    # Step 2: Find only FITS files in the folder (narrowed by --kind/--detector/... if given)
+    fits_files = select_files(args)
+    if args.shard:
+        fits_files = shard_files(fits_files, *args.shard)
+
+    # Step 3: Analyze each FITS file (records come back in fits_files order)
+    records = ingest(folder_path, fits_files, metrics=metrics, **ingest_options(args))
+
+    # Prepare a list of (file, z_obs) pairs; cosmology is evaluated in bulk below
+    observed = []
+    spectra = []
+    analyzed = []
+
+    for record in records:
+        if record['message']:
+            print(record['message'])
+            continue
+
+        file = record['File']
+        z_obs = record['z_observed']
+        observed.append((file, z_obs))
+        analyzed.append(record)
+
+        # Keep the spectrum for the overlay plot
+        spectra.append((file, z_obs, record['wavelength'], record['flux']))
+
+    # Step 4: Apply cosmology and the time delay model to all redshifts at once (one column per field)
+    results = Results()
+    if observed:
+        with metrics.stage('cosmology'):
+            model = time_delay_model([z for _, z in observed], k=args.k, tables=get_tables())
+        results = Results.from_columns([file for file, _ in observed], model)
+        for r in results:
+            print(f"File {r['File']}: z_obs={r['z_observed']:.2f}, z_model={r['z_model']:.2f}, delta_z={r['delta_z']:.2f}")
+
+    # Optional: Monte Carlo uncertainties, added to the table as percentile columns
+    if results and args.mc_draws > 0:
+        with metrics.stage('uncertainty'):
+            mc = monte_carlo(analyzed, n_draws=args.mc_draws, seed=args.mc_seed, z_method=args.z_method,
+                             k=args.k, tables=get_tables())
+        for name, column in percentile_columns(mc).items():
+            results.add_column(name, column)
+        print(f"\nMonte Carlo ({args.mc_draws} draws per spectrum), 16th-84th percentiles:")
+        for r in results:
+            print(f"File {r['File']}: z_obs={r['z_observed_p16']:.2f}-{r['z_observed_p84']:.2f}, "
+                  f"Age_Model={r['Age_Model_Gyr_p16']:.3f}-{r['Age_Model_Gyr_p84']:.3f} Gyr")
+
+    # Step 5: Create table for article (save to CSV)
+    if results:
+        with metrics.stage('write'):
+            df = results.to_frame()
+            df.to_csv(output_csv, index=False)  # Save to CSV for article
+        print(f"\nTable saved to {output_csv}")
+
+        # Optional: results and cleaned spectra in a columnar store for fast reloading
+        if args.store:
+            with metrics.stage('write'), ColumnarStore(args.store, args.store_format) as store:
+                store.write(results, analyzed)
+            print(f"Results and spectra saved to {args.store}/ ({args.store_format})")
+
+        print("\nResults Summary:")
+        print(df[['File', 'z_observed', 'z_model', 'delta_z', 'Age_ΛCDM_Gyr', 'Age_Model_Gyr']].head(10))
+
+        # Comparison summary
+        if len(results) > 0:
+            avg_z_obs = np.mean(results['z_observed'])
+            avg_z_model = np.mean(results['z_model'])
+            avg_age_lcdm = np.mean(results['Age_ΛCDM_Gyr'])
+            avg_age_model = np.mean(results['Age_Model_Gyr'])
+
+            print(f"\nComparison with ΛCDM:")
+            print(f"Average z_observed = {avg_z_obs:.2f}, Average ΛCDM age = {avg_age_lcdm:.2f} Gyr")
+            print(f"Average model z = {avg_z_model:.2f}, Average model age = {avg_age_model:.2f} Gyr")
+            print("Model shows older universe due to delay, fitting JWST early galaxies.")
+    else:
+        print("No valid results to save.")
+
+    if args.shard:
+        write_shard_summary(output_csv, args.shard, len(results), run_parameters(args), metrics.counters,
+                            metrics.errors)
+
+    # Save plot to PNG for article (all spectra in one decimated, rasterized layer)
+    if not (args.no_plot or args.shard):
+        with metrics.stage('plot'):
+            fig = spectra_overlay_figure(spectra, 'JADES-GS-z14-0 Spectra Analysis')
+            fig.savefig('images/jades_spectra_plot.png', dpi=300, bbox_inches='tight')  # Save to PNG
+    write_metrics(metrics, args.metrics)
+    if show:
+        import matplotlib.pyplot as plt
+
+        plt.show()
+
+
+def stream_main(args, metrics, output_csv=RESULTS_FILE):
+    # Discover, extract, apply cosmology and write rows chunk by chunk (a shard draws no overlay)
+    overlay_png = None if args.no_plot or args.shard else os.path.join('images', 'jades_spectra_plot.png')
+    files = select_files(args)
+    if args.shard:
+        files = shard_files(files, *args.shard)
+    summary = stream_analysis(args.data, output_csv=output_csv, chunk_size=args.chunk_size, k=args.k,
+                              store=args.store, store_format=args.store_format, metrics=metrics,
+                              overlay_png=overlay_png, files=files, **ingest_options(args))
+    if args.shard:
+        write_shard_summary(output_csv, args.shard, summary.count, run_parameters(args), metrics.counters,
+                            metrics.errors)
+
+    if summary.count:
+        import pandas as pd
+
+        print(f"\nTable saved to {output_csv}")
+        if args.store:
+            print(f"Results and spectra saved to {args.store}/ ({args.store_format})")
+        print("\nResults Summary:")
+        head = pd.DataFrame(summary.head)
+        print(head[['File', 'z_observed', 'z_model', 'delta_z', 'Age_ΛCDM_Gyr', 'Age_Model_Gyr']])
+
         print(f"\nComparison with ΛCDM:")
-        print(f"Average z_observed = {avg_z_obs:.2f}, Average ΛCDM age = {avg_age_lcdm:.2f} Gyr")
-        print(f"Average model z = {avg_z_model:.2f}, Average model age = {avg_age_model:.2f} Gyr")
+        print(f"Average z_observed = {summary.mean('z_observed'):.2f}, "
+              f"Average ΛCDM age = {summary.mean('Age_ΛCDM_Gyr'):.2f} Gyr")
+        print(f"Average model z = {summary.mean('z_model'):.2f}, "
+              f"Average model age = {summary.mean('Age_Model_Gyr'):.2f} Gyr")
         print("Model shows older universe due to delay, fitting JWST early galaxies.")
-else:
-    print("No valid results to save.")
-
-# Save plot to PNG for article
-plt.xlabel('Wavelength (microns)')
-plt.ylabel('Flux')
-plt.title('JADES-GS-z14-0 Spectra Analysis')
-plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-plt.tight_layout()
-plt.grid(True, alpha=0.3)
-plt.savefig('images/jades_spectra_plot.png', dpi=300, bbox_inches='tight')  # Save to PNG
-plt.show()
\ No newline at end of file
+    else:
+        print("No valid results to save.")
+    write_metrics(metrics, args.metrics)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Per-stage timing, throughput counters and the JSON metrics report of a run.
+
+Stages timed in the main process (z, cosmology, plot, write, ...) record
+wall and CPU time through `RunMetrics.stage`. Opening and extracting a file
+happen in process_file, possibly on a worker process, so each record
+carries its own open/extract timings and the FITS data bytes it read
+(headers excluded); `add_records` sums them. Cache hits carry no timings
+and are counted separately. Records that could not be analyzed are counted
+by error category (the message without the file name).
+
+With --profile the run is profiled with cProfile (stats saved next to the
+report, top functions included in it); with --trace-memory tracemalloc
+reports the peak traced memory and the top allocation sites.
+"""
+import json
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+METRICS_FILE = 'jades_metrics.json'
+
+# Functions / allocation sites listed in the report by --profile / --trace-memory
+TOP_ENTRIES = 15
+
+
+def add_metrics_arguments(parser):
+    """--metrics / --profile / --trace-memory options of the analysis scripts."""
+    parser.add_argument('--metrics', default=METRICS_FILE,
+                        help='JSON metrics report written at the end of the run')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile the run with cProfile (stats saved next to the metrics report)')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Trace Python allocations with tracemalloc and report the peak')
+
+
+def metrics_from_args(args):
+    return RunMetrics(profile=args.profile, trace_memory=args.trace_memory)
+
+
+def write_metrics(metrics, path=METRICS_FILE):
+    """Write the report of `metrics` to `path` and print a one-line summary."""
+    report = metrics.write(path)
+    counters = report['counters']
+    print(f"\nMetrics saved to {path}: {counters['files']} files in {report['wall_s']:.2f} s "
+          f"({counters['skipped']} skipped, {counters['cache_hits']} from cache)")
+    return report
+
+
+def error_category(message):
+    """Category of a record message: the text without the file name or exception details."""
+    if message.startswith('Error processing'):
+        return 'exception'
+    return re.sub(r'^File [^:]*: ', '', message)
+
+
+class RunMetrics:
+    """Timers and counters of one analysis run."""
+
+    def __init__(self, profile=False, trace_memory=False):
+        self.stages = {}
+        self.counters = {'files': 0, 'analyzed': 0, 'skipped': 0, 'cache_hits': 0, 'bytes_read': 0}
+        self.errors = {}
+        self.file_stages = {name: {'wall_s': 0.0, 'cpu_s': 0.0, 'files': 0} for name in ('open', 'extract')}
+        self._profiler = None
+        self._trace_memory = trace_memory
+        if profile:
+            import cProfile
+            self._profiler = cProfile.Profile()
+        self._start = None
+
+    def start(self):
+        self._start = (time.perf_counter(), time.process_time())
+        if self._trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+        if self._profiler is not None:
+            self._profiler.enable()
+        return self
+
+    @contextmanager
+    def stage(self, name):
+        """Add the wall and CPU time of the block to stage `name`."""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'wall_s': 0.0, 'cpu_s': 0.0, 'calls': 0})
+            entry['wall_s'] += time.perf_counter() - wall
+            entry['cpu_s'] += time.process_time() - cpu
+            entry['calls'] += 1
+
+    def add_records(self, records):
+        """Count files, skips, error categories, cache hits, bytes and per-file timings."""
+        for record in records:
+            self.counters['files'] += 1
+            if record['message']:
+                self.counters['skipped'] += 1
+                category = error_category(record['message'])
+                self.errors[category] = self.errors.get(category, 0) + 1
+            else:
+                self.counters['analyzed'] += 1
+            timings = record.get('timings')
+            if timings is None:
+                self.counters['cache_hits'] += 1
+                continue
+            for name in self.file_stages:
+                if name in timings:
+                    wall, cpu = timings[name]
+                    self.file_stages[name]['wall_s'] += wall
+                    self.file_stages[name]['cpu_s'] += cpu
+                    self.file_stages[name]['files'] += 1
+            self.counters['bytes_read'] += timings.get('bytes_read', 0)
+
+    def report(self):
+        """Metrics as a JSON-serializable dict."""
+        wall = time.perf_counter() - self._start[0] if self._start else 0.0
+        cpu = time.process_time() - self._start[1] if self._start else 0.0
+        report = {
+            'script': os.path.basename(sys.argv[0]),
+            'wall_s': wall,
+            'cpu_s': cpu,
+            'stages': self.stages,
+            # Summed over files; with --workers this is time spent on the worker processes
+            'file_stages': self.file_stages,
+            'counters': self.counters,
+            'throughput': {'files_per_s': self.counters['files'] / wall if wall > 0 else None,
+                           'bytes_read_per_s': self.counters['bytes_read'] / wall if wall > 0 else None},
+            'errors': self.errors,
+        }
+        if self._trace_memory:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics('lineno')[:TOP_ENTRIES]
+                report['memory'] = {'current_mb': current / 2**20, 'peak_mb': peak / 2**20,
+                                    'top': [{'site': str(s.traceback), 'mb': s.size / 2**20, 'blocks': s.count}
+                                            for s in top]}
+        return report
+
+    def write(self, path=METRICS_FILE):
+        """Stop the profilers and write the JSON report (and the cProfile stats) to `path`."""
+        report = self.report()
+        if self._profiler is not None:
+            import pstats
+            self._profiler.disable()
+            stats_path = os.path.splitext(path)[0] + '.prof'
+            self._profiler.dump_stats(stats_path)
+            stats = pstats.Stats(self._profiler)
+            top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_ENTRIES]
+            report['profile'] = {'stats_file': stats_path,
+                                 'top_cumulative': [{'function': f"{file}:{line}({name})", 'calls': nc,
+                                                     'tottime_s': tt, 'cumtime_s': ct}
+                                                    for (file, line, name), (_, nc, tt, ct, _) in top]}
+        if self._trace_memory:
+            import tracemalloc
+            tracemalloc.stop()
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            print(f"Could not write metrics report {path}: {str(e)}")
+        return report
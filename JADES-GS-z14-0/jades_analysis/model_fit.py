@@ -0,0 +1,130 @@
+"""
+Grid sweep and best fit of the time delay constant k.
+
+The per-file redshifts do not depend on k, so exploring the model never
+needs the FITS files: the z_observed column of jades_results_table.csv (or
+the cached records of an ingest run) is evaluated over a whole grid of k
+values in a single time_delay_model call with k broadcast against z. The
+distances and ΛCDM ages are computed once per file; only tau, delta_z,
+z_model and Age_Model_Gyr take the (n_k, n_files) shape.
+
+Each objective turns the grid into a cost per k value (a chi-square when
+the table has Monte Carlo percentile columns to weight by, otherwise a
+plain sum of squares), and the best fit is the minimum of that curve.
+"""
+import numpy as np
+
+from cosmology_tables import K_DEFAULT, get_tables, time_delay_model
+
+# Default k grid of the sweep
+K_MIN = 0.0
+K_MAX = 1.0
+K_STEPS = 201
+
+# Columns of the time delay model that depend on k
+K_COLUMNS = ['z_model', 'delta_z', 'Tau_s', 'Age_Model_Gyr']
+
+
+def add_model_arguments(parser):
+    """--k option of the scripts that evaluate the time delay model."""
+    parser.add_argument('--k', type=float, default=K_DEFAULT,
+                        help=f'Time delay constant k of the model (default {K_DEFAULT})')
+
+
+def k_grid(k_min=K_MIN, k_max=K_MAX, steps=K_STEPS):
+    return np.linspace(k_min, k_max, steps)
+
+
+def load_redshifts(table='jades_results_table.csv'):
+    """
+    Per-file inputs of the sweep from a results table written by the analysis scripts.
+
+    Returns a DataFrame with File, z_observed and whatever reference or
+    percentile columns the table has; rows without a finite z are dropped.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(table)
+    if 'z_observed' not in df.columns:
+        raise ValueError(f"{table} has no z_observed column")
+    return df[np.isfinite(df['z_observed'].to_numpy(dtype=float))].reset_index(drop=True)
+
+
+def sweep_k(z_obs, k_values, tables=None):
+    """
+    Evaluate the time delay model for every (k, file) pair in one pass.
+
+    Returns {'k': (n_k,), column: (n_files,) or (n_k, n_files)}; the
+    columns in K_COLUMNS are the ones that vary along the grid.
+    """
+    k_values = np.asarray(k_values, dtype=float)
+    model = time_delay_model(np.asarray(z_obs, dtype=float), k=k_values[:, None], tables=tables)
+    grid = {'k': k_values}
+    for name, column in model.items():
+        grid[name] = np.broadcast_to(column, (len(k_values), len(z_obs))) if name in K_COLUMNS else column
+    return grid
+
+
+def _sigma(data, column):
+    """Half the 16-84 percentile range of `column` if the table has it, else ones."""
+    low, high = f"{column}_p16", f"{column}_p84"
+    if low in data and high in data:
+        sigma = (np.asarray(data[high], dtype=float) - np.asarray(data[low], dtype=float)) / 2
+        if np.all(np.isfinite(sigma) & (sigma > 0)):
+            return sigma
+    return np.ones(len(data['z_observed']))
+
+
+def age_objective(grid, data, target_age):
+    """Squared deviation of Age_Model_Gyr from `target_age` Gyr (scalar or per file)."""
+    residual = (grid['Age_Model_Gyr'] - np.asarray(target_age, dtype=float)) / _sigma(data, 'Age_Model_Gyr')
+    return np.nansum(residual ** 2, axis=1)
+
+
+def redshift_objective(grid, data, reference_column):
+    """Squared deviation of z_model from the reference redshifts in `reference_column`."""
+    reference = np.asarray(data[reference_column], dtype=float)
+    residual = (grid['z_model'] - reference) / _sigma(data, 'z_observed')
+    return np.nansum(residual ** 2, axis=1)
+
+
+OBJECTIVES = {'age': age_objective, 'redshift': redshift_objective}
+
+
+def fit_k(data, k_values=None, objective='age', tables=None, **objective_options):
+    """
+    Sweep `k_values` over the files of `data` and pick the k minimizing `objective`.
+
+    `data` is a mapping with a z_observed column (e.g. the DataFrame of
+    load_redshifts) plus whatever the objective needs (`target_age` for
+    'age', `reference_column` for 'redshift'). Returns (grid, best) where
+    best holds k, cost and the model columns at that k.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective {objective!r} (choose from {', '.join(OBJECTIVES)})")
+    if k_values is None:
+        k_values = k_grid()
+    if tables is None:
+        tables = get_tables()
+
+    grid = sweep_k(np.asarray(data['z_observed'], dtype=float), k_values, tables)
+    grid['cost'] = OBJECTIVES[objective](grid, data, **objective_options)
+
+    i = int(np.nanargmin(grid['cost']))
+    best = {'k': float(grid['k'][i]), 'cost': float(grid['cost'][i]), 'index': i,
+            'on_edge': i in (0, len(grid['k']) - 1)}
+    for name in K_COLUMNS:
+        best[name] = grid[name][i]
+    return grid, best
+
+
+def grid_table(grid):
+    """One row per k value: cost and the mean of each k-dependent column over the files."""
+    import pandas as pd
+
+    columns = {'k': grid['k']}
+    if 'cost' in grid:
+        columns['cost'] = grid['cost']
+    for name in K_COLUMNS:
+        columns[f"mean_{name}"] = np.nanmean(grid[name], axis=1)
+    return pd.DataFrame(columns)
@@ -0,0 +1,247 @@
+"""
+Streaming analysis pipeline with bounded memory.
+
+The batch scripts keep every spectrum on one matplotlib figure and every
+result in a list before writing the CSV, so memory grows with the number of
+files. Here files flow through generator stages instead:
+
+    discover -> open/extract/estimate z -> apply cosmology -> write rows
+
+Results are appended to the CSV one chunk at a time, summary statistics are
+kept as running sums and the spectra overlay is accumulated into a
+fixed-size density image, so peak memory does not depend on the number of
+files.
+"""
+import os
+from contextlib import nullcontext
+
+import numpy as np
+
+from cosmology_tables import K_DEFAULT, get_tables, time_delay_model
+from ingest import find_fits_files, iter_ingest
+from results import COLUMNS
+
+CHUNK_SIZE = 1000
+
+
+def discover(folder_path):
+    """Stage 1: FITS file names in the data folder."""
+    yield from find_fits_files(folder_path)
+
+
+def extract(folder_path, files, **ingest_options):
+    """Stages 2-4: open each file, extract the spectrum and estimate z (one record each)."""
+    yield from iter_ingest(folder_path, files, **ingest_options)
+
+
+def apply_cosmology(records, chunk_size=CHUNK_SIZE, k=K_DEFAULT, tables=None, report=print,
+                    z_method='template', metrics=None):
+    """
+    Stage 5: group the analyzable records into chunks, fit their redshifts
+    (z_method='template') and evaluate the time delay model for each chunk
+    in one call.
+
+    Yields (records, rows) per chunk; records that could not be analyzed are
+    passed to `report` and dropped. With a metrics.RunMetrics every record is
+    counted and the z fit and cosmology of each chunk are timed.
+    """
+    if tables is None:
+        tables = get_tables()
+    chunk = []
+    for record in records:
+        if metrics is not None:
+            metrics.add_records([record])
+        if record['message']:
+            report(record['message'])
+            continue
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk, _model_rows(chunk, k, tables, z_method, metrics)
+            chunk = []
+    if chunk:
+        yield chunk, _model_rows(chunk, k, tables, z_method, metrics)
+
+
+def _model_rows(chunk, k, tables, z_method='template', metrics=None):
+    stage = metrics.stage if metrics is not None else lambda name: nullcontext()
+    if z_method == 'template':
+        from redshift import estimate_redshifts
+
+        with stage('z'):
+            estimate_redshifts(chunk)
+    with stage('cosmology'):
+        model = time_delay_model([r['z_observed'] for r in chunk], k=k, tables=tables)
+    return [{'File': r['File'], **{name: float(column[i]) for name, column in model.items()}}
+            for i, r in enumerate(chunk)]
+
+
+class ChunkedCsvWriter:
+    """Append result rows to a CSV file one chunk at a time."""
+
+    def __init__(self, path, columns=COLUMNS):
+        self.path = path
+        self.columns = columns
+        self.rows_written = 0
+        self._file = None
+
+    def write(self, rows):
+        import pandas as pd
+
+        if self._file is None:
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+        pd.DataFrame(rows, columns=self.columns).to_csv(self._file, header=self.rows_written == 0,
+                                                        index=False)
+        self._file.flush()
+        self.rows_written += len(rows)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RunningSummary:
+    """Means of the results table columns from running sums, plus the first rows for display."""
+
+    def __init__(self, head_size=10):
+        self.count = 0
+        self.sums = {}
+        self.head = []
+        self.head_size = head_size
+
+    def update(self, rows):
+        for name in COLUMNS[1:]:
+            self.sums[name] = self.sums.get(name, 0.0) + sum(r[name] for r in rows)
+        self.count += len(rows)
+        if len(self.head) < self.head_size:
+            self.head.extend(rows[:self.head_size - len(self.head)])
+
+    def remove(self, rows):
+        """Take rows added earlier out of the sums (e.g. results replaced in watch mode)."""
+        for name in COLUMNS[1:]:
+            self.sums[name] = self.sums.get(name, 0.0) - sum(r[name] for r in rows)
+        self.count -= len(rows)
+        files = {r['File'] for r in rows}
+        self.head = [r for r in self.head if r['File'] not in files]
+
+    def mean(self, name):
+        return self.sums[name] / self.count if self.count else float('nan')
+
+
+class OverlayAccumulator:
+    """
+    Density image of every spectrum on a fixed (flux, wavelength) pixel grid.
+
+    The axis ranges start at the first spectrum and double toward whichever
+    side a later spectrum exceeds; the existing counts are merged pairwise
+    into the wider bins, so the image never needs the earlier spectra again.
+    """
+
+    def __init__(self, n_wavelength=1024, n_flux=512):
+        self.counts = np.zeros((n_flux, n_wavelength), dtype=np.float64)
+        self.ranges = [None, None]  # [flux range, wavelength range]
+        self.limits = [None, None]  # data min/max per axis, used to crop the rendered image
+        self.n_spectra = 0
+
+    def _fit_axis(self, axis, values):
+        lo, hi = float(np.min(values)), float(np.max(values))
+        if self.limits[axis] is None:
+            self.limits[axis] = [lo, hi]
+        else:
+            self.limits[axis] = [min(lo, self.limits[axis][0]), max(hi, self.limits[axis][1])]
+        if self.ranges[axis] is None:
+            # Start with a 5% margin so rounding in later spectra does not double the range
+            pad = 0.05 * (hi - lo) or abs(lo) * 1e-3 or 1e-3
+            self.ranges[axis] = [lo - pad, hi + pad]
+            return
+        range_lo, range_hi = self.ranges[axis]
+        while lo < range_lo or hi > range_hi:
+            width = range_hi - range_lo
+            merged = np.add.reduceat(self.counts, np.arange(0, self.counts.shape[axis], 2), axis=axis)
+            self.counts = np.zeros_like(self.counts)
+            half = merged.shape[axis]
+            if hi > range_hi:
+                # Grow to the right: old bins fill the lower half
+                index = (slice(None),) * axis + (slice(0, half),)
+                range_hi = range_lo + 2 * width
+            else:
+                # Grow to the left: old bins fill the upper half
+                index = (slice(None),) * axis + (slice(self.counts.shape[axis] - half, None),)
+                range_lo = range_hi - 2 * width
+            self.counts[index] = merged
+        self.ranges[axis] = [range_lo, range_hi]
+
+    def add(self, wavelength, flux):
+        self._fit_axis(0, flux)
+        self._fit_axis(1, wavelength)
+        hist, _, _ = np.histogram2d(flux, wavelength, bins=self.counts.shape,
+                                    range=[self.ranges[0], self.ranges[1]])
+        self.counts += hist
+        self.n_spectra += 1
+
+    def save(self, path, title='JADES-GS-z14-0 Spectra Analysis'):
+        import matplotlib.pyplot as plt
+
+        fig, ax = plt.subplots(figsize=(12, 8))
+        if self.n_spectra:
+            extent = [*self.ranges[1], *self.ranges[0]]
+            image = ax.imshow(np.log1p(self.counts), origin='lower', aspect='auto', extent=extent,
+                              cmap='viridis', interpolation='nearest')
+            fig.colorbar(image, ax=ax, label='log(1 + samples per pixel)')
+            ax.set_xlim(*self.limits[1])
+            ax.set_ylim(*self.limits[0])
+        ax.set_xlabel('Wavelength (microns)')
+        ax.set_ylabel('Flux')
+        ax.set_title(f'{title} ({self.n_spectra} spectra)')
+        fig.tight_layout()
+        fig.savefig(path, dpi=300, bbox_inches='tight')
+        plt.close(fig)
+
+
+def stream_analysis(folder_path, output_csv='jades_results_table.csv',
+                    overlay_png=os.path.join('images', 'jades_spectra_plot.png'),
+                    chunk_size=CHUNK_SIZE, k=K_DEFAULT, report=print, z_method='template',
+                    store=None, store_format='arrow', metrics=None, files=None, **ingest_options):
+    """
+    Run the whole analysis as a stream and return the RunningSummary.
+
+    With `store` (a folder), each chunk of rows and spectra is also appended
+    to a columnar store (see columnar.py). With a metrics.RunMetrics the
+    stages are timed. `files` limits the run to those files of the folder
+    (default: all of them). `ingest_options` are passed to ingest.iter_ingest
+    (workers, cache, ...).
+    """
+    stage = metrics.stage if metrics is not None else lambda name: nullcontext()
+    writer = ChunkedCsvWriter(output_csv)
+    if store is not None:
+        from columnar import ColumnarStore
+        store = ColumnarStore(store, store_format)
+    summary = RunningSummary()
+    overlay = OverlayAccumulator() if overlay_png else None
+
+    records = extract(folder_path, discover(folder_path) if files is None else iter(files), **ingest_options)
+    try:
+        for chunk, rows in apply_cosmology(records, chunk_size=chunk_size, k=k, report=report,
+                                           z_method=z_method, metrics=metrics):
+            # Stage 6: write the rows and fold the chunk into the summary and overlay
+            with stage('write'):
+                writer.write(rows)
+                if store is not None:
+                    store.write(rows, chunk)
+            summary.update(rows)
+            if overlay is not None:
+                with stage('plot'):
+                    for record in chunk:
+                        overlay.add(record['wavelength'], record['flux'])
+            for r in rows:
+                report(f"File {r['File']}: z_obs={r['z_observed']:.2f}, z_model={r['z_model']:.2f}, "
+                       f"delta_z={r['delta_z']:.2f}")
+    finally:
+        writer.close()
+        if store is not None:
+            store.close()
+
+    if overlay is not None:
+        with stage('plot'):
+            overlay.save(overlay_png)
+    return summary
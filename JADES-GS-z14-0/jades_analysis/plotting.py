@@ -0,0 +1,147 @@
+"""
+Fast rendering of the spectra overlay (jades_spectra_plot.png).
+
+Calling plt.plot once per file with a legend entry each gets slow and
+unreadable with hundreds of spectra; even a single LineCollection spends
+most of its time in Agg stroking thousands of noisy segments. Instead every
+spectrum is decimated to the pixel columns of the axes, keeping the minimum
+and maximum of each column (plus the join to the previous column) so peaks
+such as Lyman-alpha survive. Those [min, max] spans of all spectra are
+summed into one raster layer coloured by the mean z_observed of the spectra
+crossing each pixel, so the cost depends on the number of output pixels,
+not on the number of samples.
+"""
+import numpy as np
+
+# Above this many spectra the per-file legend is replaced by a z colorbar
+LEGEND_MAX = 15
+
+# Opacity of a single spectrum, as in the original plt.plot(..., alpha=0.7)
+LINE_ALPHA = 0.7
+
+
+def _column_spans(wavelength, flux, x_range, y_range, width_px, height_px):
+    """Pixel columns and [low, high] pixel rows a spectrum covers, one entry per column."""
+    wavelength = np.asarray(wavelength, dtype=float)
+    flux = np.asarray(flux, dtype=float)
+    if np.any(np.diff(wavelength) < 0):
+        order = np.argsort(wavelength, kind='stable')
+        wavelength, flux = wavelength[order], flux[order]
+
+    x_lo, x_hi = x_range
+    y_lo, y_hi = y_range
+    column = np.clip(((wavelength - x_lo) * (width_px / (x_hi - x_lo))).astype(np.int64), 0, width_px - 1)
+
+    # Add one interpolated sample at every column center the spectrum passes
+    # over, so sparse spectra are drawn as continuous lines like plt.plot does
+    centers = np.arange(column[0], column[-1] + 1)
+    center_wavelength = x_lo + (centers + 0.5) * (x_hi - x_lo) / width_px
+    inside = (center_wavelength >= wavelength[0]) & (center_wavelength <= wavelength[-1])
+    centers = centers[inside]
+    flux = np.concatenate([flux, np.interp(center_wavelength[inside], wavelength, flux)])
+    wavelength = np.concatenate([wavelength, center_wavelength[inside]])
+    column = np.concatenate([column, centers])
+    order = np.argsort(wavelength, kind='stable')
+    column, flux = column[order], flux[order]
+
+    row = np.clip(np.rint((flux - y_lo) * ((height_px - 1) / (y_hi - y_lo))).astype(np.int64),
+                  0, height_px - 1)
+    starts = np.flatnonzero(np.r_[True, column[1:] != column[:-1]])
+    low = np.minimum.reduceat(row, starts)
+    high = np.maximum.reduceat(row, starts)
+
+    # Extend each column to the last sample of the previous one so steep segments stay connected
+    last = row[np.r_[starts[1:], len(row)] - 1]
+    low[1:] = np.minimum(low[1:], last[:-1])
+    high[1:] = np.maximum(high[1:], last[:-1])
+    return column[starts], low, high
+
+
+def rasterize_spectra(spectra, x_range, y_range, width_px, height_px, line_px=1):
+    """
+    Rasterize (file, z, wavelength, flux) spectra into per-pixel counts and z sums.
+
+    Each spectrum marks the rows between its minimum and maximum in every
+    pixel column (widened by `line_px` rows); marks are accumulated with a
+    difference array, so the cost per spectrum is one pass over its samples
+    plus one entry per column.
+    """
+    counts = np.zeros((height_px + 1, width_px), dtype=np.float32)
+    z_sums = np.zeros((height_px + 1, width_px), dtype=np.float32)
+    for _, z, wavelength, flux in spectra:
+        columns, low, high = _column_spans(wavelength, flux, x_range, y_range, width_px, height_px)
+        low = np.maximum(low - line_px, 0)
+        high = np.minimum(high + line_px, height_px - 1)
+        counts[low, columns] += 1
+        counts[high + 1, columns] -= 1
+        z_sums[low, columns] += z
+        z_sums[high + 1, columns] -= z
+    return np.cumsum(counts, axis=0)[:-1], np.cumsum(z_sums, axis=0)[:-1]
+
+
+def _data_limits(spectra):
+    x_lo = min(float(np.min(w)) for _, _, w, _ in spectra)
+    x_hi = max(float(np.max(w)) for _, _, w, _ in spectra)
+    y_lo = min(float(np.min(f)) for _, _, _, f in spectra)
+    y_hi = max(float(np.max(f)) for _, _, _, f in spectra)
+    # Same 5% margins matplotlib's autoscale would add
+    x_pad = 0.05 * (x_hi - x_lo) or 1e-3
+    y_pad = 0.05 * (y_hi - y_lo) or abs(y_lo) * 0.05 or 1e-3
+    return (x_lo - x_pad, x_hi + x_pad), (y_lo - y_pad, y_hi + y_pad)
+
+
+def _draw_legend(ax, spectra, norm, cmap):
+    from matplotlib.lines import Line2D
+
+    handles = [Line2D([], [], color=cmap(norm(z)), alpha=LINE_ALPHA, label=f"{file} (z={z:.2f})")
+               for file, z, _, _ in spectra]
+    ax.legend(handles=handles, bbox_to_anchor=(1.05, 1), loc='upper left')
+
+
+def _draw_raster(ax, spectra, norm, cmap):
+    x_range, y_range = _data_limits(spectra)
+    ax.set_xlim(*x_range)
+    ax.set_ylim(*y_range)
+
+    # Size the raster to the axes area in device pixels
+    bbox = ax.get_window_extent()
+    width_px = max(int(round(bbox.width)), 1)
+    height_px = max(int(round(bbox.height)), 1)
+    counts, z_sums = rasterize_spectra(spectra, x_range, y_range, width_px, height_px)
+
+    covered = counts > 0
+    image = np.zeros(counts.shape + (4,), dtype=np.float32)
+    image[covered] = cmap(norm(z_sums[covered] / counts[covered]))
+    # Overlapping spectra build up opacity like stacked alpha=0.7 lines
+    image[..., 3] = np.where(covered, 1 - (1 - LINE_ALPHA) ** counts, 0)
+    ax.imshow(image, origin='lower', aspect='auto', interpolation='nearest',
+              extent=[*x_range, *y_range], rasterized=True)
+
+
+def spectra_overlay_figure(spectra, title, figsize=(12, 8), dpi=300, cmap='viridis'):
+    """Figure with all (file, z, wavelength, flux) spectra, drawn at `dpi`."""
+    import matplotlib.pyplot as plt
+    from matplotlib.cm import ScalarMappable
+    from matplotlib.colors import Normalize
+
+    fig, ax = plt.subplots(figsize=figsize, dpi=dpi)
+    ax.set_xlabel('Wavelength (microns)')
+    ax.set_ylabel('Flux')
+    ax.set_title(title)
+    ax.grid(True, alpha=0.3)
+    if not spectra:
+        fig.tight_layout()
+        return fig
+
+    z_values = [z for _, z, _, _ in spectra]
+    norm = Normalize(min(z_values), max(z_values))
+    cmap = plt.get_cmap(cmap)
+    if len(spectra) <= LEGEND_MAX:
+        _draw_legend(ax, spectra, norm, cmap)
+    else:
+        fig.colorbar(ScalarMappable(norm=norm, cmap=cmap), ax=ax, label='z_observed')
+
+    # Lay the figure out first so the raster can match the final axes size
+    fig.tight_layout()
+    _draw_raster(ax, spectra, norm, cmap)
+    return fig
@@ -0,0 +1,95 @@
+"""
+Compressed FITS inputs and read-ahead of the next files on background threads.
+
+Archive products often come as .fits.gz (or .fits.bz2); astropy opens them
+directly but has to decompress the whole file in the calling thread, so the
+analysis stalls on every file. `read_ahead` instead decompresses the next
+`depth` files on a thread pool (zlib and bz2 release the GIL) while the
+current one is analyzed, and hands each one over as an in-memory file.
+Plain .fits files are still opened by path with memmap and section reads;
+for x1d tables, which are read whole, the kernel is only asked to start
+reading them early (posix_fadvise, where available). At most `depth` files
+are held in memory at once.
+
+Tile-compressed .fits.fz files need no decompression up front: astropy
+decompresses only the tiles that are read. Members of tar/zip bundles
+(archives.py) are read out of their bundle on the same threads.
+"""
+import bz2
+import gzip
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+
+# File name endings recognized as FITS products
+FITS_SUFFIXES = ('.fits', '.fits.gz', '.fits.bz2', '.fits.fz')
+
+# Stream-compressed variants, decompressed on the read-ahead threads
+DECOMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open}
+
+# Default number of files read ahead of the one being analyzed
+READ_AHEAD = 2
+
+
+def is_fits(name):
+    return name.lower().endswith(FITS_SUFFIXES)
+
+
+def fetch(path):
+    """
+    Read `path` ahead of its analysis: the decompressed contents of a
+    .gz/.bz2 file or of a bundle member as a BytesIO, or None for a plain
+    file (opened by path).
+    """
+    from archives import read_member, split_member
+
+    if split_member(path)[1] is not None:
+        return read_member(path)
+    extension = os.path.splitext(path.lower())[1]
+    if extension in DECOMPRESSORS:
+        with DECOMPRESSORS[extension](path, 'rb') as f:
+            return io.BytesIO(f.read())
+    if 'x1d' in os.path.basename(path).lower() and hasattr(os, 'posix_fadvise'):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    return None
+
+
+def _fetch_quietly(path):
+    # Read errors are reported by process_file when it opens the path itself
+    try:
+        return fetch(path)
+    except (OSError, KeyError, EOFError):
+        return None
+
+
+def read_ahead(paths, depth=READ_AHEAD, skip=None):
+    """
+    Yield (path, source) for `paths` in order, with the next `depth` files
+    fetched on background threads. `source` is what `fetch` returned (None:
+    open the path). Paths for which `skip(path)` is true (e.g. spectra cache
+    hits) are passed through unread.
+    """
+    if depth <= 0:
+        for path in paths:
+            yield path, None
+        return
+    from archives import split_member
+
+    # Bundle members are read on one thread, in order: a compressed tar is only fast to read forward
+    with ThreadPoolExecutor(max_workers=depth) as pool, ThreadPoolExecutor(max_workers=1) as members:
+        pending = deque()
+        for path in paths:
+            executor = members if split_member(path)[1] is not None else pool
+            future = None if skip is not None and skip(path) else executor.submit(_fetch_quietly, path)
+            pending.append((path, future))
+            if len(pending) > depth:
+                path, future = pending.popleft()
+                yield path, future.result() if future is not None else None
+        while pending:
+            path, future = pending.popleft()
+            yield path, future.result() if future is not None else None
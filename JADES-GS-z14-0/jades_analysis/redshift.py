@@ -0,0 +1,391 @@
+"""
+Batched template cross-correlation redshift engine.
+
+The original estimate, z = wavelength[argmax(flux)] / 0.1216 - 1, looks at a
+single pixel, so one hot pixel decides the redshift. Here every spectrum is
+compared with a set of rest-frame templates over a fine z grid:
+
+- isolated one-pixel spikes are rejected and each spectrum is rebinned onto
+  a common grid uniform in ln(wavelength), where redshifting a template is a
+  plain shift by ln(1 + z);
+- for every template and every z the model a * template + b (a >= 0, b a
+  free continuum offset) is fitted by weighted least squares; the break and
+  line template has one amplitude per component. All the sums this needs
+  are cross-correlations of the spectra with the templates, so a whole
+  batch of spectra is handled by a few FFTs;
+- the best z is the chi-square minimum over templates, refined to a fraction
+  of a grid step with a parabola through the neighbouring points.
+
+`fit_redshifts` returns the best z, the chi-square curve and a confidence
+(the fraction of exp(-chi2 / 2) within `CONFIDENCE_WINDOW` of the best z)
+for each spectrum.
+"""
+import numpy as np
+from scipy import fft
+
+# Rest wavelength of Lyman-alpha (microns)
+LYMAN_REST = 0.1216
+
+C_KMS = 299792.458
+
+# Grid step in ln(wavelength), i.e. ln(1 + z): 5e-4 is ~150 km/s
+LOG_STEP = 5e-4
+
+# Half-width in ln(1 + z) of the peak used for the confidence and delta_chi2
+CONFIDENCE_WINDOW = 0.01
+
+# Spectra per FFT batch (bounds the memory of the correlation arrays)
+BATCH_SIZE = 256
+
+# Samples more than this many sigma above (or below) both neighbours are
+# treated as hot (or cold) pixels and ignored
+SPIKE_SIGMA = 5.0
+
+
+def _gaussian(ln_rest, sigma_kms, center=LYMAN_REST):
+    sigma = sigma_kms / C_KMS
+    return np.exp(-0.5 * ((ln_rest - np.log(center)) / sigma) ** 2)
+
+
+def _break(ln_rest, sigma_kms=500.0, edge=LYMAN_REST):
+    # Flux redward of Lyman-alpha, none blueward (IGM absorption), smoothed
+    from scipy.special import erf
+
+    sigma = sigma_kms / C_KMS
+    return 0.5 * (1 + erf((ln_rest - np.log(edge)) / (np.sqrt(2) * sigma)))
+
+
+# Rest-frame templates as functions of ln(rest wavelength in microns). A
+# pair of functions is fitted with a free amplitude for each, so the line
+# strength relative to the break is not fixed
+TEMPLATES = {
+    'lya_line': lambda x: _gaussian(x, 500.0),
+    'lya_broad': lambda x: _gaussian(x, 2000.0),
+    'lyman_break': lambda x: _break(x),
+    'break_and_line': (_break, lambda x: _gaussian(x, 500.0)),
+}
+
+
+def noise_sigma(flux):
+    """Robust per-sample noise from the median absolute difference of neighbouring samples."""
+    if len(flux) < 3:
+        return float(np.std(flux)) or 1.0
+    sigma = 1.4826 * np.median(np.abs(np.diff(flux))) / np.sqrt(2)
+    return float(sigma) if sigma > 0 else (float(np.std(flux)) or 1.0)
+
+
+def spike_mask(flux, sigma, threshold=SPIKE_SIGMA):
+    """True for samples that stand out from both neighbours by more than threshold * sigma."""
+    flux = np.asarray(flux, dtype=float)
+    bad = np.zeros(len(flux), dtype=bool)
+    if len(flux) < 3:
+        return bad
+    inner = flux[1:-1]
+    up = inner - np.maximum(flux[:-2], flux[2:])
+    down = np.minimum(flux[:-2], flux[2:]) - inner
+    bad[1:-1] = (up > threshold * sigma) | (down > threshold * sigma)
+    return bad
+
+
+class Rebinner:
+    """
+    Linear map from the native samples of one spectrum to the ln(wavelength)
+    grid, with the inverse-variance weights of the grid pixels.
+
+    Pixels with several native samples get their mean, pixels between native
+    samples are interpolated; the weight is the number of native samples per
+    pixel over the noise variance, zero outside the spectrum and at rejected
+    spikes. Noise and spikes are taken from `flux`, so the same map can be
+    applied to Monte Carlo realizations of it (`apply` accepts a 2D array of
+    draws, one per row).
+    """
+
+    def __init__(self, wavelength, flux, ln_grid, step):
+        from scipy import sparse
+
+        wavelength = np.asarray(wavelength, dtype=float)
+        flux = np.asarray(flux, dtype=float)
+        order = np.argsort(wavelength, kind='stable')
+        self.sigma = noise_sigma(flux[order])
+        keep = ~spike_mask(flux[order], self.sigma) & (wavelength[order] > 0)
+        source = order[keep]
+        ln_wave = np.log(wavelength[source])
+        n_grid, n_native = len(ln_grid), len(wavelength)
+        self.weights = np.zeros(n_grid)
+        if len(ln_wave) < 2:
+            self.matrix = sparse.csr_matrix((n_grid, n_native))
+            return
+
+        index = np.rint((ln_wave - ln_grid[0]) / step).astype(np.int64)
+        inside = (index >= 0) & (index < n_grid)
+        counts = np.bincount(index[inside], minlength=n_grid).astype(float)
+        covered = (ln_grid >= ln_wave[0]) & (ln_grid <= ln_wave[-1])
+        binned = counts > 0
+
+        # Binned pixels: mean of their samples
+        rows = [index[inside]]
+        columns = [source[inside]]
+        values = [1.0 / counts[index[inside]]]
+        # Other covered pixels: linear interpolation between the two neighbouring samples
+        pixels = np.flatnonzero(covered & ~binned)
+        right = np.clip(np.searchsorted(ln_wave, ln_grid[pixels]), 1, len(ln_wave) - 1)
+        left = right - 1
+        fraction = (ln_grid[pixels] - ln_wave[left]) / (ln_wave[right] - ln_wave[left])
+        rows += [pixels, pixels]
+        columns += [source[left], source[right]]
+        values += [1 - fraction, fraction]
+        self.matrix = sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                                        shape=(n_grid, n_native))
+
+        # Native samples per pixel: exact where binned, from the local spacing elsewhere
+        spacing = np.interp(ln_grid, ln_wave[1:], np.diff(ln_wave))
+        density = np.where(binned, counts, np.minimum(step / np.maximum(spacing, 1e-12), 1.0))
+        self.weights[covered] = density[covered] / self.sigma ** 2
+
+    def apply(self, flux):
+        """Rebinned flux (1D) or draws (2D, one realization per row)."""
+        flux = np.asarray(flux, dtype=float)
+        if flux.ndim == 1:
+            return self.matrix @ flux
+        return (self.matrix @ flux.T).T
+
+
+def _rebin(wavelength, flux, ln_grid, step):
+    """Spectrum on the ln(wavelength) grid and its inverse-variance weights."""
+    rebinner = Rebinner(wavelength, flux, ln_grid, step)
+    return rebinner.apply(flux), rebinner.weights
+
+
+class RedshiftGrid:
+    """Common ln(wavelength) grid of a batch and the z grid the templates are shifted over."""
+
+    def __init__(self, wave_min, wave_max, z_min=None, z_max=None, step=LOG_STEP,
+                 lyman_rest=LYMAN_REST):
+        self.step = step
+        # Both grids sit on multiples of `step`, so a spectrum gets the same
+        # chi-square curve whichever batch it is fitted in
+        ln_start = np.floor(np.log(wave_min) / step) * step
+        n_obs = int(np.ceil((np.log(wave_max) - ln_start) / step)) + 1
+        self.ln_obs = ln_start + step * np.arange(n_obs)
+        # By default z covers Lyman-alpha anywhere inside the observed range;
+        # outside it every template gives the same chi-square
+        if z_min is None:
+            z_min = max(wave_min / lyman_rest - 1, 0.0)
+        if z_max is None:
+            z_max = wave_max / lyman_rest - 1
+        z_start = np.ceil(np.log1p(z_min) / step) * step
+        n_z = max(int(np.floor((np.log1p(z_max) - z_start) / step)) + 1, 1)
+        self.ln1pz = z_start + step * np.arange(n_z)
+        self.z = np.expm1(self.ln1pz)
+
+        # Template k lands on observed pixel j at z index i when k = j + (n_z - 1 - i)
+        n_template = n_obs + n_z - 1
+        self.ln_rest = self.ln_obs[0] - self.ln1pz[-1] + step * np.arange(n_template)
+        # j + q < n_template for every pixel j and z index, so this is long enough not to wrap
+        self.n_fft = fft.next_fast_len(n_template, real=True)
+
+    def correlate(self, spectra_fft_conj, template_fft):
+        """sum_j g[j] t[j + q] for every spectrum (given conj(rfft(g))), returned per z index."""
+        n_z = len(self.z)
+        corr = fft.irfft(spectra_fft_conj * template_fft, n=self.n_fft, axis=-1, workers=-1)[..., :n_z]
+        return corr[..., ::-1]
+
+
+def _chi2_curves(values, weights, grid, templates):
+    """
+    chi2[spectrum, template, z] of the best a * template + b fit (a >= 0).
+
+    `weights` is one row per spectrum, or a single row shared by all of them
+    (Monte Carlo draws), in which case the weight-only correlations and the
+    normal-equation determinant are computed once.
+    """
+    n_spectra = len(values)
+    weights = np.atleast_2d(weights)
+    s_ff = np.sum(weights * values ** 2, axis=1)[:, None]
+    s_f1 = np.sum(weights * values, axis=1)[:, None]
+    s_11 = np.sum(weights, axis=1)[:, None]
+    # Offset-only fit, used where the template does not constrain anything
+    chi2_offset = s_ff - s_f1 ** 2 / np.maximum(s_11, 1e-300)
+
+    wf_fft = np.conj(fft.rfft(weights * values, n=grid.n_fft, axis=-1, workers=-1))
+    w_fft = np.conj(fft.rfft(weights, n=grid.n_fft, axis=-1, workers=-1))
+    chi2 = np.empty((n_spectra, len(templates), len(grid.z)))
+    for t, components in enumerate(templates):
+        if len(components) == 2:
+            chi2[:, t, :] = _pair_chi2(grid, components, wf_fft, w_fft, s_f1, s_11, chi2_offset)
+            continue
+        template = components[0]
+        template_fft = fft.rfft(template, n=grid.n_fft)
+        s_ft = grid.correlate(wf_fft, template_fft)
+        s_t1 = grid.correlate(w_fft, template_fft)
+        s_tt = grid.correlate(w_fft, fft.rfft(template ** 2, n=grid.n_fft))
+
+        # Solve the 2x2 normal equations for (a, b) at every z
+        det = s_tt * s_11 - s_t1 ** 2
+        ok = det > 1e-9 * np.maximum(s_tt * s_11, 1e-300)
+        safe_det = np.where(ok, det, 1.0)
+        a = (s_ft * s_11 - s_f1 * s_t1) / safe_det
+        b = (s_f1 * s_tt - s_ft * s_t1) / safe_det
+        fitted = s_ff - a * s_ft - b * s_f1
+        chi2[:, t, :] = np.where(ok & (a > 0), fitted, chi2_offset)
+    return chi2
+
+
+def _pair_chi2(grid, components, wf_fft, w_fft, s_f1, s_11, chi2_offset):
+    """
+    chi2[spectrum, z] of the best a1 * c1 + a2 * c2 + b fit (a1, a2 > 0) of a
+    two-component template, e.g. a Lyman break and a line of free strength.
+    The offset b is eliminated first, which leaves 2x2 normal equations.
+    """
+    c1, c2 = components
+    fft1, fft2 = fft.rfft(c1, n=grid.n_fft), fft.rfft(c2, n=grid.n_fft)
+    inverse_11 = 1.0 / np.maximum(s_11, 1e-300)
+    s_f1c, s_f2c = grid.correlate(wf_fft, fft1), grid.correlate(wf_fft, fft2)
+    s_1, s_2 = grid.correlate(w_fft, fft1), grid.correlate(w_fft, fft2)
+    # Sums about the weighted mean (the offset-only fit)
+    f1 = s_f1c - s_f1 * s_1 * inverse_11
+    f2 = s_f2c - s_f1 * s_2 * inverse_11
+    v11 = grid.correlate(w_fft, fft.rfft(c1 ** 2, n=grid.n_fft)) - s_1 ** 2 * inverse_11
+    v22 = grid.correlate(w_fft, fft.rfft(c2 ** 2, n=grid.n_fft)) - s_2 ** 2 * inverse_11
+    v12 = grid.correlate(w_fft, fft.rfft(c1 * c2, n=grid.n_fft)) - s_1 * s_2 * inverse_11
+
+    det = v11 * v22 - v12 ** 2
+    ok = det > 1e-9 * np.maximum(v11 * v22, 1e-300)
+    safe_det = np.where(ok, det, 1.0)
+    a1 = (f1 * v22 - f2 * v12) / safe_det
+    a2 = (f2 * v11 - f1 * v12) / safe_det
+    return np.where(ok & (a1 > 0) & (a2 > 0), chi2_offset - a1 * f1 - a2 * f2, chi2_offset)
+
+
+def _refine(ln1pz, curves, best):
+    """Parabolic refinement of the minima at indices `best` of each row (in ln(1 + z))."""
+    rows = np.arange(len(curves))
+    inner = (best > 0) & (best < curves.shape[1] - 1)
+    left = curves[rows, np.maximum(best - 1, 0)]
+    mid = curves[rows, best]
+    right = curves[rows, np.minimum(best + 1, curves.shape[1] - 1)]
+    denom = left - 2 * mid + right
+    usable = inner & (denom > 0)
+    offset = np.divide(0.5 * (left - right), denom, out=np.zeros(len(curves)), where=usable)
+    return ln1pz[best] + offset * (ln1pz[1] - ln1pz[0] if len(ln1pz) > 1 else 0.0)
+
+
+def _summarize(chi2, weights, grid, names, keep_chi2):
+    """Best z, chi2_min, delta_chi2, confidence and template of each row of a chi2 batch."""
+    rows = np.arange(len(chi2))
+    best_template = np.argmin(chi2, axis=1)
+    curves = np.min(chi2, axis=1)
+    best = np.argmin(curves, axis=1)
+    chi2_min = curves[rows, best]
+
+    # Probability mass near the best z and the best alternative outside it
+    half_window = max(int(round(CONFIDENCE_WINDOW / grid.step)), 1)
+    near = np.abs(np.arange(curves.shape[1])[None, :] - best[:, None]) <= half_window
+    probability = np.exp(-0.5 * (curves - chi2_min[:, None]))
+    outside = np.min(np.where(near, np.inf, curves), axis=1)
+
+    fitted = np.any(np.atleast_2d(weights) > 0, axis=1)
+    summary = {
+        'z': np.where(fitted, np.expm1(_refine(grid.ln1pz, curves, best)), np.nan),
+        'chi2_min': np.where(fitted, chi2_min, np.nan),
+        'delta_chi2': np.where(fitted, outside - chi2_min, np.nan),
+        'confidence': np.where(fitted, np.sum(probability * near, axis=1) / np.sum(probability, axis=1), np.nan),
+        'template': np.where(fitted, np.array(names, dtype=object)[best_template[rows, best]], ''),
+    }
+    if keep_chi2:
+        summary['chi2'] = curves.astype(np.float32)
+    return summary
+
+
+def _template_arrays(templates, ln_rest):
+    """Component arrays of every template on `ln_rest` (a tuple of functions is a multi-component template)."""
+    arrays = []
+    for template in templates.values():
+        components = template if isinstance(template, tuple) else (template,)
+        arrays.append([np.asarray(component(ln_rest), dtype=float) for component in components])
+    return arrays
+
+
+def grid_for(spectra, z_min=None, z_max=None, step=LOG_STEP, lyman_rest=LYMAN_REST):
+    """RedshiftGrid covering the wavelength range of (wavelength, flux) spectra."""
+    wave_min = min(float(np.min(w)) for w, _ in spectra)
+    wave_max = max(float(np.max(w)) for w, _ in spectra)
+    return RedshiftGrid(wave_min, wave_max, z_min=z_min, z_max=z_max, step=step, lyman_rest=lyman_rest)
+
+
+def fit_redshifts(spectra, templates=None, z_min=None, z_max=None, step=LOG_STEP,
+                  batch_size=BATCH_SIZE, keep_chi2=True, lyman_rest=LYMAN_REST):
+    """
+    Fit the redshift of (wavelength, flux) spectra with template cross-correlation.
+
+    `templates` maps names to functions of ln(rest wavelength), or to pairs
+    of them fitted with one amplitude each (see TEMPLATES); all spectra
+    share one z grid from z_min to z_max (default: Lyman-alpha anywhere in
+    the wavelength range of the data). Returns a dict of arrays, one entry per spectrum:
+    'z', 'chi2_min', 'delta_chi2' (second best minimum outside the confidence
+    window minus the best), 'confidence', 'template' (name of the best
+    template), plus 'z_grid' and, with keep_chi2, 'chi2' (spectra x z, the
+    minimum over templates).
+    """
+    templates = TEMPLATES if templates is None else templates
+    names = list(templates)
+    if len(spectra) == 0:
+        result = {name: np.zeros(0) for name in ('z', 'chi2_min', 'delta_chi2', 'confidence', 'z_grid')}
+        result['template'] = np.zeros(0, dtype=object)
+        if keep_chi2:
+            result['chi2'] = np.zeros((0, 0))
+        return result
+
+    grid = grid_for(spectra, z_min=z_min, z_max=z_max, step=step, lyman_rest=lyman_rest)
+    template_arrays = _template_arrays(templates, grid.ln_rest)
+    parts = []
+    for start in range(0, len(spectra), batch_size):
+        rebinned = [_rebin(w, f, grid.ln_obs, step) for w, f in spectra[start:start + batch_size]]
+        values = np.array([v for v, _ in rebinned])
+        weights = np.array([w for _, w in rebinned])
+        chi2 = _chi2_curves(values, weights, grid, template_arrays)
+        parts.append(_summarize(chi2, weights, grid, names, keep_chi2))
+
+    result = {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+    result['z_grid'] = grid.z
+    return result
+
+
+def fit_redshift_draws(wavelength, flux, draws, grid, templates=None, batch_size=BATCH_SIZE):
+    """
+    Best-fit z of every row of `draws` (Monte Carlo realizations of `flux`).
+
+    The rebinning map, spike mask and weights come from the nominal `flux`,
+    so the draws are rebinned with one sparse product and fitted exactly
+    like the nominal spectrum on `grid` (see grid_for).
+    """
+    templates = TEMPLATES if templates is None else templates
+    names = list(templates)
+    template_arrays = _template_arrays(templates, grid.ln_rest)
+    rebinner = Rebinner(wavelength, flux, grid.ln_obs, grid.step)
+    z = np.full(len(draws), np.nan)
+    for start in range(0, len(draws), batch_size):
+        values = rebinner.apply(draws[start:start + batch_size])
+        chi2 = _chi2_curves(values, rebinner.weights, grid, template_arrays)
+        weights = np.broadcast_to(rebinner.weights, values.shape)
+        z[start:start + len(values)] = _summarize(chi2, weights, grid, names, False)['z']
+    return z
+
+
+def estimate_redshifts(records, **options):
+    """
+    Replace 'z_observed' of the analyzable ingest records with the template fit.
+
+    Each of those records also gets 'z_confidence' and 'z_template'. Records
+    are updated in place and returned.
+    """
+    analyzable = [r for r in records if not r['message'] and r['wavelength'] is not None]
+    if not analyzable:
+        return records
+    fit = fit_redshifts([(r['wavelength'], r['flux']) for r in analyzable], keep_chi2=False, **options)
+    for i, record in enumerate(analyzable):
+        if np.isfinite(fit['z'][i]):
+            record['z_observed'] = float(fit['z'][i])
+            record['z_confidence'] = float(fit['confidence'][i])
+            record['z_template'] = fit['template'][i]
+    return records
@@ -0,0 +1,329 @@
+"""
+Resampling of every spectrum onto one wavelength grid, and stacking.
+
+After the valid_mask filtering each spectrum is a ragged array with its own
+wavelengths and gaps, so any statistic across files used to be a Python
+loop. `resample` puts a whole set of spectra on a shared grid (observed or
+rest frame, uniform in ln(wavelength) by default) as a dense
+(n_spectra, n_pixels) float32 array plus a coverage mask, and the
+reductions on top of it (`coadd`, `pixel_statistics`) are single NumPy
+calls over that array.
+
+The rebinning is flux conserving: each native sample covers the pixel
+between the midpoints to its neighbours (so irregular grids are covered
+without holes), reaching at most MAX_HALF_WIDTH local sample spacings to
+either side (so runs of dropped samples and detector gaps stay uncovered),
+and an output pixel gets the integral of the native flux over it divided by
+the covered width. The integrals come from
+one cumulative sum over all spectra concatenated, evaluated at the output
+edges with a single searchsorted per batch: there is no loop over files.
+Output pixels with less than MIN_COVERAGE of their width covered are
+masked. Variances are propagated the same way (exact when native pixels
+fall entirely inside output pixels).
+
+Spectra are taken as flat values plus offsets, the layout of the columnar
+store (columnar.SpectraTable.arrays), or from ingest records.
+"""
+import warnings
+
+import numpy as np
+
+FRAMES = ('observed', 'rest')
+WEIGHTS = ('ivar', 'uniform')
+METHODS = ('mean', 'median')
+
+# Default number of pixels of the common grid
+N_PIXELS = 2000
+
+# Output pixels covered by less than this fraction of native pixels are masked
+MIN_COVERAGE = 0.5
+
+# Native pixels reach at most this many local sample spacings (the median of
+# the four spacings around a sample) to either side of the sample
+MAX_HALF_WIDTH = 1.0
+
+# Spectra resampled per batch (bounds the (batch, n_pixels + 1) work arrays)
+BATCH_SIZE = 512
+
+
+def add_resample_arguments(parser):
+    """Grid and stacking options of the stack command."""
+    parser.add_argument('--frame', choices=FRAMES, default='rest',
+                        help='Stack in the observed frame or the rest frame of each z_observed')
+    parser.add_argument('--pixels', type=int, default=N_PIXELS, help='Pixels of the common wavelength grid')
+    parser.add_argument('--linear', action='store_true',
+                        help='Grid uniform in wavelength (default: uniform in ln wavelength)')
+    parser.add_argument('--weights', choices=WEIGHTS, default='ivar',
+                        help='Inverse-variance or uniform weights in the mean stack')
+    parser.add_argument('--method', choices=METHODS, default='mean', help='Stack statistic per pixel')
+    parser.add_argument('--normalize', action='store_true',
+                        help='Divide each spectrum by its median before stacking')
+
+
+def ragged(arrays):
+    """(flat values, offsets) of a list of 1D arrays."""
+    lengths = np.array([len(a) for a in arrays], dtype=np.int64)
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    values = np.concatenate([np.asarray(a, dtype=float) for a in arrays]) if arrays else np.zeros(0)
+    return values, offsets
+
+
+def wavelength_grid(wave_min, wave_max, n_pixels=N_PIXELS, log=True):
+    """Edges (n_pixels + 1) of a grid from wave_min to wave_max, uniform in ln(wavelength) or wavelength."""
+    if log:
+        return np.exp(np.linspace(np.log(wave_min), np.log(wave_max), n_pixels + 1))
+    return np.linspace(wave_min, wave_max, n_pixels + 1)
+
+
+def _local_spacing(spacing, same):
+    """
+    Typical sample spacing around every sample: the median of the (up to
+    four) spacings of its two neighbours on each side within its spectrum,
+    so one wide spacing (a gap) does not set it. NaN for single-sample spectra.
+    """
+    n = len(spacing) + 1
+    own = np.concatenate([[0], np.cumsum(~same)])
+    padded = np.concatenate([[np.nan, np.nan], np.where(same, spacing, np.nan), [np.nan, np.nan]])
+    owner = np.concatenate([[-1, -1], own[:-1], [-1, -1]])
+    # Spacings i-2 .. i+1 surround sample i
+    window = np.lib.stride_tricks.sliding_window_view(padded, 4).copy()
+    window[np.lib.stride_tricks.sliding_window_view(owner, 4) != own[:, None]] = np.nan
+    # NaNs sort last: the median is the middle of the valid values of each row
+    window.sort(axis=1)
+    valid = np.sum(~np.isnan(window), axis=1)
+    rows = np.arange(n)
+    return 0.5 * (window[rows, np.maximum(valid - 1, 0) // 2] + window[rows, valid // 2])
+
+
+def _native_pixels(wavelength, offsets, max_half_width=MAX_HALF_WIDTH):
+    """
+    Spectrum id, left edge and width of every native sample (flat arrays sorted by spectrum,
+    then wavelength). Pixel edges are the midpoints between neighbouring samples; the first
+    and last sample of a spectrum extend half their one spacing outwards. No pixel reaches
+    more than `max_half_width` local spacings from its sample, so gaps are left uncovered.
+    """
+    n = len(offsets) - 1
+    sid = np.repeat(np.arange(n), np.diff(offsets))
+    spacing = np.diff(wavelength)
+    same = sid[1:] == sid[:-1]
+    half = spacing / 2
+    before = np.concatenate([[np.nan], np.where(same, half, np.nan)])
+    after = np.concatenate([np.where(same, half, np.nan), [np.nan]])
+    before = np.where(np.isnan(before), after, before)
+    after = np.where(np.isnan(after), before, after)
+    if len(wavelength):
+        reach = max_half_width * _local_spacing(spacing, same)
+        before = np.minimum(before, reach)
+        after = np.minimum(after, reach)
+    # Single-sample spectra cover nothing
+    before[np.isnan(before)] = 0.0
+    after[np.isnan(after)] = 0.0
+    return sid, wavelength - before, before + after
+
+
+class _Locator:
+    """
+    Where every output edge falls among the native pixels of its spectrum, so
+    the integral of any piecewise-constant density (one value per native
+    pixel) from the start of each spectrum up to each edge is a gather.
+    `keys` and `query` are positions on the end-to-end axis of the batch.
+    """
+
+    def __init__(self, query, sid_query, keys, sid, width, starts):
+        i = np.searchsorted(keys, query, side='right') - 1
+        self.inside = (i >= 0) & (sid[np.maximum(i, 0)] == sid_query)
+        self.i = np.maximum(i, 0)
+        self.base = starts[sid_query]
+        self.partial = np.clip(query - keys[self.i], 0.0, width[self.i])
+        self.width = width
+
+    def cumulative(self, density):
+        cum = np.concatenate([[0.0], np.cumsum(density * self.width)])
+        return np.where(self.inside, cum[self.i] - cum[self.base] + density[self.i] * self.partial, 0.0)
+
+
+class ResampledSpectra:
+    """
+    Spectra on a common grid: `flux` and `variance` are (n_spectra, n_pixels)
+    float32 arrays (NaN where masked), `mask` is True where a pixel holds
+    data, `coverage` the covered fraction of each pixel. `wavelength` are the
+    pixel centres (rest frame if frame == 'rest').
+    """
+
+    def __init__(self, edges, flux, variance, coverage, files=None, z=None, frame='observed'):
+        self.edges = edges
+        self.wavelength = 0.5 * (edges[1:] + edges[:-1])
+        self.flux = flux
+        self.variance = variance
+        self.coverage = coverage
+        self.mask = np.isfinite(flux)
+        self.files = files
+        self.z = z
+        self.frame = frame
+
+    def __len__(self):
+        return len(self.flux)
+
+    def normalized(self):
+        """Copy with each spectrum divided by its median over the masked pixels."""
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            scale = np.nanmedian(self.flux, axis=1, keepdims=True)
+        scale[~np.isfinite(scale) | (scale == 0)] = np.nan
+        return ResampledSpectra(self.edges, self.flux / scale, self.variance / scale ** 2, self.coverage,
+                                self.files, self.z, self.frame)
+
+
+def resample(wavelength, flux, offsets, edges, flux_error=None, z=None, frame='observed',
+             files=None, min_coverage=MIN_COVERAGE, batch_size=BATCH_SIZE):
+    """
+    Rebin ragged spectra (flat `wavelength` / `flux` values split by `offsets`)
+    onto the grid `edges` and return a ResampledSpectra.
+
+    With frame='rest' the wavelengths of spectrum i are divided by 1 + z[i]
+    first. `flux_error` (same layout) gives the variances; without it each
+    spectrum gets the constant robust noise estimate of redshift.noise_sigma.
+    """
+    if frame not in FRAMES:
+        raise ValueError(f"Unknown frame {frame!r} (choose from {', '.join(FRAMES)})")
+    wavelength = np.asarray(wavelength, dtype=float)
+    flux = np.asarray(flux, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n, n_pixels = len(offsets) - 1, len(edges) - 1
+    lengths = np.diff(offsets)
+    sid_all = np.repeat(np.arange(n), lengths)
+
+    if frame == 'rest':
+        if z is None:
+            raise ValueError("frame='rest' needs the z of every spectrum")
+        wavelength = wavelength / (1 + np.asarray(z, dtype=float))[sid_all]
+    if flux_error is None:
+        from redshift import noise_sigma
+
+        sigma = np.array([noise_sigma(flux[a:b]) for a, b in zip(offsets[:-1], offsets[1:])])
+        flux_error = sigma[sid_all] if n else np.zeros(0)
+    variance = np.asarray(flux_error, dtype=float) ** 2
+
+    # Sort the samples of every spectrum by wavelength (one lexsort for all of them, if any needs it)
+    if np.any((np.diff(wavelength) < 0) & (sid_all[1:] == sid_all[:-1])):
+        order = np.lexsort((wavelength, sid_all))
+        wavelength, flux, variance = wavelength[order], flux[order], variance[order]
+
+    out_flux = np.full((n, n_pixels), np.nan, dtype=np.float32)
+    out_variance = np.full((n, n_pixels), np.nan, dtype=np.float32)
+    out_coverage = np.zeros((n, n_pixels), dtype=np.float32)
+    bin_width = np.diff(edges)
+    # Spectra are laid end to end on one axis, `span` apart, so a single searchsorted serves all of them
+    span = 2 * max(float(np.max(wavelength)) if len(wavelength) else 1.0, float(edges[-1])) + 1.0
+
+    for start in range(0, n, batch_size):
+        stop = min(start + batch_size, n)
+        a, b = offsets[start], offsets[stop]
+        local_offsets = offsets[start:stop + 1] - a
+        sid, lo, width = _native_pixels(wavelength[a:b], local_offsets)
+        keys = sid * span + lo
+        starts = local_offsets[:-1]
+        sid_query = np.repeat(np.arange(stop - start), n_pixels + 1)
+        query = sid_query * span + np.tile(edges, stop - start)
+
+        locator = _Locator(query, sid_query, keys, sid, width, starts)
+
+        def integral(density):
+            return np.diff(locator.cumulative(density).reshape(stop - start, n_pixels + 1), axis=1)
+
+        covered = integral(np.ones(b - a))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            binned = integral(flux[a:b]) / covered
+            binned_variance = integral(variance[a:b] * width) / covered ** 2
+        coverage = covered / bin_width
+        good = coverage >= min_coverage
+        out_flux[start:stop] = np.where(good, binned, np.nan)
+        out_variance[start:stop] = np.where(good, binned_variance, np.nan)
+        out_coverage[start:stop] = coverage
+
+    return ResampledSpectra(edges, out_flux, out_variance, out_coverage, files=files,
+                            z=None if z is None else np.asarray(z, dtype=float), frame=frame)
+
+
+def resample_records(records, n_pixels=N_PIXELS, frame='observed', log=True, edges=None, **options):
+    """
+    Resample the analyzed ingest records (or columnar spectra dicts) onto a
+    common grid spanning all of them (or onto `edges`).
+    """
+    records = [r for r in records if r.get('flux') is not None]
+    wavelength, offsets = ragged([r['wavelength'] for r in records])
+    flux, _ = ragged([r['flux'] for r in records])
+    z = np.array([r['z_observed'] for r in records], dtype=float)
+    flux_error = None
+    if records and all(r.get('flux_error') is not None for r in records):
+        flux_error, _ = ragged([r['flux_error'] for r in records])
+    if edges is None:
+        edges = common_edges(wavelength, offsets, z if frame == 'rest' else None, n_pixels, log)
+    return resample(wavelength, flux, offsets, edges, flux_error=flux_error, z=z, frame=frame,
+                    files=[r['File'] for r in records], **options)
+
+
+def common_edges(wavelength, offsets, z=None, n_pixels=N_PIXELS, log=True):
+    """Grid edges spanning every spectrum (in the rest frame when `z` is given)."""
+    lengths = np.diff(offsets)
+    nonempty = lengths > 0
+    lo = np.minimum.reduceat(wavelength, offsets[:-1][nonempty]) if len(wavelength) else np.array([1.0])
+    hi = np.maximum.reduceat(wavelength, offsets[:-1][nonempty]) if len(wavelength) else np.array([2.0])
+    if z is not None:
+        scale = 1 + np.asarray(z, dtype=float)[nonempty]
+        lo, hi = lo / scale, hi / scale
+    return wavelength_grid(float(np.min(lo)), float(np.max(hi)), n_pixels, log)
+
+
+def coadd(spectra, weights='ivar', method='mean', normalize=False):
+    """
+    Stack a ResampledSpectra into one spectrum.
+
+    'mean' is the weighted mean per pixel (inverse-variance or uniform
+    weights) with its propagated error; 'median' is the per-pixel median
+    with the 1.2533 sigma / sqrt(n) error of a median. Returns a dict of
+    'wavelength', 'flux', 'error' and 'n_spectra' (spectra per pixel).
+    """
+    if weights not in WEIGHTS:
+        raise ValueError(f"Unknown weights {weights!r} (choose from {', '.join(WEIGHTS)})")
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method!r} (choose from {', '.join(METHODS)})")
+    if normalize:
+        spectra = spectra.normalized()
+    flux = spectra.flux.astype(float)
+    mask = np.isfinite(flux)
+    count = mask.sum(axis=0)
+
+    # All-NaN pixels give NaN (their warnings are silenced)
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if method == 'median':
+            stacked = np.nanmedian(flux, axis=0)
+            error = 1.2533 * np.nanstd(flux, axis=0) / np.sqrt(count)
+        elif weights == 'ivar':
+            w = np.where(mask & (spectra.variance > 0), 1.0 / spectra.variance, 0.0)
+            total = w.sum(axis=0)
+            stacked = np.nansum(w * np.where(mask, flux, 0.0), axis=0) / total
+            error = np.sqrt(1.0 / total)
+        else:
+            stacked = np.nanmean(flux, axis=0)
+            error = np.sqrt(np.nansum(spectra.variance, axis=0)) / count
+    empty = count == 0
+    stacked[empty] = np.nan
+    error[empty] = np.nan
+    return {'wavelength': spectra.wavelength, 'flux': stacked, 'error': error, 'n_spectra': count}
+
+
+def pixel_statistics(spectra, percentiles=(16, 50, 84)):
+    """Per-pixel count, mean, standard deviation and percentiles over all spectra."""
+    flux = spectra.flux.astype(float)
+    count = np.isfinite(flux).sum(axis=0)
+    stats = {'wavelength': spectra.wavelength, 'count': count}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        stats['mean'] = np.nanmean(flux, axis=0)
+        stats['std'] = np.nanstd(flux, axis=0)
+        for p, values in zip(percentiles, np.nanpercentile(flux, percentiles, axis=0)):
+            stats[f"p{p}"] = values
+    return stats
@@ -0,0 +1,159 @@
+"""
+Array-backed container of the results table.
+
+The scripts used to keep the results as a list of dicts and to rebuild a
+list per column for every mean, scatter plot and fit
+([r['z_observed'] for r in results]). `Results` holds the file names and one
+float64 NumPy column per field instead, preallocated and grown by doubling.
+`results['z_observed']` is a view of the filled part of a column (no copy),
+so statistics, trend fits and chart inputs read the columns directly.
+
+Row access (`results[i]`, iteration) returns a `ResultRow`, a two-slot view
+that reads and writes like the old dict rows, so code that handles one row
+at a time is unchanged.
+"""
+import numpy as np
+
+# Column order of jades_results_table.csv
+COLUMNS = ['File', 'z_observed', 'z_model', 'delta_z', 'Distance_Mpc', 'Tau_s',
+           'Age_ΛCDM_Gyr', 'Age_Model_Gyr']
+
+# Rows preallocated by an empty Results
+CAPACITY = 1024
+
+
+class ResultRow:
+    """One row of a Results table, accessed like a dict keyed by column name."""
+
+    __slots__ = ('_results', '_index')
+
+    def __init__(self, results, index):
+        self._results = results
+        self._index = index
+
+    def __getitem__(self, name):
+        return self._results[name][self._index]
+
+    def __setitem__(self, name, value):
+        self._results[name][self._index] = value
+
+    def __contains__(self, name):
+        return name == 'File' or name in self._results.names
+
+    def keys(self):
+        return ['File', *self._results.names]
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def as_dict(self):
+        return {name: self[name] for name in self.keys()}
+
+    def __repr__(self):
+        return f"ResultRow({self.as_dict()!r})"
+
+
+class Results:
+    """File names and float columns of the results table, grown in place."""
+
+    __slots__ = ('_files', '_columns', '_size')
+
+    def __init__(self, names=COLUMNS[1:], capacity=CAPACITY):
+        self._files = np.empty(capacity, dtype=object)
+        self._columns = {name: np.full(capacity, np.nan) for name in names}
+        self._size = 0
+
+    @classmethod
+    def from_columns(cls, files, columns):
+        """Results over `files` with the given {name: array} columns (float64 arrays are adopted, not copied)."""
+        results = cls(names=())
+        results._files = np.asarray(files, dtype=object)
+        results._size = len(results._files)
+        for name, values in columns.items():
+            results.add_column(name, values)
+        return results
+
+    @classmethod
+    def from_frame(cls, df):
+        """Results from a DataFrame with a File column and numeric columns (copied, not shared with `df`)."""
+        return cls.from_columns(df['File'].to_numpy(dtype=object, copy=True),
+                                {name: df[name].to_numpy(dtype=float, copy=True)
+                                 for name in df.columns if name != 'File'})
+
+    @classmethod
+    def from_records(cls, rows):
+        """Results from a list of dict rows (the columns of the first row)."""
+        names = [name for name in rows[0] if name != 'File'] if rows else COLUMNS[1:]
+        return cls.from_columns([r['File'] for r in rows],
+                                {name: np.array([r[name] for r in rows], dtype=float) for name in names})
+
+    @property
+    def names(self):
+        """Float column names, in table order."""
+        return list(self._columns)
+
+    def _reserve(self, size):
+        capacity = len(self._files)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, CAPACITY)
+        files = np.empty(capacity, dtype=object)
+        files[:self._size] = self._files[:self._size]
+        self._files = files
+        for name, column in self._columns.items():
+            grown = np.full(capacity, np.nan)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def append(self, file, values):
+        """Add one row; `values` maps column names to numbers (missing columns stay NaN)."""
+        self.extend([file], {name: [value] for name, value in values.items()})
+
+    def extend(self, files, columns):
+        """Add len(files) rows; `columns` maps column names to arrays of that length."""
+        start, end = self._size, self._size + len(files)
+        self._reserve(end)
+        self._files[start:end] = files
+        for name, values in columns.items():
+            if name not in self._columns:
+                self.add_column(name)
+            self._columns[name][start:end] = values
+        self._size = end
+
+    def add_column(self, name, values=None):
+        """Add a float column (NaN, or `values` for the current rows)."""
+        if values is not None and len(self._files) == self._size:
+            column = np.asarray(values, dtype=float)
+        else:
+            column = np.full(len(self._files), np.nan)
+            if values is not None:
+                column[:self._size] = values
+        self._columns[name] = column
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, key):
+        """A column view by name ('File' included), or a ResultRow by position."""
+        if isinstance(key, str):
+            if key == 'File':
+                return self._files[:self._size]
+            return self._columns[key][:self._size]
+        index = range(self._size)[key]
+        return ResultRow(self, index)
+
+    def __iter__(self):
+        return (ResultRow(self, i) for i in range(self._size))
+
+    def as_columns(self):
+        """{'File': ..., column: ...} views of the filled rows."""
+        return {'File': self['File'], **{name: self[name] for name in self._columns}}
+
+    def to_frame(self):
+        import pandas as pd
+
+        return pd.DataFrame(self.as_columns())
+
+    def nbytes(self):
+        """Bytes held by the columns (file name strings excluded)."""
+        return self._files.nbytes + sum(column.nbytes for column in self._columns.values())
@@ -0,0 +1,200 @@
+"""
+Sharded runs: split a data folder over several processes or machines and
+merge their partial results.
+
+`--shard I/N` makes jades_z14_analysis.py analyze only shard I of N (I from
+0). A file belongs to shard crc32(file name) % N, so the partition depends
+on the file names alone: every node computes the same split from its own
+listing, no coordinator is needed and adding files never moves existing
+ones to another shard.
+
+Each shard writes its rows to jades_results_table.shard-I-of-N.csv and a
+JSON summary next to it with the run parameters, the file counters and,
+for every numeric column, count / mean / M2 (sum of squared deviations) /
+min / max. `merge_shards` checks that all N summaries are there and were
+produced with the same parameters, concatenates the partial tables in file
+order into jades_results_table.csv (the table a single run writes) and
+combines the statistics with the parallel update of Chan et al., so the
+averages and standard deviations of the whole run come without reading any
+FITS file again. Standard deviations are population ones (divided by the
+count), the np.std the single-run summaries print.
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+
+RESULTS_FILE = 'jades_results_table.csv'
+
+# Options that must be equal in every shard of one run
+RUN_PARAMETERS = ('k', 'z_method', 's2d_window', 's2d_extract', 'mc_draws', 'mc_seed', 'kind', 'detector',
+                  'program', 'observation')
+
+# Columns printed by the merge summary
+SUMMARY_COLUMNS = ('z_observed', 'z_model', 'delta_z', 'Age_ΛCDM_Gyr', 'Age_Model_Gyr')
+
+_SHARD_NAME = re.compile(r'\.shard-(\d+)-of-(\d+)$')
+
+
+def shard_spec(text):
+    """argparse type of --shard: 'I/N' -> (I, N)."""
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N, got {text!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..N-1, got {text!r}")
+    return index, count
+
+
+def add_shard_arguments(parser):
+    parser.add_argument('--shard', type=shard_spec, metavar='I/N',
+                        help='Analyze only shard I of N of the files (0 <= I < N) and write partial results '
+                             'to merge with "jades_cli.py merge"')
+
+
+def shard_of(file, count):
+    """Shard (0..count-1) of a listed file name, stable across machines and runs."""
+    return zlib.crc32(file.encode('utf-8')) % count
+
+
+def shard_files(files, index, count):
+    """The files of `files` that belong to shard `index` of `count`, in input order."""
+    return [file for file in files if shard_of(file, count) == index]
+
+
+def shard_path(path, shard):
+    """'jades_results_table.csv' -> 'jades_results_table.shard-I-of-N.csv' (unchanged without a shard)."""
+    if shard is None:
+        return path
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.shard-{shard[0]}-of-{shard[1]}{ext}"
+
+
+def summary_path(csv_path):
+    return f"{os.path.splitext(csv_path)[0]}.json"
+
+
+def column_stats(values):
+    """count / mean / m2 / min / max of the finite values of one column."""
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return {'count': 0, 'mean': 0.0, 'm2': 0.0, 'min': None, 'max': None}
+    mean = float(values.mean())
+    return {'count': int(len(values)), 'mean': mean, 'm2': float(((values - mean) ** 2).sum()),
+            'min': float(values.min()), 'max': float(values.max())}
+
+
+def combine_stats(a, b):
+    """Statistics of the union of two disjoint sets from their column_stats (Chan et al.)."""
+    if b['count'] == 0:
+        return dict(a)
+    if a['count'] == 0:
+        return dict(b)
+    count = a['count'] + b['count']
+    delta = b['mean'] - a['mean']
+    return {'count': count,
+            'mean': a['mean'] + delta * b['count'] / count,
+            'm2': a['m2'] + b['m2'] + delta ** 2 * a['count'] * b['count'] / count,
+            'min': min(a['min'], b['min']), 'max': max(a['max'], b['max'])}
+
+
+def std(stats):
+    """Standard deviation from column_stats, as np.std (ddof=0; NaN without values)."""
+    return float(np.sqrt(stats['m2'] / stats['count'])) if stats['count'] > 0 else float('nan')
+
+
+def table_stats(df):
+    """{column: column_stats} of the numeric columns of a results DataFrame."""
+    from pandas.api.types import is_numeric_dtype
+
+    return {name: column_stats(df[name]) for name in df.columns if is_numeric_dtype(df[name])}
+
+
+def run_parameters(args):
+    """The RUN_PARAMETERS of parsed arguments (missing options are None)."""
+    return {name: getattr(args, name, None) for name in RUN_PARAMETERS}
+
+
+def write_shard_summary(csv_path, shard, rows, parameters, counters, errors=None):
+    """
+    Write the JSON summary of one shard's partial table (`rows` rows, none:
+    no table was written) and return its path.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(csv_path, float_precision='round_trip') if rows else pd.DataFrame()
+    summary = {'shard': list(shard), 'table': os.path.basename(csv_path), 'rows': len(df),
+               'parameters': parameters, 'counters': counters, 'errors': errors or {},
+               'stats': table_stats(df)}
+    path = summary_path(csv_path)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    return path
+
+
+def find_shard_summaries(output=RESULTS_FILE):
+    """{(index, count): summary path} of the shard summaries written for `output`."""
+    stem = os.path.splitext(output)[0]
+    found = {}
+    for path in glob.glob(glob.escape(stem) + '.shard-*-of-*.json'):
+        match = _SHARD_NAME.search(os.path.splitext(path)[0])
+        if match:
+            found[int(match.group(1)), int(match.group(2))] = path
+    return found
+
+
+def merge_shards(output=RESULTS_FILE):
+    """
+    Combine the partial tables and summaries of a sharded run into `output`.
+
+    Returns (merged DataFrame, combined {column: stats}, totals) where totals
+    holds the shard count and the summed file counters and error categories.
+    Raises ValueError when shards are missing or disagree on the run
+    parameters.
+    """
+    import pandas as pd
+
+    found = find_shard_summaries(output)
+    if not found:
+        raise ValueError(f"No shard summaries found for {output}")
+    counts = {count for _, count in found}
+    if len(counts) > 1:
+        raise ValueError(f"Summaries of runs with different shard counts: {sorted(counts)}")
+    count = counts.pop()
+    missing = [i for i in range(count) if (i, count) not in found]
+    if missing:
+        raise ValueError(f"Missing shards of {count}: {', '.join(str(i) for i in missing)}")
+
+    summaries = []
+    for index in range(count):
+        with open(found[index, count], encoding='utf-8') as f:
+            summaries.append(json.load(f))
+    for summary in summaries[1:]:
+        if summary['parameters'] != summaries[0]['parameters']:
+            raise ValueError(f"Shard {summary['shard'][0]} was run with different parameters: "
+                             f"{summary['parameters']} vs {summaries[0]['parameters']}")
+
+    # Rows in file order, as a single run over the whole folder writes them
+    directory = os.path.dirname(output)
+    tables = [pd.read_csv(os.path.join(directory, s['table']), float_precision='round_trip')
+              for s in summaries if s['rows']]
+    merged = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+    if len(merged):
+        merged = merged.sort_values('File', kind='stable', ignore_index=True)
+    merged.to_csv(output, index=False)
+
+    stats = {}
+    totals = {'shards': count, 'counters': {}, 'errors': {}}
+    for summary in summaries:
+        for name, column in summary['stats'].items():
+            stats[name] = combine_stats(stats[name], column) if name in stats else column
+        for key in ('counters', 'errors'):
+            for name, value in summary[key].items():
+                totals[key][name] = totals[key].get(name, 0) + value
+    return merged, stats, totals
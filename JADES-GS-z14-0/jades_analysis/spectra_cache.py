@@ -0,0 +1,181 @@
+"""
+Persistent cache of extracted spectra.
+
+Each entry holds the cleaned wavelength/flux (and flux error) arrays of one
+FITS file (after the valid_mask filtering), its z_observed, the `hdul.info()` listing and the
+message printed for files that could not be analyzed. Entries are plain
+uncompressed .npz files, keyed by a hash of the file path, size and mtime
+(or a hash of the file contents) plus the extraction parameters, so a warm
+rerun never opens a FITS file.
+
+The time delay model (k, distance, ages) is not part of the key: it is
+recomputed from the cached z_observed values with the cosmology tables,
+which is far cheaper than invalidating every spectrum when k changes.
+"""
+import hashlib
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from archives import split_member
+
+CACHE_DIR = os.path.join('cache', 'spectra')
+MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+
+# Bump when the record layout or extraction changes
+CACHE_VERSION = 3
+
+# Content digests remembered per process (with --cache-hash)
+DIGEST_MEMO = 256
+
+
+def _file_digest(full_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(full_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=DIGEST_MEMO)
+def _stat_digest(path, size, mtime_ns):
+    """
+    `_file_digest` of `path` as it was at (size, mtime): the read-ahead check
+    and the analysis of a file, and all members of a bundle, hash it once.
+    """
+    return _file_digest(path)
+
+
+class SpectraCache:
+    """Size-bounded on-disk cache of `ingest.process_file` records."""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, hash_content=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+
+    def key(self, full_path, params):
+        """
+        Cache key for `full_path` analyzed with `params` (None if the file is
+        gone). A bundle member is identified by its bundle and member name.
+        """
+        path, member = split_member(full_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if self.hash_content:
+            digest = _stat_digest(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+            identity = digest if member is None else f"{digest}|{member}"
+        else:
+            identity = f"{os.path.abspath(full_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        options = '|'.join(f"{name}={params[name]!r}" for name in sorted(params))
+        text = f"v{CACHE_VERSION}|{identity}|{options}"
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.npz')
+
+    def contains(self, key):
+        """True when an entry for `key` exists (without loading it)."""
+        return key is not None and os.path.exists(self._path(key))
+
+    def get(self, key):
+        """Return the cached record for `key`, or None on a miss."""
+        if key is None:
+            return None
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                record = {
+                    'File': str(entry['File']),
+                    'z_observed': None,
+                    'wavelength': None,
+                    'flux': None,
+                    'flux_error': None,
+                    'info': str(entry['info']) if entry['has_info'] else None,
+                    'message': str(entry['message']) if entry['has_message'] else None,
+                }
+                if entry['has_spectrum']:
+                    record['z_observed'] = float(entry['z_observed'])
+                    record['wavelength'] = entry['wavelength']
+                    record['flux'] = entry['flux']
+                    if entry['has_error']:
+                        record['flux_error'] = entry['flux_error']
+        except (OSError, KeyError, ValueError):
+            return None
+
+        # Mark the entry as recently used for the eviction order
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return record
+
+    def put(self, key, record):
+        """Store `record` under `key` (errors are ignored: the cache is optional)."""
+        if key is None:
+            return
+        path = self._path(key)
+        has_spectrum = record['z_observed'] is not None
+        has_error = has_spectrum and record.get('flux_error') is not None
+        empty = np.zeros(0)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f,
+                         File=record['File'],
+                         has_spectrum=has_spectrum,
+                         z_observed=record['z_observed'] if has_spectrum else np.nan,
+                         wavelength=record['wavelength'] if has_spectrum else empty,
+                         flux=record['flux'] if has_spectrum else empty,
+                         has_error=has_error,
+                         flux_error=record['flux_error'] if has_error else empty,
+                         has_info=record['info'] is not None,
+                         info=record['info'] or '',
+                         has_message=record['message'] is not None,
+                         message=record['message'] or '')
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write spectra cache entry for {record['File']}: {str(e)}")
+
+    def entries(self):
+        """(path, size, mtime) of every cache entry."""
+        found = []
+        if not os.path.isdir(self.cache_dir):
+            return found
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.npz'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((path, stat.st_size, stat.st_mtime))
+        return found
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in sorted(entries, key=lambda e: e[2]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
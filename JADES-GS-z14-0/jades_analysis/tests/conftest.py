@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# The analysis modules are flat scripts in the folder above
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def tables(tmp_path_factory):
+    """Default cosmology tables, built in a temporary cache folder."""
+    from cosmology_tables import get_tables
+
+    return get_tables(cache_dir=str(tmp_path_factory.mktemp('cosmology')))
@@ -0,0 +1,80 @@
+import gzip
+import io
+import os
+import tarfile
+import zipfile
+
+import numpy as np
+import pytest
+
+from archives import file_stat, fits_source, list_members, listing_name, read_member, split_member
+from ingest import find_fits_files, process_file
+
+
+def x1d_bytes(z=12.0):
+    """A minimal x1d product with one emission peak at Lyman-alpha redshifted to `z`."""
+    from astropy.io import fits
+
+    wavelength = np.linspace(0.8, 5.0, 400)
+    flux = 1.0 + 50.0 * np.exp(-0.5 * ((wavelength - 0.1216 * (1 + z)) / 0.01) ** 2)
+    table = fits.BinTableHDU.from_columns([fits.Column('WAVELENGTH', 'D', array=wavelength),
+                                           fits.Column('FLUX', 'D', array=flux)], name='EXTRACT1D')
+    data = io.BytesIO()
+    fits.HDUList([fits.PrimaryHDU(), table]).writeto(data)
+    return data.getvalue()
+
+
+MEMBERS = {'a_x1d.fits': x1d_bytes(12.0), 'sub/b_x1d.fits.gz': gzip.compress(x1d_bytes(20.0)),
+           'notes.txt': b'not a product'}
+
+
+def make_bundle(path):
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path, 'w') as bundle:
+            for name, data in MEMBERS.items():
+                bundle.writestr(name, data)
+        return
+    with tarfile.open(path, 'w:gz' if path.endswith('.tgz') else 'w') as bundle:
+        for name, data in MEMBERS.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            bundle.addfile(info, io.BytesIO(data))
+
+
+@pytest.mark.parametrize('name', ['bundle.tar', 'bundle.tgz', 'bundle.zip'])
+def test_members_read_like_files(tmp_path, name):
+    bundle = str(tmp_path / name)
+    make_bundle(bundle)
+    assert list_members(bundle) == ['a_x1d.fits', 'sub/b_x1d.fits.gz']
+
+    member = os.path.join(bundle, 'sub/b_x1d.fits.gz')
+    assert split_member(member) == (bundle.replace(os.sep, '/'), 'sub/b_x1d.fits.gz')
+    assert listing_name(member) == f"{name}/sub/b_x1d.fits.gz"
+    # Compressed members come back decompressed
+    assert read_member(member).getvalue() == x1d_bytes(20.0)
+    assert read_member(os.path.join(bundle, 'a_x1d.fits')).getvalue() == MEMBERS['a_x1d.fits']
+    assert file_stat(member).st_size == os.path.getsize(bundle)
+
+
+def test_plain_paths_are_left_alone(tmp_path):
+    path = str(tmp_path / 'c_x1d.fits')
+    assert split_member(path) == (path, None)
+    assert fits_source(path) == path
+    assert listing_name(path) == 'c_x1d.fits'
+
+
+def test_bundles_are_listed_and_analyzed(tmp_path):
+    make_bundle(str(tmp_path / 'one.tar'))
+    make_bundle(str(tmp_path / 'two.zip'))
+    (tmp_path / 'c_x1d.fits').write_bytes(x1d_bytes(15.0))
+    (tmp_path / 'broken.tar').write_bytes(b'not a tar file')
+
+    files = find_fits_files(str(tmp_path))
+    assert files == ['c_x1d.fits', 'one.tar/a_x1d.fits', 'one.tar/sub/b_x1d.fits.gz',
+                     'two.zip/a_x1d.fits', 'two.zip/sub/b_x1d.fits.gz']
+
+    records = [process_file(os.path.join(str(tmp_path), file)) for file in files]
+    # The same member of two bundles keeps two File keys
+    assert [r['File'] for r in records] == files
+    assert [r['message'] for r in records] == [None] * 5
+    np.testing.assert_allclose([r['z_observed'] for r in records], [15.0, 12.0, 20.0, 12.0, 20.0], atol=0.05)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from columnar import ColumnarStore, _ragged, read_results, read_spectra
+
+
+def records():
+    rng = np.random.default_rng(0)
+    out = []
+    for i, n in enumerate((5, 0, 12)):
+        wavelength = np.sort(rng.uniform(1.0, 5.0, n))
+        out.append({'File': f"f{i}_x1d.fits", 'z_observed': 10.0 + i, 'wavelength': wavelength,
+                    'flux': rng.normal(size=n), 'flux_error': None if i == 2 else np.ones(n)})
+    return out
+
+
+def test_ragged_offsets_are_64_bit():
+    import pyarrow as pa
+
+    array = _ragged([np.arange(3.0), None, np.arange(2.0)])
+    assert array.type == pa.large_list(pa.float64())
+    assert array.offsets.to_pylist() == [0, 3, 3, 5]
+    assert array.is_null().to_pylist() == [False, True, False]
+
+
+@pytest.mark.parametrize('fmt', ['arrow', 'parquet'])
+def test_store_round_trip(tmp_path, fmt):
+    rows = [{'File': r['File'], 'z_observed': r['z_observed'], 'z_model': r['z_observed'] - 0.05}
+            for r in records()]
+    with ColumnarStore(str(tmp_path), fmt) as store:
+        # Two chunks, as a streaming run writes them
+        store.write(rows[:2], records()[:2])
+        store.write(rows[2:], records()[2:])
+
+    df = read_results(str(tmp_path))
+    assert df['File'].tolist() == [r['File'] for r in rows]
+    np.testing.assert_array_equal(df['z_model'], [r['z_model'] for r in rows])
+
+    spectra = read_spectra(str(tmp_path))
+    assert len(spectra) == 3
+    for expected in records():
+        spectrum = spectra.spectrum(expected['File'])
+        assert spectrum['z_observed'] == expected['z_observed']
+        np.testing.assert_array_equal(spectrum['wavelength'], expected['wavelength'])
+        np.testing.assert_array_equal(spectrum['flux'], expected['flux'])
+        if expected['flux_error'] is None:
+            assert spectrum['flux_error'] is None
+        else:
+            np.testing.assert_array_equal(spectrum['flux_error'], expected['flux_error'])
+
+    values, offsets = spectra.arrays('flux')
+    np.testing.assert_array_equal(offsets, [0, 5, 5, 17])
+    np.testing.assert_array_equal(values, np.concatenate([r['flux'] for r in records()]))
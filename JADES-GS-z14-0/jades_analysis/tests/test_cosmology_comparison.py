@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from cosmology_tables import compare_cosmologies, cosmology_name, parse_cosmology, time_delay_model
+
+
+def test_parse_cosmology():
+    assert parse_cosmology('Planck18') is None
+    assert cosmology_name(parse_cosmology('WMAP9')) == 'WMAP9'
+    custom = parse_cosmology('H0=70, Om0=0.3')
+    assert (custom.H0.value, custom.Om0) == (70.0, 0.3)
+    for spec in ('Planck99', 'H0=70', 'H0=70,w0=-1'):
+        with pytest.raises(ValueError):
+            parse_cosmology(spec)
+
+
+def test_comparison_blocks(tmp_path, monkeypatch, tables):
+    import astropy.units as u
+
+    # Tables of the other cosmologies are built in a temporary cache
+    monkeypatch.chdir(tmp_path)
+    files, z = ['a', 'b', 'c'], np.array([10.0, 20.0, 30.0])
+    wmap9 = parse_cosmology('WMAP9')
+    columns = compare_cosmologies(files, z, [None, wmap9], k=0.05)
+    assert list(columns['Cosmology']) == ['Planck18'] * 3 + ['WMAP9'] * 3
+    assert list(columns['File']) == files * 2
+
+    model = time_delay_model(z, k=0.05, tables=tables)
+    for name, values in model.items():
+        np.testing.assert_allclose(columns[name][:3], values, rtol=1e-12)
+    np.testing.assert_allclose(columns['Age_ΛCDM_Gyr'][3:], wmap9.age(z).to_value(u.Gyr), rtol=1e-8)
@@ -0,0 +1,37 @@
+import numpy as np
+
+from cosmology_tables import K_DEFAULT, time_delay_model
+
+
+def test_tables_match_direct_integration(tables):
+    import astropy.units as u
+    from astropy.cosmology import Planck18
+
+    z = np.array([0.0, 0.01, 0.5, 1.0, 3.7, 12.0, 29.4, 42.6, 99.0])
+    np.testing.assert_allclose(tables.luminosity_distance_mpc(z),
+                               Planck18.luminosity_distance(z).to_value(u.Mpc), rtol=1e-8, atol=1e-9)
+    np.testing.assert_allclose(tables.age_gyr(z), Planck18.age(z).to_value(u.Gyr), rtol=1e-8)
+    assert tables.max_rel_error < 1e-8
+
+
+def test_outside_the_table_falls_back_to_astropy(tables):
+    import astropy.units as u
+    from astropy.cosmology import Planck18
+
+    z = np.array([150.0, 500.0])
+    np.testing.assert_allclose(tables.age_gyr(z), Planck18.age(z).to_value(u.Gyr), rtol=1e-10)
+
+
+def test_time_delay_model(tables):
+    z = np.array([10.0, 20.0, 30.0])
+    model = time_delay_model(z, tables=tables)
+    np.testing.assert_allclose(model['delta_z'], K_DEFAULT)
+    np.testing.assert_allclose(model['z_model'], z - K_DEFAULT)
+    np.testing.assert_allclose(model['Age_Model_Gyr'], tables.age_gyr(z - K_DEFAULT))
+
+    # A column of k values broadcasts against the redshifts
+    k = np.array([0.0, 0.1])[:, None]
+    grid = time_delay_model(z, k=k, tables=tables)
+    assert grid['z_model'].shape == (2, 3)
+    np.testing.assert_allclose(grid['z_model'][0], z)
+    assert grid['Distance_Mpc'].shape == (3,)
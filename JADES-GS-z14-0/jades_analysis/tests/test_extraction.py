@@ -0,0 +1,88 @@
+import numpy as np
+
+from extraction import collapsed_profile, extract_s2d_optimal, horne_extract, spatial_profile
+
+ROWS, COLUMNS = 21, 400
+FLUX = 100.0
+
+
+def trace(rows=ROWS, columns=COLUMNS, centre=10.0, sigma=1.5):
+    """Normalized Gaussian spatial profile of a straight trace, (rows, columns)."""
+    profile = np.exp(-0.5 * ((np.arange(rows) - centre) / sigma) ** 2)
+    return np.tile((profile / profile.sum())[:, None], (1, columns))
+
+
+def s2d_block(seed=0, flux=FLUX, noise=1.0):
+    rng = np.random.default_rng(seed)
+    sci = flux * trace() + rng.normal(0.0, noise, (ROWS, COLUMNS))
+    err = np.full((ROWS, COLUMNS), noise)
+    wavelength = np.tile(np.linspace(1.0, 5.0, COLUMNS), (ROWS, 1))
+    return sci, err, wavelength
+
+
+def test_flux_is_recovered_within_the_noise():
+    sci, err, wavelength = s2d_block()
+    wavelength_1d, flux, variance = horne_extract(sci, err, wavelength)
+    np.testing.assert_allclose(wavelength_1d, wavelength[0])
+    pull = (flux - FLUX) / np.sqrt(variance)
+    assert np.all(np.abs(pull) < 5)
+    # Noise in the wings of the zero-clipped profile biases the flux by about 1% at this S/N
+    assert abs(np.mean(flux) / FLUX - 1) < 0.02
+    # The variance estimate matches the scatter of the extracted flux
+    assert 0.8 < np.std(pull) < 1.2
+
+
+def test_variance_is_below_the_boxcar():
+    sci, err, wavelength = s2d_block()
+    _, flux, variance = horne_extract(sci, err, wavelength)
+    boxcar = sci.sum(axis=0)
+    boxcar_variance = np.sum(err ** 2, axis=0)
+    assert np.all(variance < boxcar_variance / 2)
+    assert np.std(flux) < np.std(boxcar) / 1.5
+
+
+def test_cosmic_ray_is_clipped():
+    sci, err, wavelength = s2d_block()
+    _, clean, _ = horne_extract(sci, err, wavelength)
+    sci[12, 200] += 1e4
+    _, flux, variance = horne_extract(sci, err, wavelength)
+    assert abs(flux[200] - FLUX) < 5 * np.sqrt(variance[200])
+    np.testing.assert_allclose(np.delete(flux, 200), np.delete(clean, 200), rtol=0.05)
+    # Without clipping the hit dominates its column
+    _, unclipped, _ = horne_extract(sci, err, wavelength, clip_sigma=np.inf)
+    assert unclipped[200] > FLUX + 1000
+
+
+def test_faint_columns_use_the_fallback_profile():
+    sci, err, wavelength = s2d_block()
+    # No trace in the second half of the columns
+    sci[:, COLUMNS // 2:] -= FLUX * trace()[:, COLUMNS // 2:]
+    mask = np.ones(sci.shape, dtype=bool)
+    fallback = np.zeros(ROWS)
+    fallback[3] = 1.0
+    profile = spatial_profile(sci, mask, err ** 2, fallback=fallback)
+    np.testing.assert_allclose(profile.sum(axis=0), 1.0)
+    faint = profile[:, 3 * COLUMNS // 4]
+    np.testing.assert_array_equal(faint, fallback)
+    assert np.argmax(profile[:, COLUMNS // 4]) == 10
+
+    # By default the fallback is the block collapsed along wavelength, which peaks on the trace
+    profile = spatial_profile(sci, mask, err ** 2)
+    collapsed = collapsed_profile(sci, mask)
+    np.testing.assert_allclose(profile[:, 3 * COLUMNS // 4], collapsed / collapsed.sum())
+    assert np.argmax(profile[:, 3 * COLUMNS // 4]) == 10
+
+
+def test_blocks_match_a_whole_image_extraction(tmp_path):
+    from astropy.io import fits
+
+    sci, err, wavelength = s2d_block()
+    path = str(tmp_path / 'a_s2d.fits')
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(sci, name='SCI'), fits.ImageHDU(err, name='ERR'),
+                  fits.ImageHDU(wavelength, name='WAVELENGTH')]).writeto(path)
+    with fits.open(path, memmap=True) as hdul:
+        whole = extract_s2d_optimal(hdul)
+        blocks = extract_s2d_optimal(hdul, block_columns=64)
+    for a, b in zip(blocks, whole):
+        np.testing.assert_allclose(a, b, rtol=1e-10)
+    np.testing.assert_allclose(whole[1], horne_extract(sci, err, wavelength)[1], rtol=1e-10)
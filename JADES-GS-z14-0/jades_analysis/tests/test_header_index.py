@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+
+import header_index
+from header_index import HeaderIndex
+
+
+def write_product(path, detector=None, kind='x1d'):
+    from astropy.io import fits
+
+    primary = fits.PrimaryHDU()
+    if detector:
+        primary.header['DETECTOR'] = detector.upper()
+    if kind == 'x1d':
+        data = fits.BinTableHDU.from_columns([fits.Column('WAVELENGTH', 'D', array=np.linspace(1, 5, 10)),
+                                              fits.Column('FLUX', 'D', array=np.ones(10))], name='EXTRACT1D')
+        hdus = [primary, data]
+    else:
+        image = np.ones((5, 10))
+        hdus = [primary, fits.ImageHDU(image, name='SCI'), fits.ImageHDU(image, name='ERR'),
+                fits.ImageHDU(image, name='WAVELENGTH')]
+    fits.HDUList(hdus).writeto(path)
+
+
+def test_update_and_select(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    write_product(data / 'jw01287001001_11101_00001_nrs1_x1d.fits')
+    write_product(data / 'jw01287002001_11101_00002_nrs2_s2d.fits', kind='s2d')
+    # No JWST name: the detector comes from the header, the kind from the extensions
+    write_product(data / 'other.fits', detector='nrs2')
+
+    with HeaderIndex(str(tmp_path / 'index.sqlite')) as index:
+        assert index.update(str(data)) == (3, 0, 0)
+        assert index.update(str(data)) == (0, 0, 3)
+        assert index.select(str(data), detector='NRS2') == ['jw01287002001_11101_00002_nrs2_s2d.fits',
+                                                            'other.fits']
+        assert index.select(str(data), kind='x1d') == ['jw01287001001_11101_00001_nrs1_x1d.fits', 'other.fits']
+        assert index.select(str(data), program='1287', observation='2') == [
+            'jw01287002001_11101_00002_nrs2_s2d.fits']
+        assert index.counts(str(data), 'kind') == {'s2d': 1, 'x1d': 2}
+        row = index.rows(str(data), kind='s2d')[0]
+        assert header_index.describe_extensions(row) == 'PRIMARY SCI[5x10] ERR[5x10] WAVELENGTH[5x10]'
+
+        # A changed file is read again, a deleted one dropped
+        path = data / 'other.fits'
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        os.remove(data / 'jw01287001001_11101_00001_nrs1_x1d.fits')
+        assert index.update(str(data)) == (1, 1, 1)
+
+
+def test_files_vanishing_during_an_update_are_removed(tmp_path, monkeypatch):
+    data = tmp_path / 'data'
+    data.mkdir()
+    for name in ('a_x1d.fits', 'b_x1d.fits', 'c_x1d.fits'):
+        write_product(data / name)
+
+    with HeaderIndex(str(tmp_path / 'index.sqlite')) as index:
+        index.update(str(data))
+        real_stat = header_index.file_stat
+
+        def file_stat(path):
+            if path.endswith('b_x1d.fits'):
+                raise FileNotFoundError(path)
+            return real_stat(path)
+
+        # b is listed but gone before its stat
+        monkeypatch.setattr(header_index, 'file_stat', file_stat)
+        assert index.update(str(data)) == (0, 1, 2)
+        assert index.select(str(data)) == ['a_x1d.fits', 'c_x1d.fits']
+
+        # c changed after the listing and is gone before its headers are read
+        path = data / 'c_x1d.fits'
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        calls = []
+
+        def vanishing(path):
+            if path.endswith('c_x1d.fits'):
+                calls.append(path)
+                if len(calls) > 1:
+                    raise FileNotFoundError(path)
+            return file_stat(path)
+
+        monkeypatch.setattr(header_index, 'file_stat', vanishing)
+        assert index.update(str(data)) == (0, 1, 1)
+        assert index.select(str(data)) == ['a_x1d.fits']
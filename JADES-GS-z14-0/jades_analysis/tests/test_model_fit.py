@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from cosmology_tables import time_delay_model
+from model_fit import K_COLUMNS, fit_k, k_grid, sweep_k
+
+Z_OBS = np.array([9.0, 14.3, 22.0, 31.5])
+
+
+def test_sweep_matches_the_model_per_k(tables):
+    k_values = np.array([0.0, 0.03, 0.1])
+    grid = sweep_k(Z_OBS, k_values, tables)
+    for i, k in enumerate(k_values):
+        model = time_delay_model(Z_OBS, k=k, tables=tables)
+        for name in K_COLUMNS:
+            np.testing.assert_allclose(grid[name][i], model[name], rtol=1e-12)
+    assert grid['Distance_Mpc'].shape == Z_OBS.shape
+
+
+def test_redshift_objective_recovers_k(tables):
+    data = {'z_observed': Z_OBS, 'reference': Z_OBS - 0.07}
+    grid, best = fit_k(data, k_values=k_grid(0.0, 0.2, 201), objective='redshift', tables=tables,
+                       reference_column='reference')
+    assert best['k'] == pytest.approx(0.07)
+    assert best['cost'] == pytest.approx(0.0, abs=1e-20)
+    assert not best['on_edge']
+    np.testing.assert_allclose(best['z_model'], data['reference'])
+
+
+def test_age_objective_and_edges(tables):
+    target = time_delay_model(Z_OBS, k=0.12, tables=tables)['Age_Model_Gyr']
+    _, best = fit_k({'z_observed': Z_OBS}, k_values=k_grid(0.0, 0.2, 41), objective='age', tables=tables,
+                    target_age=target)
+    assert best['k'] == pytest.approx(0.12)
+
+    _, best = fit_k({'z_observed': Z_OBS}, k_values=k_grid(0.0, 0.05, 11), objective='age', tables=tables,
+                    target_age=target)
+    assert best['on_edge'] and best['k'] == pytest.approx(0.05)
+    with pytest.raises(ValueError):
+        fit_k({'z_observed': Z_OBS}, objective='unknown', tables=tables)
@@ -0,0 +1,42 @@
+import numpy as np
+
+from pipeline import ChunkedCsvWriter, OverlayAccumulator
+from results import COLUMNS
+
+
+def rows(n):
+    return [{'File': f"f{i:03d}_x1d.fits", **{name: i + 0.1 * j for j, name in enumerate(COLUMNS[1:])}}
+            for i in range(n)]
+
+
+def test_chunked_csv_matches_a_single_write(tmp_path):
+    table = rows(10)
+    single = ChunkedCsvWriter(str(tmp_path / 'single.csv'))
+    single.write(table)
+    single.close()
+    chunked = ChunkedCsvWriter(str(tmp_path / 'chunked.csv'))
+    for start in range(0, len(table), 3):
+        chunked.write(table[start:start + 3])
+    chunked.close()
+
+    assert chunked.rows_written == 10
+    assert (tmp_path / 'chunked.csv').read_bytes() == (tmp_path / 'single.csv').read_bytes()
+
+
+def test_overlay_growth_keeps_earlier_counts():
+    rng = np.random.default_rng(4)
+    # The first spectrum sets the axis ranges; the others fall outside them on both sides
+    spectra = [(np.linspace(1.0, 2.0, 500), rng.normal(1.0, 0.1, 500)),
+               (np.linspace(0.5, 4.0, 700), rng.normal(3.0, 2.0, 700)),
+               (np.linspace(-3.0, 1.5, 300), rng.normal(-5.0, 0.5, 300))]
+    overlay = OverlayAccumulator(n_wavelength=64, n_flux=32)
+    for wavelength, flux in spectra:
+        overlay.add(wavelength, flux)
+
+    wavelength = np.concatenate([w for w, _ in spectra])
+    flux = np.concatenate([f for _, f in spectra])
+    # The image is what one histogram of every point over the final ranges gives
+    expected, _, _ = np.histogram2d(flux, wavelength, bins=overlay.counts.shape, range=overlay.ranges)
+    np.testing.assert_array_equal(overlay.counts, expected)
+    assert overlay.counts.sum() == len(flux) and overlay.n_spectra == 3
+    assert overlay.limits == [[flux.min(), flux.max()], [wavelength.min(), wavelength.max()]]
@@ -0,0 +1,60 @@
+import bz2
+import gzip
+import threading
+
+import pytest
+
+import prefetch
+from prefetch import fetch, read_ahead
+
+
+@pytest.mark.parametrize('suffix, compress', [('.gz', gzip.compress), ('.bz2', bz2.compress)])
+def test_fetch_decompresses(tmp_path, suffix, compress):
+    data = bytes(range(256)) * 100
+    path = tmp_path / f"a_x1d.fits{suffix}"
+    path.write_bytes(compress(data))
+    assert fetch(str(path)).getvalue() == data
+
+
+def test_fetch_leaves_plain_files_to_be_opened(tmp_path):
+    path = tmp_path / 'a_x1d.fits'
+    path.write_bytes(b'data')
+    assert fetch(str(path)) is None
+
+
+def test_read_ahead_order_skip_and_depth(monkeypatch):
+    paths = [f"{i:02d}_x1d.fits" for i in range(20)]
+    fetched = []
+    lock = threading.Lock()
+
+    def fake_fetch(path):
+        with lock:
+            fetched.append(path)
+        return f"source of {path}"
+
+    monkeypatch.setattr(prefetch, 'fetch', fake_fetch)
+    skip = lambda path: int(path[:2]) % 3 == 0
+    out = []
+    for path, source in read_ahead(paths, depth=2, skip=skip):
+        # Files are fetched at most `depth` ahead of the one handed over
+        with lock:
+            assert max(paths.index(p) for p in fetched) <= paths.index(path) + 2
+        out.append((path, source))
+
+    assert [path for path, _ in out] == paths
+    assert [source for _, source in out] == [None if skip(p) else f"source of {p}" for p in paths]
+    assert sorted(fetched) == [p for p in paths if not skip(p)]
+
+
+def test_failed_fetch_is_passed_through(monkeypatch):
+    def fake_fetch(path):
+        if path == 'b_x1d.fits.gz':
+            raise OSError('truncated file')
+        return path
+
+    monkeypatch.setattr(prefetch, 'fetch', fake_fetch)
+    paths = ['a_x1d.fits', 'b_x1d.fits.gz', 'c_x1d.fits']
+    # The consumer opens the path itself (and reports the error); later files are still read
+    assert list(read_ahead(paths, depth=2)) == [('a_x1d.fits', 'a_x1d.fits'), ('b_x1d.fits.gz', None),
+                                                ('c_x1d.fits', 'c_x1d.fits')]
+    assert list(read_ahead(paths, depth=0)) == [(path, None) for path in paths]
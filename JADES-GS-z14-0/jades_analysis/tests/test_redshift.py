@@ -0,0 +1,81 @@
+import os
+import sys
+
+import numpy as np
+
+from redshift import LYMAN_REST, TEMPLATES, estimate_redshifts, fit_redshifts, noise_sigma
+
+# benchmarks/synthetic.py, the generator of the benchmark spectra
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+Z_TRUE = (8.5, 11.2, 14.3, 20.0)
+
+
+def spectrum(z, rng, noise=0.05):
+    """Break and Lyman-alpha line at redshift `z` on a NIRSpec-like grid."""
+    wavelength = np.linspace(0.7, 5.3, 3000)
+    observed = LYMAN_REST * (1 + z)
+    flux = (wavelength > observed) * 1.0 + 3.0 * np.exp(-0.5 * ((wavelength - observed) / 0.004) ** 2)
+    return wavelength, flux + rng.normal(0.0, noise, len(wavelength))
+
+
+def test_injected_redshifts_are_recovered():
+    rng = np.random.default_rng(4)
+    spectra = [spectrum(z, rng) for z in Z_TRUE]
+    fit = fit_redshifts(spectra)
+    np.testing.assert_allclose((1 + fit['z']) / (1 + np.array(Z_TRUE)), 1.0, atol=1e-3)
+    assert fit['chi2'].shape == (len(Z_TRUE), len(fit['z_grid']))
+    assert np.all(fit['delta_chi2'] > 0)
+
+
+def test_break_and_line_amplitudes_are_free():
+    wavelength = np.linspace(0.7, 5.3, 3000)
+    spectra = []
+    for z, line in zip(Z_TRUE, (0.5, 2.0, 8.0, 30.0)):
+        x = np.log(wavelength / (1 + z))
+        spectra.append((wavelength, 0.2 + 1.5 * TEMPLATES['break_and_line'][0](x)
+                        + 1.5 * line * TEMPLATES['break_and_line'][1](x)))
+    fit = fit_redshifts(spectra)
+    assert list(fit['template']) == ['break_and_line'] * len(Z_TRUE)
+    np.testing.assert_allclose((1 + fit['z']) / (1 + np.array(Z_TRUE)), 1.0, atol=3e-4)
+
+
+def test_synthetic_benchmark_spectra_are_unbiased():
+    from synthetic import synthetic_spectrum
+
+    rng = np.random.default_rng(8)
+    spectra, z_true = [], []
+    for _ in range(100):
+        wavelength, flux, _, z = synthetic_spectrum(rng, 3000)
+        valid = np.isfinite(flux) & (flux != 0)
+        spectra.append((wavelength[valid], flux[valid]))
+        z_true.append(z)
+    offset = (1 + fit_redshifts(spectra, keep_chi2=False)['z']) / (1 + np.array(z_true)) - 1
+    # A few lines fall in the detector gap, where only the break is left
+    assert np.mean(np.abs(offset) < 2e-3) >= 0.95
+    # The line is narrower and stronger than the break in these spectra; with
+    # its own amplitude the fit is not pulled toward the break edge
+    assert abs(np.median(offset)) < 5e-4
+
+
+def test_batches_give_the_same_fit():
+    rng = np.random.default_rng(5)
+    spectra = [spectrum(z, rng) for z in Z_TRUE]
+    np.testing.assert_allclose(fit_redshifts(spectra, batch_size=1)['z'], fit_redshifts(spectra)['z'],
+                               rtol=1e-12)
+
+
+def test_estimate_redshifts_updates_analyzable_records():
+    rng = np.random.default_rng(6)
+    wavelength, flux = spectrum(12.0, rng)
+    records = [{'message': None, 'wavelength': wavelength, 'flux': flux, 'z_observed': 0.0},
+               {'message': 'File x: No valid data points found', 'wavelength': None, 'flux': None,
+                'z_observed': None}]
+    estimate_redshifts(records)
+    assert abs(records[0]['z_observed'] - 12.0) < 0.03
+    assert 'z_template' in records[0] and records[1]['z_observed'] is None
+
+
+def test_noise_sigma():
+    flux = np.random.default_rng(7).normal(0.0, 0.2, 100000)
+    assert abs(noise_sigma(flux) - 0.2) < 0.01
@@ -0,0 +1,61 @@
+import numpy as np
+
+from results import CAPACITY, COLUMNS, Results
+
+
+def rows(n):
+    return [{'File': f"f{i}_x1d.fits", **{name: float(i * 10 + j) for j, name in enumerate(COLUMNS[1:])}}
+            for i in range(n)]
+
+
+def test_records_round_trip():
+    records = rows(5)
+    results = Results.from_records(records)
+    assert len(results) == 5
+    assert [row.as_dict() for row in results] == records
+    assert results[-1]['File'] == 'f4_x1d.fits'
+    np.testing.assert_array_equal(results['z_model'], [r['z_model'] for r in records])
+    assert results.to_frame().to_dict('records') == records
+
+
+def test_frame_round_trip():
+    frame = Results.from_records(rows(4)).to_frame()
+    again = Results.from_frame(frame)
+    assert list(again.as_columns()) == COLUMNS
+    assert again.to_frame().equals(frame)
+    # The frame's columns are copied
+    frame.loc[0, 'z_model'] = -1.0
+    frame.loc[0, 'File'] = 'other.fits'
+    assert again[0]['z_model'] == 1.0 and again[0]['File'] == 'f0_x1d.fits'
+
+
+def test_columns_are_views():
+    results = Results.from_records(rows(3))
+    results['delta_z'][1] = -1.0
+    assert results[1]['delta_z'] == -1.0
+    results[2]['delta_z'] = -2.0
+    assert results['delta_z'][2] == -2.0
+
+
+def test_append_grows_past_capacity():
+    results = Results()
+    for record in rows(CAPACITY + 5):
+        results.append(record['File'], {name: value for name, value in record.items() if name != 'File'})
+    assert len(results) == CAPACITY + 5
+    assert results[CAPACITY + 4].as_dict() == rows(CAPACITY + 5)[-1]
+
+    # Missing values stay NaN, and unknown columns are added
+    results.extend(['extra'], {'z_observed': [1.0], 'z_observed_p16': [0.5]})
+    assert results[-1]['z_observed'] == 1.0 and np.isnan(results[-1]['z_model'])
+    assert np.isnan(results['z_observed_p16'][0]) and results['z_observed_p16'][-1] == 0.5
+
+
+def test_add_column_and_empty_tables():
+    results = Results.from_records(rows(2))
+    results.add_column('z_observed_p84', [1.0, 2.0])
+    assert 'z_observed_p84' in results[0] and results[1]['z_observed_p84'] == 2.0
+    assert results[0].get('missing', 'default') == 'default'
+
+    empty = Results()
+    assert not empty and len(empty.to_frame()) == 0
+    assert list(empty.to_frame().columns) == COLUMNS
@@ -0,0 +1,85 @@
+import argparse
+
+import numpy as np
+import pytest
+
+from sharding import (column_stats, combine_stats, merge_shards, shard_files, shard_path, shard_spec, std,
+                      write_shard_summary)
+
+
+def test_combined_stats_match_numpy():
+    values = np.random.default_rng(2).normal(3.0, 2.0, 1001)
+    for parts in ([values[:1], values[1:]], np.array_split(values, 7), [values[:0], values, values[:0]]):
+        stats = column_stats(parts[0])
+        for part in parts[1:]:
+            stats = combine_stats(stats, column_stats(part))
+        assert stats['count'] == len(values)
+        assert stats['mean'] == pytest.approx(np.mean(values), rel=1e-12)
+        assert std(stats) == pytest.approx(np.std(values), rel=1e-12)
+        assert (stats['min'], stats['max']) == (values.min(), values.max())
+
+
+def test_column_stats_ignore_non_finite():
+    stats = column_stats([1.0, np.nan, 3.0, np.inf])
+    assert (stats['count'], stats['mean']) == (2, 2.0)
+    assert np.isnan(std(column_stats([])))
+
+
+def test_shards_partition_the_files():
+    files = [f"jw{i:05d}_x1d.fits" for i in range(200)] + ['bundle.tar/jw00000_x1d.fits']
+    shards = [shard_files(files, i, 4) for i in range(4)]
+    assert sorted(sum(shards, [])) == sorted(files)
+    assert all(shards)
+    # The split depends on the names only, not on the listing order
+    assert shard_files(files[::-1], 1, 4) == shards[1][::-1]
+
+
+def test_shard_spec():
+    assert shard_spec('2/5') == (2, 5)
+    for text in ('5/5', '-1/3', '1', 'a/b', '0/0'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            shard_spec(text)
+    assert shard_path('out/table.csv', (1, 3)) == 'out/table.shard-1-of-3.csv'
+    assert shard_path('table.csv', None) == 'table.csv'
+
+
+def test_merge_reproduces_a_single_table(tmp_path):
+    import pandas as pd
+
+    rng = np.random.default_rng(3)
+    files = [f"f{i:03d}_x1d.fits" for i in range(50)]
+    full = pd.DataFrame({'File': files, 'z_observed': rng.uniform(10, 40, 50), 'z_model': rng.uniform(10, 40, 50)})
+    output = str(tmp_path / 'table.csv')
+    parameters = {'k': 0.05}
+    for index in range(3):
+        part = full[full['File'].isin(shard_files(files, index, 3))]
+        path = shard_path(output, (index, 3))
+        part.to_csv(path, index=False)
+        write_shard_summary(path, (index, 3), len(part), parameters, {'files': len(part)})
+
+    merged, stats, totals = merge_shards(output)
+    pd.testing.assert_frame_equal(merged, full)
+    pd.testing.assert_frame_equal(pd.read_csv(output, float_precision='round_trip'), full)
+    assert stats['z_observed']['mean'] == pytest.approx(full['z_observed'].mean(), rel=1e-12)
+    assert std(stats['z_model']) == pytest.approx(np.std(full['z_model']), rel=1e-12)
+    assert totals == {'shards': 3, 'counters': {'files': 50}, 'errors': {}}
+
+
+def test_merge_rejects_incomplete_or_mixed_runs(tmp_path):
+    import pandas as pd
+
+    output = str(tmp_path / 'table.csv')
+    with pytest.raises(ValueError, match='No shard summaries'):
+        merge_shards(output)
+    for index, k in ((0, 0.05), (2, 0.05)):
+        path = shard_path(output, (index, 3))
+        pd.DataFrame({'File': [f"f{index}"], 'z_observed': [1.0]}).to_csv(path, index=False)
+        write_shard_summary(path, (index, 3), 1, {'k': k}, {})
+    with pytest.raises(ValueError, match='Missing shards of 3: 1'):
+        merge_shards(output)
+
+    path = shard_path(output, (1, 3))
+    pd.DataFrame({'File': ['f1'], 'z_observed': [1.0]}).to_csv(path, index=False)
+    write_shard_summary(path, (1, 3), 1, {'k': 0.1}, {})
+    with pytest.raises(ValueError, match='different parameters'):
+        merge_shards(output)
@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+
+from spectra_cache import SpectraCache
+
+PARAMS = {'lyman_rest': 0.1216, 's2d_window': 0, 's2d_extract': 'row'}
+
+
+def record(file, with_error=True):
+    wavelength = np.linspace(1.0, 5.0, 50)
+    return {'File': file, 'z_observed': 12.5, 'wavelength': wavelength, 'flux': np.sin(wavelength),
+            'flux_error': np.full(50, 0.1) if with_error else None, 'info': None, 'message': None}
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'a_x1d.fits'
+    path.write_bytes(b'data')
+    cache = SpectraCache(str(tmp_path / 'cache'))
+    key = cache.key(str(path), PARAMS)
+    assert cache.get(key) is None
+
+    for with_error in (True, False):
+        stored = record('a_x1d.fits', with_error)
+        cache.put(key, stored)
+        loaded = cache.get(key)
+        assert loaded['File'] == 'a_x1d.fits' and loaded['z_observed'] == 12.5
+        np.testing.assert_array_equal(loaded['wavelength'], stored['wavelength'])
+        np.testing.assert_array_equal(loaded['flux'], stored['flux'])
+        assert (loaded['flux_error'] is None) == (not with_error)
+
+
+def test_failed_record_round_trip(tmp_path):
+    path = tmp_path / 'b_x1d.fits'
+    path.write_bytes(b'data')
+    cache = SpectraCache(str(tmp_path / 'cache'))
+    key = cache.key(str(path), PARAMS)
+    cache.put(key, {'File': 'b_x1d.fits', 'z_observed': None, 'wavelength': None, 'flux': None,
+                    'flux_error': None, 'info': None, 'message': 'File b_x1d.fits: No valid data points found'})
+    loaded = cache.get(key)
+    assert loaded['z_observed'] is None and loaded['flux'] is None
+    assert loaded['message'] == 'File b_x1d.fits: No valid data points found'
+
+
+def test_key_tracks_file_and_options(tmp_path):
+    path = tmp_path / 'a_x1d.fits'
+    path.write_bytes(b'data')
+    cache = SpectraCache(str(tmp_path / 'cache'))
+    key = cache.key(str(path), PARAMS)
+    assert cache.key(str(path), PARAMS) == key
+    assert cache.key(str(path), {**PARAMS, 's2d_window': 2}) != key
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache.key(str(path), PARAMS) != key
+    assert cache.key(str(tmp_path / 'missing.fits'), PARAMS) is None
+
+
+def test_content_key_ignores_mtime(tmp_path):
+    path = tmp_path / 'a_x1d.fits'
+    path.write_bytes(b'data')
+    cache = SpectraCache(str(tmp_path / 'cache'), hash_content=True)
+    key = cache.key(str(path), PARAMS)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache.key(str(path), PARAMS) == key
+    path.write_bytes(b'other')
+    assert cache.key(str(path), PARAMS) != key
+
+
+def test_contents_are_hashed_once_per_stat(tmp_path, monkeypatch):
+    import tarfile
+
+    import spectra_cache
+
+    calls = []
+    real_digest = spectra_cache._file_digest
+    monkeypatch.setattr(spectra_cache, '_file_digest', lambda path: calls.append(path) or real_digest(path))
+    bundle = tmp_path / 'bundle.tar'
+    with tarfile.open(bundle, 'w') as tar:
+        for name in ('a_x1d.fits', 'b_x1d.fits'):
+            (tmp_path / name).write_bytes(name.encode())
+            tar.add(tmp_path / name, arcname=name)
+    cache = SpectraCache(str(tmp_path / 'cache'), hash_content=True)
+
+    keys = [cache.key(str(bundle / name), PARAMS) for name in ('a_x1d.fits', 'b_x1d.fits', 'a_x1d.fits')]
+    assert keys[0] == keys[2] != keys[1]
+    assert calls == [str(bundle)]
+    stat = os.stat(bundle)
+    os.utime(bundle, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache.key(str(bundle / 'a_x1d.fits'), PARAMS) == keys[0]
+    assert len(calls) == 2
+
+
+def test_evict_drops_least_recently_used(tmp_path):
+    cache = SpectraCache(str(tmp_path / 'cache'))
+    keys = []
+    for i in range(3):
+        path = tmp_path / f"{i}_x1d.fits"
+        path.write_bytes(b'data')
+        keys.append(cache.key(str(path), PARAMS))
+        cache.put(keys[-1], record(path.name))
+    for age, (path, _, _) in zip((3, 1, 2), sorted(cache.entries())):
+        os.utime(path, (age, age))
+    oldest = min(cache.entries(), key=lambda e: e[2])[0]
+
+    cache.max_bytes = sum(size for _, size, _ in cache.entries()) - 1
+    assert cache.evict() == 1
+    assert not os.path.exists(oldest)
+    assert sum(cache.contains(key) for key in keys) == 2
@@ -0,0 +1,47 @@
+import numpy as np
+
+from uncertainty import MC_COLUMNS, flux_draws, mean_percentiles, monte_carlo, percentile_columns
+
+
+def record(file, z, noise=0.05):
+    rng = np.random.default_rng(len(file))
+    wavelength = np.linspace(0.7, 5.3, 2000)
+    flux = 1.0 + 5.0 * np.exp(-0.5 * ((wavelength - 0.1216 * (1 + z)) / 0.01) ** 2)
+    return {'File': file, 'message': None, 'wavelength': wavelength, 'flux': flux + rng.normal(0, noise, 2000),
+            'flux_error': np.full(2000, noise), 'z_observed': z}
+
+
+def test_flux_draws_follow_the_errors():
+    flux, error = np.linspace(1.0, 2.0, 50), np.linspace(0.1, 0.5, 50)
+    draws = flux_draws(flux, error, 20000, np.random.default_rng(0))
+    assert draws.shape == (20000, 50)
+    np.testing.assert_allclose(draws.mean(axis=0), flux, atol=0.02)
+    np.testing.assert_allclose(draws.std(axis=0), error, rtol=0.03)
+    # Missing or invalid errors fall back to the noise estimate of the flux
+    assert np.all(np.isfinite(flux_draws(flux, np.full(50, np.nan), 3, np.random.default_rng(0))))
+
+
+def test_draws_of_a_file_do_not_depend_on_the_others(tables):
+    a, b = record('a_x1d.fits', 12.0), record('b_x1d.fits', 18.0)
+    alone = monte_carlo([a], n_draws=50, seed=3, z_method='peak', tables=tables)
+    both = monte_carlo([b, a], n_draws=50, seed=3, z_method='peak', tables=tables)
+    assert both['File'] == ['b_x1d.fits', 'a_x1d.fits']
+    for name in MC_COLUMNS:
+        np.testing.assert_array_equal(both['draws'][name][1], alone['draws'][name][0])
+    other_seed = monte_carlo([a], n_draws=50, seed=4, z_method='peak', tables=tables)
+    assert not np.array_equal(other_seed['draws']['z_observed'], alone['draws']['z_observed'])
+
+
+def test_percentiles_bracket_the_injected_redshift(tables):
+    records = [record('a_x1d.fits', 12.0), record('b_x1d.fits', 18.0),
+               {'File': 'c_x1d.fits', 'message': 'File c_x1d.fits: No valid data points found',
+                'wavelength': None, 'flux': None}]
+    mc = monte_carlo(records, n_draws=200, seed=0, tables=tables)
+    assert mc['File'] == ['a_x1d.fits', 'b_x1d.fits']
+    columns = percentile_columns(mc)
+    assert len(columns) == 3 * len(MC_COLUMNS)
+    assert np.all(columns['z_observed_p16'] <= columns['z_observed_p84'])
+    np.testing.assert_allclose(columns['z_observed_p50'], [12.0, 18.0], rtol=5e-3)
+    np.testing.assert_allclose(columns['z_model_p50'], columns['z_observed_p50'] - 0.05, rtol=1e-9)
+    low, middle, high = mean_percentiles(mc, 'Age_Model_Gyr')
+    assert low <= middle <= high
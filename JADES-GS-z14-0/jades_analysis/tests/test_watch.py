@@ -0,0 +1,69 @@
+import os
+
+import pandas as pd
+import pytest
+
+from results import COLUMNS
+from watch import WatchedTable, state_path
+
+
+def row(file, z):
+    return {'File': file, **{name: z + i for i, name in enumerate(COLUMNS[1:])}}
+
+
+def stat_of(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def test_changes_wait_for_files_to_settle(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    for name in ('a_x1d.fits', 'b_x1d.fits'):
+        (data / name).write_bytes(b'data')
+    table = WatchedTable(str(tmp_path / 'table.csv'), {'k': 0.05})
+    now = os.stat(data / 'a_x1d.fits').st_mtime
+
+    ready, waiting, removed = table.changes(str(data), ['a_x1d.fits', 'b_x1d.fits'], settle=5, now=now + 1)
+    assert (ready, waiting, removed) == ([], ['a_x1d.fits', 'b_x1d.fits'], [])
+    ready, _, _ = table.changes(str(data), ['a_x1d.fits', 'b_x1d.fits', 'gone.fits'], settle=5, now=now + 10)
+    assert ready == ['a_x1d.fits', 'b_x1d.fits']
+
+    table.set_row('a_x1d.fits', stat_of(data / 'a_x1d.fits'), row('a_x1d.fits', 10.0))
+    table.set_row('b_x1d.fits', stat_of(data / 'b_x1d.fits'), None)
+    assert table.changes(str(data), ['a_x1d.fits', 'b_x1d.fits'], settle=5, now=now + 10) == ([], [], [])
+    assert table.changes(str(data), ['b_x1d.fits'], settle=5, now=now + 10) == ([], [], ['a_x1d.fits'])
+
+
+def test_rows_are_replaced_removed_and_resumed(tmp_path):
+    path = str(tmp_path / 'table.csv')
+    parameters = {'k': 0.05}
+    table = WatchedTable(path, parameters)
+    for file, z in (('b.tar/m_x1d.fits', 20.0), ('a_x1d.fits', 10.0), ('c.zip/m_x1d.fits', 30.0)):
+        table.set_row(file, (1, 1), row(file, z))
+    table.save()
+    table.set_row('a_x1d.fits', (1, 2), row('a_x1d.fits', 12.0))
+    table.remove('c.zip/m_x1d.fits')
+    table.save()
+
+    df = pd.read_csv(path, float_precision='round_trip')
+    assert df['File'].tolist() == ['a_x1d.fits', 'b.tar/m_x1d.fits']
+    assert df['z_observed'].tolist() == [12.0, 20.0]
+    assert table.summary.count == 2
+    assert table.summary.mean('z_observed') == pytest.approx(16.0)
+
+    # Appending new rows keeps the earlier ones
+    table.set_row('d_x1d.fits', (1, 1), row('d_x1d.fits', 40.0))
+    table.save()
+    assert len(pd.read_csv(path)) == 3
+
+    resumed = WatchedTable(path, parameters)
+    assert sorted(resumed.rows) == ['a_x1d.fits', 'b.tar/m_x1d.fits', 'd_x1d.fits']
+    assert resumed.seen == table.seen
+    assert resumed.summary.mean('z_observed') == pytest.approx(24.0)
+
+    # Other parameters, or a table that does not match the state, start over
+    assert WatchedTable(path, {'k': 0.1}).rows == {}
+    pd.DataFrame([row('x_x1d.fits', 1.0)]).to_csv(path, index=False)
+    assert WatchedTable(path, parameters).rows == {}
+    assert os.path.exists(state_path(path))
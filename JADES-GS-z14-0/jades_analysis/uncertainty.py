@@ -0,0 +1,113 @@
+"""
+Monte Carlo uncertainty propagation for z, distance, tau and ages.
+
+For every spectrum, N flux realizations are drawn at once as an
+(N x n_pix) array from the flux error of the file (the x1d FLUX_ERROR
+column or the s2d ERR extension; where it is missing, the robust noise
+estimate of redshift.py). All draws of a spectrum are rebinned with one
+sparse product and fitted in FFT batches (redshift.fit_redshift_draws), and
+the z of every draw of every file goes through the cosmology tables in a
+single time_delay_model call. The results are percentiles per file, e.g.
+Age_Model_Gyr_p16 / _p50 / _p84.
+"""
+import zlib
+
+import numpy as np
+
+from cosmology_tables import K_DEFAULT, get_tables, time_delay_model
+from ingest import LYMAN_REST
+
+PERCENTILES = (16, 50, 84)
+
+# Results table columns that get percentile columns (delta_z is the constant k)
+MC_COLUMNS = ['z_observed', 'z_model', 'Distance_Mpc', 'Tau_s', 'Age_ΛCDM_Gyr', 'Age_Model_Gyr']
+
+# Draws generated and fitted together (bounds the memory of one spectrum's draws)
+DRAW_BLOCK = 1024
+
+
+def add_uncertainty_arguments(parser):
+    """--mc-draws / --mc-seed options of the scripts that support the uncertainty mode."""
+    parser.add_argument('--mc-draws', type=int, default=0,
+                        help='Monte Carlo flux realizations per spectrum (0 = point estimates only)')
+    parser.add_argument('--mc-seed', type=int, default=0, help='Random seed of the Monte Carlo draws')
+
+
+def flux_draws(flux, flux_error, n_draws, rng):
+    """(n_draws, n_pix) realizations of `flux` with Gaussian noise of `flux_error`."""
+    from redshift import noise_sigma
+
+    flux = np.asarray(flux, dtype=float)
+    if flux_error is None:
+        error = np.full(len(flux), noise_sigma(flux))
+    else:
+        error = np.asarray(flux_error, dtype=float)
+        bad = ~np.isfinite(error) | (error <= 0)
+        if np.any(bad):
+            error = np.where(bad, noise_sigma(flux), error)
+    return flux + error * rng.standard_normal((n_draws, len(flux)))
+
+
+def draw_redshifts(record, n_draws, rng, grid=None, z_method='template', lyman_rest=LYMAN_REST):
+    """z of `n_draws` flux realizations of one ingest record."""
+    from redshift import fit_redshift_draws
+
+    wavelength, flux = record['wavelength'], record['flux']
+    z = np.empty(n_draws)
+    for start in range(0, n_draws, DRAW_BLOCK):
+        draws = flux_draws(flux, record.get('flux_error'), min(DRAW_BLOCK, n_draws - start), rng)
+        if z_method == 'template':
+            z[start:start + len(draws)] = fit_redshift_draws(wavelength, flux, draws, grid)
+        else:
+            z[start:start + len(draws)] = wavelength[np.argmax(draws, axis=1)] / lyman_rest - 1
+    return z
+
+
+def file_stream(seed, file):
+    """SeedSequence of one file's draws, from the run seed and the file name."""
+    return np.random.SeedSequence([seed, zlib.crc32(file.encode('utf-8'))])
+
+
+def monte_carlo(records, n_draws=1000, seed=0, z_method='template', k=K_DEFAULT, tables=None):
+    """
+    Propagate flux errors of the analyzable `records` through z and the time delay model.
+
+    Returns {'File': [...], 'draws': {column: (n_files, n_draws) array}} with
+    one entry per analyzable record, in input order. Each file gets its own
+    random stream derived from `seed` and its file name, so its draws do not
+    depend on the other files or their order (a sharded run draws the same
+    numbers as a single one).
+    """
+    from redshift import grid_for
+
+    records = [r for r in records if not r['message'] and r['wavelength'] is not None]
+    if tables is None:
+        tables = get_tables()
+    if not records:
+        return {'File': [], 'draws': {name: np.zeros((0, n_draws)) for name in MC_COLUMNS}}
+
+    grid = grid_for([(r['wavelength'], r['flux']) for r in records]) if z_method == 'template' else None
+    z_draws = np.array([draw_redshifts(r, n_draws, np.random.default_rng(file_stream(seed, r['File'])), grid,
+                                       z_method)
+                        for r in records])
+
+    # Cosmology for every draw of every file in one vectorized call
+    model = time_delay_model(z_draws.ravel(), k=k, tables=tables)
+    draws = {name: np.asarray(model[name]).reshape(z_draws.shape) for name in MC_COLUMNS}
+    return {'File': [r['File'] for r in records], 'draws': draws}
+
+
+def percentile_columns(mc, percentiles=PERCENTILES):
+    """{'<column>_p<q>': per-file percentile array} of a monte_carlo result."""
+    columns = {}
+    for name in MC_COLUMNS:
+        draws = mc['draws'][name]
+        values = np.nanpercentile(draws, percentiles, axis=1) if draws.size else np.zeros((len(percentiles), 0))
+        for q, row in zip(percentiles, values):
+            columns[f"{name}_p{q}"] = row
+    return columns
+
+
+def mean_percentiles(mc, name, percentiles=PERCENTILES):
+    """Percentiles over the draws of the mean of `name` across files."""
+    return np.nanpercentile(np.nanmean(mc['draws'][name], axis=0), percentiles)
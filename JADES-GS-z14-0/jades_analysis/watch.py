@@ -0,0 +1,246 @@
+"""
+Watch mode: keep the results table up to date while FITS files arrive.
+
+`python jades_cli.py watch` polls the data folder every --interval seconds.
+A new or modified file is analyzed once it has not changed for --settle
+seconds (so half-copied files are left alone), in batches of at most
+--batch-size files. Only those files are opened. Their rows are appended to
+jades_results_table.csv, or the table is rewritten when rows are replaced
+or removed. Deleted files drop their rows. The averages are kept as running
+sums. The four summary charts are refreshed once a batch has settled, i.e.
+when a poll finds nothing left to analyze, and unchanged charts are
+skipped.
+
+The size and mtime of every processed file, and the parameters of the run,
+are saved next to the table (jades_results_table.watch.json), so a watcher
+restarted with the same parameters resumes where it stopped. A run with
+other parameters starts over.
+"""
+import json
+import os
+import time
+
+from archives import file_stat
+from ingest import ingest_options, select_files
+from pipeline import RunningSummary, apply_cosmology, extract
+from results import COLUMNS
+from sharding import RESULTS_FILE, run_parameters
+
+# Seconds between two scans of the data folder
+INTERVAL = 2.0
+
+# Seconds a file must stay unchanged before it is analyzed
+SETTLE = 1.0
+
+# Files analyzed per batch, so the table is updated often while a backlog is worked off
+BATCH_SIZE = 100
+
+
+def add_watch_arguments(parser):
+    parser.add_argument('--output', default=RESULTS_FILE, help='Results table kept up to date')
+    parser.add_argument('--interval', type=float, default=INTERVAL, help='Seconds between scans of --data')
+    parser.add_argument('--settle', type=float, default=SETTLE,
+                        help='Seconds a file must stay unchanged before it is analyzed')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='Files analyzed before the table is updated')
+    parser.add_argument('--once', action='store_true',
+                        help='Analyze what is pending, refresh the charts and exit')
+    parser.add_argument('--no-plot', action='store_true', help='Do not refresh the summary charts')
+    parser.add_argument('--chart-workers', type=int, default=1,
+                        help='Worker processes used to render the charts (0 = all cores)')
+
+
+def state_path(output):
+    return f"{os.path.splitext(output)[0]}.watch.json"
+
+
+class WatchedTable:
+    """
+    The results table of a watched folder, with the stat of every file it
+    covers. `seen` and `rows` are keyed by the listing name, which is also
+    the File column ('bundle.tar/member.fits' for bundle members).
+    """
+
+    def __init__(self, path, parameters):
+        self.path = path
+        self.parameters = parameters
+        self.rows = {}
+        self.seen = {}
+        self.summary = RunningSummary()
+        # A table this watcher did not write is replaced on the first save
+        self._rewrite = True
+        self._appended = []
+        self.load()
+
+    def load(self):
+        """Resume from the saved state, if it was written with the same parameters."""
+        try:
+            with open(state_path(self.path), encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get('parameters') != self.parameters or not os.path.exists(self.path):
+            print(f"Parameters changed or {self.path} missing: every file will be analyzed again")
+            return
+        import pandas as pd
+
+        df = pd.read_csv(self.path, float_precision='round_trip')
+        rows = {r['File']: r for r in df[COLUMNS].to_dict('records')}
+        seen = {file: tuple(stat) for file, stat in state['files'].items()}
+        if not set(rows) <= set(seen):
+            print(f"{self.path} does not match the saved state: every file will be analyzed again")
+            return
+        self.rows, self.seen = rows, seen
+        self.summary.update(list(self.rows.values()))
+        self._rewrite = False
+
+    def changes(self, folder_path, files, settle=SETTLE, now=None):
+        """
+        (ready, waiting, removed): files new or changed since they were
+        processed and unchanged for `settle` seconds, the ones still
+        changing, and processed files that are gone.
+        """
+        now = time.time() if now is None else now
+        ready, waiting = [], []
+        for file in files:
+            try:
+                stat = file_stat(os.path.join(folder_path, file))
+            except OSError:
+                continue
+            if self.seen.get(file) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            (ready if now - stat.st_mtime >= settle else waiting).append(file)
+        current = set(files)
+        removed = [file for file in self.seen if file not in current]
+        return ready, waiting, removed
+
+    def remove(self, file):
+        self.seen.pop(file, None)
+        row = self.rows.pop(file, None)
+        if row is not None:
+            self.summary.remove([row])
+            self._rewrite = True
+
+    def set_row(self, file, stat, row):
+        """Record the new result of `file` (row None: it could not be analyzed)."""
+        old = self.rows.pop(file, None)
+        if old is not None:
+            self.summary.remove([old])
+            self._rewrite = True
+        self.seen[file] = stat
+        if row is not None:
+            self.rows[row['File']] = row
+            self.summary.update([row])
+            self._appended.append(row)
+
+    def save(self):
+        """Append the new rows to the CSV (rewrite it if rows changed) and save the state."""
+        import pandas as pd
+
+        if self._rewrite or not os.path.exists(self.path):
+            rows = [self.rows[file] for file in sorted(self.rows)]
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            pd.DataFrame(rows, columns=COLUMNS).to_csv(tmp_path, index=False)
+            os.replace(tmp_path, self.path)
+        elif self._appended:
+            with open(self.path, 'a', newline='', encoding='utf-8') as f:
+                pd.DataFrame(self._appended, columns=COLUMNS).to_csv(f, header=False, index=False)
+        self._rewrite = False
+        self._appended = []
+
+        tmp_path = f"{state_path(self.path)}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'parameters': self.parameters, 'files': self.seen}, f)
+        os.replace(tmp_path, state_path(self.path))
+
+
+def analyze_batch(args, table, files, metrics=None):
+    """Analyze `files` of --data and fold their results into `table`; returns the number of rows."""
+    # The stat is taken before the file is read: a file still changing is analyzed again next time
+    stats = {}
+    for file in files:
+        try:
+            stat = file_stat(os.path.join(args.data, file))
+        except OSError:
+            continue
+        stats[file] = (stat.st_size, stat.st_mtime_ns)
+    files = list(stats)
+
+    options = ingest_options(args)
+    z_method = options.pop('z_method')
+    messages = []
+    rows = {}
+    records = extract(args.data, files, **options)
+    for _, chunk_rows in apply_cosmology(records, chunk_size=len(files), k=args.k, z_method=z_method,
+                                         metrics=metrics, report=messages.append):
+        rows.update((r['File'], r) for r in chunk_rows)
+
+    for message in messages:
+        print(message)
+    for file in files:
+        r = rows.get(file)
+        table.set_row(file, stats[file], r)
+        if r is not None:
+            print(f"File {file}: z_obs={r['z_observed']:.2f}, z_model={r['z_model']:.2f}, "
+                  f"delta_z={r['delta_z']:.2f}")
+    return len(rows)
+
+
+def refresh_charts(args, table):
+    """Redraw the summary charts from the current table (unchanged charts are skipped)."""
+    from charts import render_charts, summary_chart_jobs
+    from generate_charts_from_fits import load_sample
+    from results import Results
+
+    if not table.rows:
+        return
+    results = Results.from_records([table.rows[file] for file in sorted(table.rows)])
+    sample = load_sample(table.path, results[0], args)
+    os.makedirs('images', exist_ok=True)
+    rendered, _ = render_charts(summary_chart_jobs(results, sample), workers=args.chart_workers)
+    if rendered:
+        print(f"Charts refreshed: {', '.join(rendered)}")
+
+
+def watch(args, metrics=None):
+    """Poll --data and keep --output up to date until interrupted (or once with --once)."""
+    from charts import use_headless_backend
+
+    if not args.no_plot:
+        use_headless_backend()
+    table = WatchedTable(args.output, run_parameters(args))
+    print(f"Watching {args.data}/ ({len(table.rows)} rows in {args.output}); press Ctrl-C to stop")
+    charts_stale = not args.no_plot
+    try:
+        while True:
+            ready, waiting, removed = table.changes(args.data, select_files(args), settle=args.settle)
+            for file in removed:
+                print(f"File {file}: removed")
+                table.remove(file)
+
+            if ready:
+                batch = ready[:args.batch_size]
+                start = time.perf_counter()
+                analyze_batch(args, table, batch, metrics)
+                table.save()
+                arrival = min((table.seen[f][1] for f in batch if f in table.seen), default=time.time_ns()) / 1e9
+                print(f"Batch of {len(batch)} files in {time.perf_counter() - start:.2f} s "
+                      f"(at most {time.time() - arrival:.1f} s from arrival to table); "
+                      f"{table.summary.count} rows, average z_observed = {table.summary.mean('z_observed'):.2f}, "
+                      f"average model age = {table.summary.mean('Age_Model_Gyr'):.3f} Gyr")
+                charts_stale = not args.no_plot
+                continue
+            if removed:
+                table.save()
+                charts_stale = not args.no_plot
+
+            # Nothing left to analyze: the batch has settled
+            if charts_stale and not waiting:
+                refresh_charts(args, table)
+                charts_stale = False
+            if args.once and not waiting:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        table.save()
+        print(f"\nStopped watching; {table.summary.count} rows in {args.output}")